@@ -1,72 +0,0 @@
-import cv2
-import numpy
-import math
-from enum import Enum
-
-class GripPipeline:
-    """
-    An OpenCV pipeline generated by GRIP.
-    """
-    
-    def __init__(self):
-        """initializes all values to presets or None if need to be set
-        """
-
-        self.__hsv_threshold_hue = [43.70503597122302, 86.79117147707979]
-        self.__hsv_threshold_saturation = [139.88309352517985, 255.0]
-        self.__hsv_threshold_value = [96.31294964028778, 255.0]
-
-        self.hsv_threshold_output = None
-
-        self.__find_contours_input = self.hsv_threshold_output
-        self.__find_contours_external_only = False
-
-        self.find_contours_output = None
-
-
-    def process(self, source0):
-        """
-        Runs the pipeline and sets all outputs to new values.
-        """
-        # Step HSV_Threshold0:
-        self.__hsv_threshold_input = source0
-        (self.hsv_threshold_output) = self.__hsv_threshold(self.__hsv_threshold_input, self.__hsv_threshold_hue, self.__hsv_threshold_saturation, self.__hsv_threshold_value)
-
-        # Step Find_Contours0:
-        self.__find_contours_input = self.hsv_threshold_output
-        (self.find_contours_output) = self.__find_contours(self.__find_contours_input, self.__find_contours_external_only)
-
-
-    @staticmethod
-    def __hsv_threshold(input, hue, sat, val):
-        """Segment an image based on hue, saturation, and value ranges.
-        Args:
-            input: A BGR numpy.ndarray.
-            hue: A list of two numbers the are the min and max hue.
-            sat: A list of two numbers the are the min and max saturation.
-            lum: A list of two numbers the are the min and max value.
-        Returns:
-            A black and white numpy.ndarray.
-        """
-        out = cv2.cvtColor(input, cv2.COLOR_BGR2HSV)
-        return cv2.inRange(out, (hue[0], sat[0], val[0]),  (hue[1], sat[1], val[1]))
-
-    @staticmethod
-    def __find_contours(input, external_only):
-        """Sets the values of pixels in a binary image to their distance to the nearest black pixel.
-        Args:
-            input: A numpy.ndarray.
-            external_only: A boolean. If true only external contours are found.
-        Return:
-            A list of numpy.ndarray where each one represents a contour.
-        """
-        if(external_only):
-            mode = cv2.RETR_EXTERNAL
-        else:
-            mode = cv2.RETR_LIST
-        method = cv2.CHAIN_APPROX_SIMPLE
-        im2, contours, hierarchy =cv2.findContours(input, mode=mode, method=method)
-        return contours
-
-
-
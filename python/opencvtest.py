@@ -152,7 +152,7 @@ while iteration < 542:
         if testingMode is True:
             cv2.imshow("threshed image plus markup", threshed_img)
 
-        endTime = startTime = int((time.time() * 1000))
+        endTime = int((time.time() * 1000))
         delta_time = endTime - startTime
         print("Delta time: %s" % delta_time)
 
@@ -1,8 +1,9 @@
 import cv2 as cv2
 import numpy as np
-from scipy.spatial import distance as dist
 import math
+import os
 from enum import Enum
+from contour_features import ContourFeatures, normalize_rect_angles, quadrant_corners
 # import random 
 
 try:
@@ -16,17 +17,65 @@ class DIRECTION(Enum):
 
 literallyAnInt = 0
 
+# how far apart the centers of the two tapes of a target are, over the
+# length of one tape (about 11.3 in / 5.5 in, see pose.targetModel)
+TAPE_SPACING_RATIO = 2.06
+
+# the ways decideVisionPairs can rank the targets it finds, best first
+PAIR_RANKINGS = {
+    "area": lambda target, horizontalRes: -target.get_area(),
+    "offset": lambda target, horizontalRes: abs(target.get_center_offset(horizontalRes)),
+    "score": lambda target, horizontalRes: -target.score,
+}
+
+# the settings GripPipeline.get_config and set_config know about
+CONFIG_KEYS = [
+    "hue", "saturation", "value", "external_only",
+    "min_area", "min_perimeter", "min_width", "max_width", "min_height", "max_height",
+    "solidity", "max_vertices", "min_vertices", "min_ratio", "max_ratio",
+]
+
 class VisionTape:
-    def __init__(self, image, imageCornerLoc, contour):
+    # tapes get made for every contour in every frame, so keep them small.
+    # Everything derived from the contour is worked out the first time
+    # it's asked for and kept, the tape only lives for one frame anyway
+    __slots__ = ("image", "imageCorner", "minAreaRect", "contour", "area", "center",
+                 "corners", "cornerPoints", "refinedCorners", "harrisCorners", "direction")
+
+    def __init__(self, image, imageCornerLoc, contour, area=None, minAreaRect=None):
+        """
+        A single strip of tape
+
+        Args:
+            image: the crop of the frame around this tape, usually a read
+                only view of the frame (see writable_image)
+            imageCornerLoc: the top left of the crop in the frame
+            contour: the contour of this tape
+            area: the contour area, if it was already computed
+            minAreaRect: the normalized min area rect, if it was already computed
+        """
         self.image = image
         self.imageCorner = imageCornerLoc
         self.minAreaRect = None
         self.contour = contour
+        self.area = area
         self.center = None
         self.corners = None
+        self.cornerPoints = None
+        self.refinedCorners = None
         self.harrisCorners = None
         self.direction = None
 
+        if minAreaRect is not None:
+            self.set_min_area_rect(minAreaRect)
+
+    def writable_image(self):
+        """
+        Get a copy of the crop around this tape that is safe to draw on,
+        since the crop itself is a read only view of the frame
+        """
+        return self.image.copy()
+
     def get_center(self):
         """
         Get the centroid of the minimum area rectangle
@@ -38,21 +87,19 @@ class VisionTape:
 
         if(self.minAreaRect is None):
             self.determine_direction(self.contour)
-        
-        # print("center pos:")
-        # print(self.minAreaRect[0])
 
-        return self.minAreaRect[0]
+        return self.center
 
     def get_area(self):
-        contour = self.contour
-        return cv2.contourArea(contour)
+        if self.area is None:
+            self.area = cv2.contourArea(self.contour)
+        return self.area
 
     def get_x_center_coordinate(self):
         if(self.minAreaRect is None):
             self.determine_direction(self.contour)
-        
-        return self.get_center()[0]
+
+        return self.center[0]
 
     def get_angle(self):
         """
@@ -80,25 +127,24 @@ class VisionTape:
 
     def determine_direction(self, contour):
 
-        minRect = cv2.minAreaRect(contour)
+        (cx, cy), (w, h), angle = cv2.minAreaRect(contour)
+        rect = normalize_rect_angles(np.array([[cx, cy, w, h, angle]]))[0]
 
-        while(minRect[2] < -45):
-            dims = minRect[1]
-            dims = [dims[1], dims[0]]
-            minRect = (minRect[0], dims, minRect[2] + 90)
-        while(minRect[2] > 45):
-            dims = minRect[1]
-            dims = [dims[1], dims[0]]
-            minRect = (minRect[0], dims, minRect[2] - 90)
+        return self.set_min_area_rect(((rect[0], rect[1]), [rect[2], rect[3]], rect[4]))
 
+    def set_min_area_rect(self, minRect):
+        """
+        Set the min area rect (already rotated to within +-45 degrees)
+        and the center and direction that go with it
+        """
         self.minAreaRect = minRect
+        self.center = minRect[0]
 
         if(minRect[2] > 0):
             self.direction = DIRECTION.RIGHT
         else:
             self.direction = DIRECTION.LEFT
 
-        self.minAreaRect = minRect
         return minRect
 
     def findHarrisPoints(self):
@@ -121,18 +167,8 @@ class VisionTape:
 
         corners = np.delete(corners, (0), axis=0)
 
-        imag2 = self.image.copy()
-        print("printing ye olde corners that we found")
-
-        for corner in corners:
-            print(corner)
-
-            imag2[int(corner[1]), int(corner[0])] = [0, 0, 255]
-
-        cv2.imshow("corner boi %s" % corners[0, 1], imag2)
-        # cv2.waitKey(0)
-
         self.harrisCorners = corners
+        return corners
 
     def findCorners(self):
         # we split the contour in half i guess
@@ -148,8 +184,6 @@ class VisionTape:
         extTop = tuple(c[c[:, :, 1].argmin()][0])
         extBot = tuple(c[c[:, :, 1].argmax()][0])
 
-        print(extLeft, extRight, extTop, extBot)
-
         # based on the tip of this, put it in the correct order
         # i.e. bottom-outside, top-outside, top-inside, bottom-inside
         # keep in mind that top and bottom are flipped because the origin is 
@@ -168,35 +202,62 @@ class VisionTape:
             self.corners = [
                 extRight, extTop, extLeft, extBot
             ]
-        
-        print("detected corner area\n", self.corners)
-
-    def find_corner_points(self, contour):
-        M = cv2.moments(contour)
-        cx = int(M['m10']/M['m00'])
-        cy = int(M['m01']/M['m00'])
-        # Filter points by where they are relative to the center
-        TL_pts = list(filter(lambda C: C[0][0] < cx and C[0][1] < cy, contour))
-        TR_pts = list(filter(lambda C: C[0][0] > cx and C[0][1] < cy, contour))
-        BR_pts = list(filter(lambda C: C[0][0] > cx and C[0][1] > cy, contour))
-        BL_pts = list(filter(lambda C: C[0][0] < cx and C[0][1] > cy, contour))
-
-        # print(TL_pts, TR_pts, BR_pts, BL_pts)
-
-        if min(len(TL_pts), len(TR_pts), len(BR_pts), len(BL_pts)) == 0:
-            print("oof, it blank")
-            return None
-        # Categorize the "corner point" by being farthest from the center
-        farthest = lambda C: (C[0][0]-cx)**2 + (C[0][1]-cy)**2
-        tl = list(sorted(TL_pts, key=farthest, reverse=True))[0]
-        tr = list(sorted(TR_pts, key=farthest, reverse=True))[0]
-        br = list(sorted(BR_pts, key=farthest, reverse=True))[0]
-        bl = list(sorted(BL_pts, key=farthest, reverse=True))[0]
-
-        toReturn = np.array([tl, tr, br, bl])
-        print("toReturn", toReturn)
-        self.corners = toReturn
-        return toReturn
+
+        return self.corners
+
+    def find_corner_points(self, contour=None, subpixel=False):
+        """
+        Get the outside corners of the contour, farthest from its centroid
+        in each quadrant (see quadrant_corners)
+
+        Args:
+            contour: the contour to use, this tape's contour by default.
+                Only the corners of this tape's own contour are kept.
+            subpixel: refine the corners against the image with cornerSubPix
+
+        Returns:
+            a (4, 2) float32 array of the corners in the order tl, tr, br, bl,
+            ready to hand to solvePnP, or None if a quadrant is empty
+        """
+        if contour is not None and contour is not self.contour:
+            corners = quadrant_corners(contour)
+            if subpixel and corners is not None:
+                corners = self.refine_corners(corners)
+            return corners
+
+        if self.cornerPoints is None:
+            self.cornerPoints = quadrant_corners(self.contour)
+            # keep the old attribute filled in for anything still reading it
+            if self.cornerPoints is not None:
+                self.corners = self.cornerPoints
+        if not subpixel or self.cornerPoints is None:
+            return self.cornerPoints
+
+        if self.refinedCorners is None:
+            self.refinedCorners = self.refine_corners(self.cornerPoints)
+        return self.refinedCorners
+
+    def refine_corners(self, corners, window=(3, 3)):
+        """
+        Move corners found on the contour to sub pixel positions with
+        cornerSubPix, using the crop around this tape
+
+        Args:
+            corners: an (n, 2) array of points in frame coordinates
+            window: half the size of the search window
+
+        Returns:
+            the refined corners as a new (n, 2) float32 array
+        """
+        image = self.image
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        offset = np.array(self.imageCorner[:2], dtype=np.float32)
+        local = (np.asarray(corners, dtype=np.float32) - offset).reshape(-1, 1, 2)
+
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+        cv2.cornerSubPix(gray, local, window, (-1, -1), criteria)
+
+        return local.reshape(-1, 2) + offset
 
     def order_points(self):
 
@@ -210,7 +271,7 @@ class VisionTape:
 
         print("total corners ", len(pts))
 
-        assert(len(pts) is 4)
+        assert(len(pts) == 4)
 
         # TODO Change sort to Y axis then x axis
 
@@ -257,6 +318,9 @@ class VisionTape:
         # return self.orderedPoints
 
 class VisionTarget:
+    # same as VisionTape, small and everything derived is worked out once
+    __slots__ = ("individualTapes", "hull", "area", "center", "score", "captureTime")
+
     def __init__(self, individualTapes):
         """
         A vision target, consisting of two indivitual VisionTape objects
@@ -267,27 +331,34 @@ class VisionTarget:
         """
         self.individualTapes = individualTapes
         self.hull = None
+        self.area = None
+        self.center = None
+        # how much the pair looks like a real target, from 0 to 1, see scoreVisionPair
+        self.score = None
+        # time.monotonic() when the frame it was found in was captured, if it's known
+        self.captureTime = None
 
     def get_area(self):
-        return sum(f.get_area() for f in self.individualTapes)
+        if self.area is None:
+            self.area = sum(f.get_area() for f in self.individualTapes)
+        return self.area
 
     # @staticmethod
     def get_center(self):
-        centerX = (self.individualTapes[0].get_center()[0] + self.individualTapes[1].get_center()[0])/2
-        centerY = (self.individualTapes[0].get_center()[1] + self.individualTapes[1].get_center()[1])/2
+        if self.center is None:
+            left = self.individualTapes[0].get_center()
+            right = self.individualTapes[1].get_center()
+            self.center = [(left[0] + right[0])/2, (left[1] + right[1])/2]
 
-        return [centerX, centerY]
+        return self.center
 
     def get_center_offset(self, res):
         xCoord = self.get_center()[0]
         return xCoord - (res/2.0)
 
-    def get_corner_points(self):
-        toReturn = []
-        for tape in self.individualTapes:
-            toReturn.append(tape.find_corner_points(tape.contour))
-
-        return toReturn
+    def get_corner_points(self, subpixel=False):
+        # the tapes keep their own corners, so there's nothing to cache here
+        return [tape.find_corner_points(subpixel=subpixel) for tape in self.individualTapes]
 
     def get_convex_hull_4_sided(self):
         # contour1 = self.individualTapes[0]
@@ -314,8 +385,15 @@ class GripPipeline:
     An OpenCV pipeline generated by GRIP.
     """
 
-    def __init__(self):
+    def __init__(self, persistent=False, thresholdEngine="hsv"):
         """initializes all values to presets or None if need to be set
+
+        Args:
+            persistent: if True, the frame sized working buffers are allocated
+                once per resolution and reused for every frame after that,
+                so steady state processing doesn't allocate any of them
+            thresholdEngine: "hsv" to convert to HSV and call inRange, or
+                "lut" to map BGR straight to the mask with a LutThreshold
         """
 
         self.__hsv_threshold_hue = [15.9558030341169, 137.8198178573477]
@@ -343,32 +421,263 @@ class GripPipeline:
         self.__filter_contours_max_ratio = 20.0
 
         self.filter_contours_output = None
+        self.contour_features = None
         self.__hsv_threshold_input = None
 
         self.boundingRects = None
         self.visionTapes = []
         self.visionPair = None
         self.detectedPose = None
+        # when the frame being processed was captured, stamped on every target and pose found in it
+        self.captureTime = None
+
+        # set to a PoseEstimator to solve the pose of the target after pairing
+        self.poseEstimator = None
+
+        self.visionPairs = []
+        # how decideVisionPairs orders the targets, and the lowest score it keeps
+        self.pairRanking = "area"
+        self.minPairScore = 0.2
+
+        self.persistent = persistent
+        self.bufferShape = None
+        self.bufferAllocations = 0
+        self.__hsv_buffer = None
+        self.__mask_buffer = None
+        self.__annotated_buffer = None
+        self.__roi_offset = (0, 0)
+        self.__last_frame = None
+
+        # set to a PipelineMetrics to time every stage of process
+        self.metrics = None
+
+        if thresholdEngine == "lut":
+            # only imported when it's used, most pipelines never need it
+            from lut_threshold import LutThreshold
+            self.__lut_threshold = LutThreshold(self.__hsv_threshold_hue, self.__hsv_threshold_saturation,
+                                                self.__hsv_threshold_value)
+        elif thresholdEngine == "hsv":
+            self.__lut_threshold = None
+        else:
+            raise ValueError("unknown threshold engine %s" % thresholdEngine)
+
+    def get_config(self):
+        """
+        Get the HSV threshold and filter contours settings
+
+        Returns:
+            a dict that can be turned into JSON, with a value for each of CONFIG_KEYS
+        """
+        return {
+            "hue": list(self.__hsv_threshold_hue),
+            "saturation": list(self.__hsv_threshold_saturation),
+            "value": list(self.__hsv_threshold_value),
+            "external_only": self.__find_contours_external_only,
+            "min_area": self.__filter_contours_min_area,
+            "min_perimeter": self.__filter_contours_min_perimeter,
+            "min_width": self.__filter_contours_min_width,
+            "max_width": self.__filter_contours_max_width,
+            "min_height": self.__filter_contours_min_height,
+            "max_height": self.__filter_contours_max_height,
+            "solidity": list(self.__filter_contours_solidity),
+            "max_vertices": self.__filter_contours_max_vertices,
+            "min_vertices": self.__filter_contours_min_vertices,
+            "min_ratio": self.__filter_contours_min_ratio,
+            "max_ratio": self.__filter_contours_max_ratio,
+        }
+
+    def set_config(self, config):
+        """
+        Change the HSV threshold and filter contours settings, e.g. to the
+        ones written out by tune_threshold.py
+
+        Args:
+            config: a dict with any of CONFIG_KEYS. Anything left out stays the same.
+        """
+        unknown = set(config) - set(CONFIG_KEYS)
+        if unknown:
+            raise ValueError("unknown pipeline settings %s" % sorted(unknown))
+
+        if "hue" in config:
+            self.__hsv_threshold_hue = [float(v) for v in config["hue"]]
+        if "saturation" in config:
+            self.__hsv_threshold_saturation = [float(v) for v in config["saturation"]]
+        if "value" in config:
+            self.__hsv_threshold_value = [float(v) for v in config["value"]]
+        if "external_only" in config:
+            self.__find_contours_external_only = bool(config["external_only"])
+        if "min_area" in config:
+            self.__filter_contours_min_area = float(config["min_area"])
+        if "min_perimeter" in config:
+            self.__filter_contours_min_perimeter = float(config["min_perimeter"])
+        if "min_width" in config:
+            self.__filter_contours_min_width = float(config["min_width"])
+        if "max_width" in config:
+            self.__filter_contours_max_width = float(config["max_width"])
+        if "min_height" in config:
+            self.__filter_contours_min_height = float(config["min_height"])
+        if "max_height" in config:
+            self.__filter_contours_max_height = float(config["max_height"])
+        if "solidity" in config:
+            self.__filter_contours_solidity = [float(v) for v in config["solidity"]]
+        if "max_vertices" in config:
+            self.__filter_contours_max_vertices = float(config["max_vertices"])
+        if "min_vertices" in config:
+            self.__filter_contours_min_vertices = float(config["min_vertices"])
+        if "min_ratio" in config:
+            self.__filter_contours_min_ratio = float(config["min_ratio"])
+        if "max_ratio" in config:
+            self.__filter_contours_max_ratio = float(config["max_ratio"])
+
+    def __allocate_buffers(self, source0):
+        """
+        Make sure the working buffers match the resolution of this frame,
+        reallocating them only when the resolution changes
+        """
+        if self.bufferShape == source0.shape:
+            return
 
-        self.visionPairs = None
+        self.__hsv_buffer = np.empty_like(source0)
+        self.__mask_buffer = np.empty(source0.shape[:2], dtype=np.uint8)
+        self.__annotated_buffer = np.empty_like(source0)
+        self.bufferShape = source0.shape
+        self.bufferAllocations += 1
 
-    def process(self, source0, horizontalRes = 320):
+    def process(self, source0, horizontalRes = 320, display = False, roi = None, captureTime = None):
         """
         Runs the pipeline and sets all outputs to new values.
+
+        Nothing is drawn, shown or printed unless display is set. A debug
+        consumer can call annotate() afterwards to get the annotated frame,
+        so the drawing only happens for the frames somebody looks at.
+
+        Args:
+            source0: the BGR frame to process
+            horizontalRes: the width of the frame, used to find the middle
+            display: if True, annotate the frame and show it in a window
+            roi: an optional window in the form [x, y, x_2, y_2] to search
+                in instead of the whole frame. Everything found is still
+                in the coordinates of the whole frame.
+            captureTime: when source0 was captured, as time.monotonic().
+                Every target found (and the pose) carries it in captureTime,
+                so whoever uses them can tell how old they are.
+        """
+        self.start_frame(captureTime)
+        if self.metrics is None:
+            self.threshold(source0, roi)
+            self.find_contours()
+            self.filter_contours()
+            self.make_tapes(source0)
+            self.pair_tapes(horizontalRes)
+            if self.poseEstimator is not None:
+                self.solve_pose()
+        else:
+            self.__process_measured(source0, horizontalRes, roi)
+
+        self.__last_frame = source0
+
+        if display:
+            self.show()
+
+    def start_frame(self, captureTime=None):
+        """
+        Forget the capture time and search window of the last frame.
+        process does this itself, anything that runs the steps on its own
+        (like stage_cache.processCached) should call it first.
+        """
+        self.captureTime = captureTime
+        self.__roi_offset = (0, 0)
+
+    def show(self):
+        """
+        Show the annotated last frame in a window
         """
-        # Step HSV_Threshold0:
-        self.__hsv_threshold_input = source0
-        (self.hsv_threshold_output) = self.__hsv_threshold(self.__hsv_threshold_input, self.__hsv_threshold_hue,
-                                                           self.__hsv_threshold_saturation, self.__hsv_threshold_value)
+        temp = self.annotate()
 
-        # Step Find_Contours0:
+        cv2.namedWindow('temp',cv2.WINDOW_GUI_EXPANDED)
+        cv2.imshow('temp', temp)
+        cv2.resizeWindow('temp', 800,600)
+
+    def __process_measured(self, source0, horizontalRes, roi):
+        """
+        The steps of process, with a mark in self.metrics after each one
+        """
+        metrics = self.metrics
+        metrics.start_frame()
+        self.find_contours_output = []
+        self.filter_contours_output = []
+        self.visionTapes = []
+        self.visionPair = None
+        self.visionPairs = []
+        self.detectedPose = None
+        failed = True
+        try:
+            self.threshold(source0, roi)
+            metrics.mark("threshold")
+            self.find_contours()
+            metrics.mark("find_contours")
+            self.filter_contours()
+            metrics.mark("filter")
+            self.make_tapes(source0)
+            metrics.mark("tapes")
+            self.pair_tapes(horizontalRes)
+            metrics.mark("pairing")
+            if self.poseEstimator is not None:
+                self.solve_pose()
+                metrics.mark("pose")
+            failed = False
+        finally:
+            metrics.end_frame(len(self.find_contours_output), len(self.filter_contours_output),
+                              len(self.visionTapes), len(self.visionPairs), failed)
+
+    # The steps of process, in order. Each one reads the outputs of the one before it.
+
+    def threshold(self, source0, roi = None):
+        """
+        Step HSV_Threshold0, on the whole frame or only inside roi
+        """
+        if self.persistent:
+            self.__allocate_buffers(source0)
+
+        searchArea = source0
+        hsvBuffer = self.__hsv_buffer
+        maskBuffer = self.__mask_buffer
+        self.__roi_offset = (0, 0)
+        if roi is not None:
+            x, y, x2, y2 = roi
+            searchArea = source0[y:y2, x:x2]
+            if self.persistent:
+                hsvBuffer = hsvBuffer[y:y2, x:x2]
+                maskBuffer = maskBuffer[y:y2, x:x2]
+            self.__roi_offset = (x, y)
+
+        self.__hsv_threshold_input = searchArea
+        if self.__lut_threshold is not None:
+            # only rebuilds the table if the thresholds were changed
+            self.__lut_threshold.set_ranges(self.__hsv_threshold_hue, self.__hsv_threshold_saturation,
+                                            self.__hsv_threshold_value)
+            (self.hsv_threshold_output) = self.__lut_threshold.apply(self.__hsv_threshold_input, maskBuffer)
+        else:
+            (self.hsv_threshold_output) = self.__hsv_threshold(self.__hsv_threshold_input, self.__hsv_threshold_hue,
+                                                               self.__hsv_threshold_saturation, self.__hsv_threshold_value,
+                                                               hsvBuffer, maskBuffer)
+        return self.hsv_threshold_output
+
+    def find_contours(self):
+        """
+        Step Find_Contours0
+        """
         self.__find_contours_input = self.hsv_threshold_output
         (self.find_contours_output) = self.__find_contours(self.__find_contours_input,
-                                                           self.__find_contours_external_only)
+                                                           self.__find_contours_external_only, self.__roi_offset)
+        return self.find_contours_output
 
-        # Step Filter_Contours0:
+    def filter_contours(self):
+        """
+        Step Filter_Contours0
+        """
         self.__filter_contours_contours = self.find_contours_output
-        (self.filter_contours_output) = self.__filter_contours(self.__filter_contours_contours,
+        (self.contour_features) = self.__filter_contours(self.__filter_contours_contours,
                                                                self.__filter_contours_min_area,
                                                                self.__filter_contours_min_perimeter,
                                                                self.__filter_contours_min_width,
@@ -380,105 +689,124 @@ class GripPipeline:
                                                                self.__filter_contours_min_vertices,
                                                                self.__filter_contours_min_ratio,
                                                                self.__filter_contours_max_ratio)
+        self.filter_contours_output = self.contour_features.contours
+        return self.contour_features
 
-        self.boundingRects = self.getRect(self.filter_contours_output)
-
-        for i, rect in enumerate(self.boundingRects):
-            self.visionTapes.append(
-                VisionTape(
-                    self.crop(source0.copy(), rect), [rect[0], rect[1]], self.filter_contours_output[i]
-                )
-            )
-        
-        self.visionTapes = self.sortVisionTargets(self.visionTapes)
-
-        # pair targets up
-        self.visionPair = self.decideVisionPairs(self.visionTapes, horizontalRes)
-
-        # for debugging, annotate the image
-        temp = source0.copy()
-        # for f in self.visionPair:
-        loc = self.visionPair.get_center()
-        loc = np.int0(loc)
-        loc = (loc[0], loc[1])
-        cv2.circle(temp, tuple(loc), 3, (0,0,255))
-        cv2.line(temp, tuple(np.int0(self.visionPair.individualTapes[0].get_center())), tuple(np.int0(self.visionPair.individualTapes[1].get_center())), (255, 255, 0))
-
+    def make_tapes(self, source0):
+        """
+        Make a VisionTape for each contour that was kept, sorted left to right.
 
-        # self.detectedPose = self.solvePNPCorners(self.visionPair, None, None)
-        # cv2.drawContours(temp, self.visionPair.find_corner_points(), -1, (100, 100, 255))
+        The crop of each tape is a read only view of source0, not a copy,
+        so source0 shouldn't be overwritten while the tapes are still in use.
+        """
+        self.boundingRects = self.getRect(self.contour_features, source0.shape)
 
-        for i, cont in enumerate(self.filter_contours_output):
-            cv2.drawContours(temp, self.filter_contours_output, i, (255, 0, 0))
+        # pull the columns out as plain python values once instead of
+        # indexing into numpy for every tape
+        features = self.contour_features
+        rects = features.min_area_rects()
+        areas = features.area.tolist()
 
-        # cv2.drawContours(temp, )
+        self.visionTapes = [
+            VisionTape(self.crop(source0, box), [box[0], box[1]], features.contours[i],
+                       area=areas[i], minAreaRect=rects[i])
+            for i, box in enumerate(self.boundingRects)
+        ]
 
-        temp = self.printVisionTapes(self.visionTapes, temp)
+        self.visionTapes = self.sortVisionTargets(self.visionTapes)
+        return self.visionTapes
 
-        for pair in self.visionPair.get_corner_points():
-            for point in pair:
-                point = point[0]
-                print("Setting point color for point", point)
-                temp[int(point[1]), int(point[0])] = [0, 0, 255]
-  
-        for e in self.visionTapes:
-            loc = e.get_center()
-            loc = np.int0(loc)
-            loc = (loc[0], loc[1])
-            cv2.circle(temp, tuple(loc), 3, (255,0,0))
-            
+    def pair_tapes(self, horizontalRes = 320):
+        """
+        Pair the tapes up and pick the vision target. Every target found
+        goes in visionPairs, best first, and the best one in visionPair
+        (None if there wasn't one).
+        """
+        self.detectedPose = None
+        self.visionPairs = self.decideVisionPairs(self.visionTapes, horizontalRes,
+                                                  self.pairRanking, self.minPairScore)
+        self.visionPair = self.visionPairs[0] if self.visionPairs else None
+        if self.captureTime is not None:
+            for target in self.visionPairs:
+                target.captureTime = self.captureTime
+        return self.visionPair
+
+    def solve_pose(self):
+        """
+        Solve the pose of the target with self.poseEstimator
 
-        cv2.namedWindow('temp',cv2.WINDOW_GUI_EXPANDED)
-        cv2.imshow('temp', temp)
-        cv2.resizeWindow('temp', 800,600)
+        Returns:
+            the Pose, also kept in detectedPose, or None
+        """
+        self.detectedPose = self.poseEstimator.solve_target(self.visionPair)
+        if self.detectedPose is not None:
+            self.detectedPose.captureTime = self.captureTime
+        return self.detectedPose
 
-    @staticmethod
-    def solvePNPCorners(visionPair, camera_matrix, dist_coefs):
+    def annotate(self, source0 = None):
         """
-        Find the pose2d of a a given pair of vision targets
-        
+        Draw the results of the last call to process on top of the frame
+        for debugging
+
         Args:
-            a vision pair to use
+            source0: the frame that was processed, the one last passed to
+                process by default
 
         Returns:
-            the pose of the vision target in the form [[x, y, z], [pitch, yaw, roll]]
+            the annotated copy of the frame. In persistent mode this is
+            a reused buffer that is overwritten by the next call.
         """
-        # Start by finding the corners ig. do dis for each of the tapes in the pair
-        for t in visionPair.individualTapes:
-            t.findCorners()
+        if source0 is None:
+            source0 = self.__last_frame
 
-        candidates = t.harrisCorners[0], 
+        if self.persistent:
+            self.__allocate_buffers(source0)
+            temp = self.__annotated_buffer
+            np.copyto(temp, source0)
+        else:
+            temp = source0.copy()
 
-        # credit to https://www.chiefdelphi.com/t/finding-camera-location-with-solvepnp/159685/6
-        # def findCameraLocation(candidate,camera_matrix,dist_coefs):
-        print("testing candidate")
-        print('candidate is ', candidates)
-        #I used a 2.6 inch square as my target
-        objpoints1=np.array([(0,0,0),(2.6,0,0),(2.6,2.6,0),(0,2.6,0)],dtype=np.float)
-        print("obj points set")
-        #objpoints1 is an array of the corners of the square in world coordinates
-        retval,rvec1,tvec1=cv2.solvePnP(objpoints1,candidate,camera_matrix,dist_coefs)
-        # print("returning result")
-        # return True,tvec1,rvec1
+        def point(p):
+            return (int(round(p[0])), int(round(p[1])))
 
-        R = cv2.rodrigues(rvec1)
-        t = -R.transpose().dot(tvec1)
+        for i, cont in enumerate(self.filter_contours_output):
+            cv2.drawContours(temp, self.filter_contours_output, i, (255, 0, 0))
 
-        # ZYX,jac=cv2.Rodrigues(rvec1)
-        # print('Rodriguex')
-        # print(ZYX)
-        # print('done with r')
+        if self.visionPair is not None:
+            left, right = self.visionPair.individualTapes
+            cv2.circle(temp, point(self.visionPair.get_center()), 3, (0,0,255))
+            cv2.line(temp, point(left.get_center()), point(right.get_center()), (255, 255, 0))
 
-        # totalrotmax=np.array([[ZYX[0,0],ZYX[0,1],ZYX[0,2],tvec[0]],[ZYX[1,0],ZYX[1,1],ZYX[1,2],tvec[1]],[ZYX[2,0],ZYX[2,1],ZYX[2,2],tvec[2]],[0,0,0,1]]) # TODO check maths
+            for corners in self.visionPair.get_corner_points():
+                if corners is None:
+                    continue
+                for corner in corners:
+                    x, y = point(corner)
+                    temp[y, x] = [0, 0, 255]
 
-        # WtoC=np.mat(totalrotmax)
+        for e in self.visionTapes:
+            cv2.circle(temp, point(e.get_center()), 3, (255,0,0))
 
-        # inverserotmax=np.linalg.inv(totalrotmax)
-        # f=inverserotmax
-        # print(inverserotmax)
+        return temp
 
-        
+    @staticmethod
+    def solvePNPCorners(visionPair, camera_matrix, dist_coefs, method = "iterative"):
+        """
+        Find the pose of a a given pair of vision targets, from scratch. Use
+        solve_pose with a poseEstimator to warm start from the last frame.
+
+        Args:
+            visionPair: a vision pair to use
+            camera_matrix: the 3x3 camera matrix
+            dist_coefs: the lens distortion coefficients, or None
+            method: "iterative" or "ippe"
 
+        Returns:
+            the Pose of the vision target, or None if it couldn't be solved
+        """
+        from pose import PoseEstimator
+        estimator = PoseEstimator(camera_matrix, dist_coefs, method=method, warmStart=False)
+        return estimator.solve_target(visionPair)
 
     @staticmethod
     def printVisionTapes(sortedList, tempImg):
@@ -496,38 +824,75 @@ class GripPipeline:
             
 
     @staticmethod
-    def decideVisionPairs(sortedList, horizontalRes):
-        # first, eliminate one off targets hanging out on the edges
-
-        # print(sortedList[0].get_direction())
-
-        if sortedList[0].get_x_center_coordinate() < horizontalRes/2.0 and sortedList[0].get_direction() is DIRECTION.LEFT:
-                del(sortedList[0])
+    def decideVisionPairs(sortedList, horizontalRes, ranking = "area", minScore = 0.0):
+        """
+        Pair up tapes into vision targets in one pass over the tapes
 
+        A target is a tape tipped right (the left half of a target) followed
+        by a tape tipped left. Going left to right, each tape tipped right
+        waits for the next tape tipped left, and a newer tape tipped right
+        takes its place, so stray tapes on either side of a target are
+        just skipped and any number of tapes works.
 
-        if sortedList[len(sortedList) - 1].get_x_center_coordinate() > horizontalRes/2.0 and sortedList[len(sortedList) - 1].get_direction() is DIRECTION.RIGHT:
-            del(sortedList[len(sortedList) - 1])
+        Args:
+            sortedList: the tapes, sorted left to right
+            horizontalRes: the width of the frame, used to find the middle
+            ranking: how to order the targets, one of PAIR_RANKINGS. "area"
+                puts the biggest first, "offset" the one closest to the
+                middle and "score" the one that looks the most like a target.
+            minScore: leave out targets with a score lower than this
 
-        assert(len(sortedList) % 2 == 0)
+        Returns:
+            a list of the VisionTargets found, best first, which is empty
+            if there aren't any
+        """
+        if ranking not in PAIR_RANKINGS:
+            raise ValueError("unknown pair ranking %r, expected one of %s" % (ranking, sorted(PAIR_RANKINGS)))
 
-        # from here, just kinda loop gang
         pairs = []
+        waiting = None
+        for tape in sortedList:
+            if tape.get_direction() is DIRECTION.RIGHT:
+                waiting = tape
+            elif waiting is not None:
+                target = VisionTarget([waiting, tape])
+                target.score = GripPipeline.scoreVisionPair(waiting, tape)
+                if target.score >= minScore:
+                    pairs.append(target)
+                waiting = None
+
+        key = PAIR_RANKINGS[ranking]
+        pairs.sort(key = lambda target: key(target, horizontalRes))
+        return pairs
+
+    @staticmethod
+    def scoreVisionPair(left, right):
+        """
+        Score how much a pair of tapes looks like a vision target, by how
+        close they are in area, how far apart they are for their length,
+        and how evenly they're tipped toward each other
 
-        for i in range(0,len(sortedList) - 1,2):
-            # print("HULLO")
-            # print(i)
-            target = VisionTarget([sortedList[i], sortedList[i+1]])
-            target.get_center()
-            pairs.append(target)
+        Returns:
+            the score, from 0 to 1
+        """
+        leftArea = left.get_area()
+        rightArea = right.get_area()
+        if max(leftArea, rightArea) <= 0:
+            return 0.0
+        areaBalance = min(leftArea, rightArea) / max(leftArea, rightArea)
 
-        # pairs = sorted(pairs, key = VisionTape.get_area)
+        length = (max(left.minAreaRect[1]) + max(right.minAreaRect[1])) / 2.0
+        if length <= 0:
+            return 0.0
+        ratio = (right.get_center()[0] - left.get_center()[0]) / length
+        if ratio <= 0:
+            return 0.0
+        spacing = min(ratio, TAPE_SPACING_RATIO) / max(ratio, TAPE_SPACING_RATIO)
 
-        # uncomment me to sort by area!
-        return max(pairs, key = VisionTarget.get_area)
-        # sort by offset from center
-        # return min(pairs, key = lambda target : abs(target.get_center_offset(horizontalRes)))
+        # the angles should be about the same size with opposite signs
+        symmetry = max(0.0, 1.0 - abs(left.get_angle() + right.get_angle()) / 45.0)
 
-        # return pairs
+        return float(areaBalance * spacing * symmetry)
 
     @staticmethod
     def sortVisionTargets(listOfTargets):
@@ -538,23 +903,27 @@ class GripPipeline:
 
     # get a bounding rectangle
     @staticmethod
-    def getRect(contours_):
+    def getRect(contours_, shape = None):
         """
         Get the bouding rectangles (parallel to X and Y axis) of a list
         of countours
         
         Args:
-            contours_: a list of contours
+            contours_: a list of contours, or a ContourFeatures table to
+                reuse the bounding boxes it already has
+            shape: the shape of the frame, to keep the padded rectangles inside it
 
         Returns:
             a list of rectangles in the form [x, y, x_2, y_2], where x_2 and y_2 are the bottom-right corner
         """
         toReturn = []
 
-        for c in contours_:
-            # get the bounding rect
-            x, y, w, h = cv2.boundingRect(c)
+        if isinstance(contours_, ContourFeatures):
+            boxes = contours_.bbox.tolist()
+        else:
+            boxes = [cv2.boundingRect(c) for c in contours_]
 
+        for x, y, w, h in boxes:
             buffer = 7
             # x,y is top left of the box boi
             x -= int(buffer/2)
@@ -565,26 +934,35 @@ class GripPipeline:
             # draw a green rectangle to visualize the bounding rect
             # cv2.rectangle(img, (x, y), (x+w, y+h), (0, 255, 0), 1)
 
-            toReturn.append([x, y, x+w, y+h])
+            if shape is not None:
+                toReturn.append([max(x, 0), max(y, 0), min(x+w, shape[1]), min(y+h, shape[0])])
+            else:
+                toReturn.append([x, y, x+w, y+h])
         
         return toReturn
 
     @staticmethod
     def crop(img_, range_):
         """
-        """
-        img_ = img_[range_[1]:range_[3], range_[0]:range_[2]]
+        Get a read only view of part of an image, without copying it
 
-        # cv2.imshow(img_)
-        # cv2.waitKey(0)
-        # cv2.destroyWindow()
+        Args:
+            img_: the image
+            range_: the part to keep in the form [x, y, x_2, y_2]. Anything
+                outside of the image is left out.
 
-        # print(img_)
+        Returns:
+            the view
+        """
+        x = max(range_[0], 0)
+        y = max(range_[1], 0)
+        img_ = img_[y:max(range_[3], y), x:max(range_[2], x)]
+        img_.flags.writeable = False
 
         return img_
 
     @staticmethod
-    def __hsv_threshold(input, hue, sat, val):
+    def __hsv_threshold(input, hue, sat, val, hsv=None, mask=None):
         """Segment an image based on hue, saturation, and value ranges.
 
         Args:
@@ -592,19 +970,22 @@ class GripPipeline:
             hue: A list of two numbers the are the min and max hue.
             sat: A list of two numbers the are the min and max saturation.
             lum: A list of two numbers the are the min and max value.
+            hsv: An optional buffer to write the HSV image into.
+            mask: An optional buffer to write the output into.
 
         Returns:
             A black and white numpy.ndarray.
         """
-        out = cv2.cvtColor(input, cv2.COLOR_BGR2HSV)
-        return cv2.inRange(out, (hue[0], sat[0], val[0]), (hue[1], sat[1], val[1]))
+        out = cv2.cvtColor(input, cv2.COLOR_BGR2HSV, dst=hsv)
+        return cv2.inRange(out, (hue[0], sat[0], val[0]), (hue[1], sat[1], val[1]), dst=mask)
 
     @staticmethod
-    def __find_contours(input, external_only):
+    def __find_contours(input, external_only, offset=(0, 0)):
         """Sets the values of pixels in a binary image to their distance to the nearest black pixel.
         Args:
             input: A numpy.ndarray.
             external_only: A boolean. If true only external contours are found.
+            offset: An amount to shift every contour point by.
         Return:
             A list of numpy.ndarray where each one represents a contour.
         """
@@ -613,7 +994,7 @@ class GripPipeline:
         else:
             mode = cv2.RETR_LIST
         method = cv2.CHAIN_APPROX_SIMPLE
-        contours, hierarchy = cv2.findContours(input, mode=mode, method=method)
+        contours, hierarchy = cv2.findContours(input, mode=mode, method=method, offset=offset)
         return contours
 
     @staticmethod
@@ -635,31 +1016,13 @@ class GripPipeline:
             min_ratio: Minimum ratio of width to height.
             max_ratio: Maximum ratio of width to height.
         Returns:
-            Contours as a list of numpy.ndarray.
-        """
-        output = []
-        for contour in input_contours:
-            x, y, w, h = cv2.boundingRect(contour)
-            if (w < min_width or w > max_width):
-                continue
-            if (h < min_height or h > max_height):
-                continue
-            area = cv2.contourArea(contour)
-            if (area < min_area):
-                continue
-            if (cv2.arcLength(contour, True) < min_perimeter):
-                continue
-            hull = cv2.convexHull(contour)
-            solid = 100 * area / cv2.contourArea(hull)
-            if (solid < solidity[0] or solid > solidity[1]):
-                continue
-            if (len(contour) < min_vertex_count or len(contour) > max_vertex_count):
-                continue
-            ratio = (float)(w) / h
-            if (ratio < min_ratio or ratio > max_ratio):
-                continue
-            output.append(contour)
-        return output
+            A ContourFeatures table of the contours that were kept. Its
+            contours attribute is the list of numpy.ndarray.
+        """
+        features = ContourFeatures(input_contours)
+        return features.filter(min_area, min_perimeter, min_width, max_width,
+                               min_height, max_height, solidity, max_vertex_count, min_vertex_count,
+                               min_ratio, max_ratio)
 
     # Now we get to do the fun stuff of splitting the detected contours
     # up into their individual parts
@@ -679,12 +1042,33 @@ class GripPipeline:
 
 
 
-pipe = GripPipeline()
+def main():
+    """
+    Run the pipeline on one image and show what it found
+
+    Usage:
+        python BoudingRectangle.py [image]
+    """
+    import argparse
+
+    imageDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+    parser = argparse.ArgumentParser(description=main.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image", nargs="?", default=os.path.join(imageDir, "2019", "RocketPanelStraightDark24in.jpg"))
+    args = parser.parse_args()
 
-loadedImage = cv2.pyrDown(cv2.imread("/Users/matt/Documents/GitHub/pantry-vision/images/2019/RocketPanelStraightDark24in.jpg",
-                             cv2.IMREAD_UNCHANGED))
+    pipe = GripPipeline()
 
-pipe.process(loadedImage, horizontalRes = 320)
+    loadedImage = cv2.pyrDown(cv2.imread(args.image, cv2.IMREAD_UNCHANGED))
+
+    pipe.process(loadedImage, horizontalRes = loadedImage.shape[1], display = True)
+
+    cv2.waitKey(0)
+
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
 
 # cropped = loadedImage.copy()
 
@@ -817,9 +1201,3 @@ pipe.process(loadedImage, horizontalRes = 320)
 # print(boxes)
 
 
-
-cv2.waitKey(0)
-
-cv2.destroyAllWindows()
-
-
@@ -0,0 +1,258 @@
+"""
+Headless batch runner
+
+Runs GripPipeline over every image in a set of directories or globs with a
+process pool, and writes one row per frame to a CSV or JSON lines file.
+Rows are always written in the same (natural filename) order no matter
+how many workers there are.
+
+Usage:
+    python batch.py ../../../images/RealFullField -o results.csv
+    python batch.py "../../../images/2019/*Dark*.jpg" -o results.jsonl --workers 4
+    python batch.py ../../../images/RealFullField -o results.csv --cache /tmp/vision-cache
+    python batch.py --frames /tmp/realfullfield.frames -o results.csv
+"""
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+from BoudingRectangle import GripPipeline
+from frame_loader import decodeFrame
+from frame_store import FrameStore
+from grip_plan import gripConfig
+from stage_cache import StageCache, processCached
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+FIELDS = [
+    "file", "width", "height", "contours", "kept", "tapes", "found",
+    "center_x", "center_y", "center_offset", "area",
+    "left_area", "left_angle", "right_area", "right_angle",
+    "decode_ms", "process_ms", "error"
+]
+
+# one pipeline (and stage cache and frame store) per worker process, made by initWorker
+pipeline = None
+pyrDowns = 1
+reducedDecode = False
+cache = None
+frames = None
+
+
+def naturalKey(path):
+    """
+    Sort key so that 2.jpg comes before 10.jpg
+    """
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", path)]
+
+
+def findImages(inputs):
+    """
+    Get every image in a list of directories, files and globs
+
+    Returns:
+        the paths, without duplicates, in natural order
+    """
+    paths = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*")
+        for path in glob.glob(pattern):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                paths.add(path)
+    return sorted(paths, key=naturalKey)
+
+
+def initWorker(pyrDownCount, config=None, cacheDirectory=None, cacheBytes=None, frameStore=None, reduced=False):
+    global pipeline, pyrDowns, reducedDecode, cache, frames
+    pipeline = GripPipeline(persistent=True)
+    if config is not None:
+        pipeline.set_config(config)
+    pyrDowns = pyrDownCount
+    reducedDecode = reduced
+    cache = StageCache(cacheDirectory, cacheBytes) if cacheDirectory else None
+    # every worker maps the same file, so they share the frames through the page cache
+    frames = FrameStore(frameStore) if frameStore else None
+
+
+def processFile(path):
+    """
+    Run the pipeline on one image, or with a frame store, on the frame
+    from the image with that name. Anything that goes wrong with the frame
+    ends up in the row's error, instead of ending the run.
+
+    Returns:
+        a dict with a value for each of FIELDS
+    """
+    row = dict.fromkeys(FIELDS)
+    row["file"] = path
+    row["found"] = False
+    try:
+        fillRow(row, path)
+    except Exception as e:
+        # one bad frame shouldn't take the whole run (and the pool) down with it
+        row["found"] = False
+        row["error"] = "%s: %s" % (type(e).__name__, e)
+    return row
+
+
+def fillRow(row, path):
+    """
+    The work of processFile, which fills in row as it goes
+    """
+    start = time.perf_counter()
+    if cache is not None:
+        # decoding happens inside processCached, and only if the frame isn't cached,
+        # so decode_ms is only the time to read the file
+        with open(path, "rb") as f:
+            content = f.read()
+        decoded = time.perf_counter()
+        image = processCached(pipeline, cache, content, pyrDownCount=pyrDowns, reduced=reducedDecode)
+        if image is None:
+            row["error"] = "could not read image"
+            return
+    else:
+        image = frames.get(path) if frames is not None else decodeFrame(path, pyrDowns, reducedDecode)
+        if image is None:
+            row["error"] = "could not read image"
+            return
+        decoded = time.perf_counter()
+        pipeline.process(image, horizontalRes=image.shape[1])
+
+    row["decode_ms"] = round((decoded - start) * 1000.0, 3)
+    row["process_ms"] = round((time.perf_counter() - decoded) * 1000.0, 3)
+    row["height"], row["width"] = image.shape[:2]
+
+    # when the cache had the filtered contours, findContours didn't run
+    if pipeline.find_contours_output is not None:
+        row["contours"] = len(pipeline.find_contours_output)
+    row["kept"] = len(pipeline.contour_features)
+    row["tapes"] = len(pipeline.visionTapes)
+
+    target = pipeline.visionPair
+    if target is not None:
+        left, right = target.individualTapes
+        center = target.get_center()
+        row.update({
+            "found": True,
+            "center_x": round(float(center[0]), 2),
+            "center_y": round(float(center[1]), 2),
+            "center_offset": round(float(target.get_center_offset(image.shape[1])), 2),
+            "area": float(target.get_area()),
+            "left_area": float(left.get_area()),
+            "left_angle": round(float(left.get_angle()), 2),
+            "right_area": float(right.get_area()),
+            "right_angle": round(float(right.get_angle()), 2),
+        })
+
+
+class RowWriter:
+    """
+    Writes rows to a CSV file or, if the path ends in .jsonl, a JSON lines file
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "w", newline="") if path != "-" else sys.stdout
+        self.jsonl = path.endswith(".jsonl")
+        if not self.jsonl:
+            self.csv = csv.DictWriter(self.file, fieldnames=FIELDS)
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.jsonl:
+            self.file.write(json.dumps(row) + "\n")
+        else:
+            self.csv.writerow(row)
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def run(paths, output, workers=None, chunksize=8, pyrDownCount=1, config=None, cacheDirectory=None,
+        cacheBytes=512 * 1024 * 1024, frameStore=None, reduced=False):
+    """
+    Process every path and write a row for each of them to output, in order.
+    config is passed on to GripPipeline.set_config. With a cacheDirectory
+    the early stages are reused from a StageCache there. With a frameStore
+    directory, paths are the names of frames in that FrameStore instead.
+    reduced turns on the reduced size JPEG decode (see frame_loader.py).
+
+    Returns:
+        the rows that were written
+    """
+    writer = RowWriter(output)
+    rows = []
+    initArgs = (pyrDownCount, config, cacheDirectory, cacheBytes, frameStore, reduced)
+
+    try:
+        if workers == 1:
+            initWorker(*initArgs)
+            results = map(processFile, paths)
+            for row in results:
+                writer.write(row)
+                rows.append(row)
+        else:
+            with multiprocessing.Pool(workers, initializer=initWorker, initargs=initArgs) as pool:
+                # imap hands out chunks in parallel but yields results in order
+                for row in pool.imap(processFile, paths, chunksize=chunksize):
+                    writer.write(row)
+                    rows.append(row)
+    finally:
+        writer.close()
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*", help="image directories, files or globs")
+    parser.add_argument("-o", "--output", default="-", help="a .csv or .jsonl file, stdout by default")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, all cores by default")
+    parser.add_argument("--chunksize", type=int, default=8, help="images handed to a worker at a time")
+    parser.add_argument("--pyrdown", type=int, default=1, help="times to pyrDown each image first")
+    parser.add_argument("--config", help="a JSON file of pipeline settings, e.g. from tune_threshold.py")
+    parser.add_argument("--grip", help="a GRIP project to take the pipeline settings from instead")
+    parser.add_argument("--cache", help="a directory to keep the output of the early stages in between runs")
+    parser.add_argument("--cache-size", type=int, default=512, help="most MB the cache can take up")
+    parser.add_argument("--reduced", action="store_true", help="decode JPEGs at reduced size, see frame_loader.py")
+    parser.add_argument("--frames", help="a frame store from frame_store.py to read the frames from instead")
+    args = parser.parse_args()
+
+    if args.frames:
+        if args.inputs or args.cache:
+            parser.error("--frames can't be used with inputs or --cache")
+        if args.reduced:
+            parser.error("--reduced can't be used with --frames, the frames were decoded when the store was built")
+        store = FrameStore(args.frames)
+        paths = store.names
+        args.pyrdown = store.pyrDownCount
+    else:
+        paths = findImages(args.inputs)
+    if not paths:
+        raise SystemExit("no images found")
+
+    config = None
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    elif args.grip:
+        config = gripConfig(args.grip)
+
+    start = time.perf_counter()
+    rows = run(paths, args.output, args.workers, args.chunksize, args.pyrdown, config,
+               args.cache, args.cache_size * 1024 * 1024, args.frames, args.reduced)
+    elapsed = time.perf_counter() - start
+
+    found = sum(1 for row in rows if row["found"])
+    print("%d frames, %d with a target, in %.2f s" % (len(rows), found, elapsed), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Stage cache benchmark
+
+Processes an image set through processCached with a fresh StageCache a
+few times, changing one more stage's settings each time, and reports
+the time per frame and which stages came out of the cache:
+
+    cold       empty cache, every stage runs
+    warm       nothing changed
+    pairing    only the pairing ranking changed (not part of any key)
+    filter     the filter settings changed, resumes from the contours
+    threshold  the HSV threshold changed, resumes from the decoded frame
+
+and checks that every cached run found the same targets as a plain
+GripPipeline.process run with the same settings.
+
+Usage:
+    python bench_cache.py [image directory] [--pyrdown N]
+"""
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+from BoudingRectangle import GripPipeline
+from frame_loader import decodeBytes
+from stage_cache import STAGES, StageCache, processCached
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+
+
+def targetKey(pipe):
+    target = pipe.visionPair
+    if target is None:
+        return None
+    return tuple(round(float(v), 3) for v in target.get_center())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=os.path.join(IMAGE_DIR, "RealFullField"))
+    parser.add_argument("--pyrdown", type=int, default=1)
+    args = parser.parse_args()
+
+    contents = []
+    for path in sorted(glob.glob(os.path.join(args.directory, "*.jpg"))):
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    if not contents:
+        raise SystemExit("no images found")
+
+    directory = tempfile.mkdtemp(prefix="stage-cache-")
+    try:
+        cache = StageCache(directory)
+        pipe = GripPipeline(persistent=True)
+        reference = GripPipeline(persistent=True)
+
+        runs = [
+            ("cold", {}, None),
+            ("warm", {}, None),
+            ("pairing", {}, "offset"),
+            ("filter", {"min_area": 20.0}, None),
+            ("threshold", {"value": [90.0, 255.0]}, None),
+        ]
+        print("%d frames from %s\n" % (len(contents), args.directory))
+        print("%-10s %9s  %-40s %s" % ("run", "ms/frame", "cache hits (" + ", ".join(STAGES) + ")", "parity"))
+        for name, config, ranking in runs:
+            pipe.set_config(config)
+            reference.set_config(config)
+            if ranking is not None:
+                pipe.pairRanking = reference.pairRanking = ranking
+            cache.hits = dict.fromkeys(STAGES, 0)
+
+            results = []
+            start = time.perf_counter()
+            for content in contents:
+                processCached(pipe, cache, content, pyrDownCount=args.pyrdown)
+                results.append(targetKey(pipe))
+            elapsed = time.perf_counter() - start
+
+            same = 0
+            for content, result in zip(contents, results):
+                frame = decodeBytes(content, args.pyrdown)
+                reference.process(frame, horizontalRes=frame.shape[1])
+                same += targetKey(reference) == result
+
+            print("%-10s %9.3f  %-40s %d/%d" % (
+                name, elapsed * 1000.0 / len(contents), ", ".join(str(cache.hits[s]) for s in STAGES),
+                same, len(contents)))
+
+        print("\ncache size %.1f MB" % (cache.size / 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Debug stream benchmark
+
+Runs the runtime on played back images for a few seconds each:
+
+    off        no debug stream
+    idle       a debug stream nobody is watching
+    watched    a debug stream with a client reading it
+
+and reports how many frames were processed and dropped, and what the
+stream encoded and served. The detector should process the same number
+of frames in all three; "offer us" is what the stream costs the publish
+thread per frame.
+
+Usage:
+    python bench_debug_stream.py [image directory] [--fps 30] [--seconds 5] [--stream-fps 10] [--scale 0.5]
+"""
+import argparse
+import glob
+import os
+import threading
+import time
+import urllib.request
+
+from debug_stream import BOUNDARY, DebugStream
+from runtime import FileSource, VisionRuntime
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+
+
+class TimedStream:
+    """
+    A DebugStream that times offer
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.seconds = 0.0
+
+    def offer(self, image, result):
+        start = time.perf_counter()
+        self.stream.offer(image, result)
+        self.seconds += time.perf_counter() - start
+
+
+def watch(url, stop, counts):
+    """
+    Read the MJPEG stream at url until stop is set, counting the frames
+    """
+    marker = b"--" + BOUNDARY
+    with urllib.request.urlopen(url) as response:
+        while not stop.is_set():
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            counts["frames"] += chunk.count(marker)
+            counts["bytes"] += len(chunk)
+
+
+def run(paths, args, mode):
+    source = FileSource(paths, fps=args.fps)
+    stream = timed = None
+    if mode != "off":
+        stream = DebugStream(0, host="127.0.0.1", fps=args.stream_fps, scale=args.scale)
+        stream.start()
+        timed = TimedStream(stream)
+
+    counts = {"frames": 0, "bytes": 0}
+    stop = threading.Event()
+    client = None
+    if mode == "watched":
+        url = "http://127.0.0.1:%d/" % stream.address[1]
+        client = threading.Thread(target=watch, args=(url, stop, counts), daemon=True)
+        client.start()
+        # so the client is connected for the whole run
+        while not stream.clients:
+            time.sleep(0.01)
+
+    runtime = VisionRuntime(source, publisher=None, debugStream=timed)
+    runtime.start()
+    time.sleep(args.seconds)
+    runtime.stop()
+    stop.set()
+
+    stats = runtime.stats()
+    row = [mode, stats["processed"], stats["dropped_before_process"]]
+    if stream is not None:
+        stream.stop()
+        streamStats = stream.stats()
+        row += [timed.seconds * 1e6 / max(stats["published"], 1), streamStats["encoded"],
+                streamStats["dropped_before_encode"], counts["frames"], counts["bytes"] / 1024.0]
+    else:
+        row += [0.0, 0, 0, 0, 0.0]
+    if client is not None:
+        client.join(2.0)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=os.path.join(IMAGE_DIR, "2019"))
+    parser.add_argument("--fps", type=float, default=30.0, help="frame rate of the played back images")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--stream-fps", type=float, default=10.0)
+    parser.add_argument("--scale", type=float, default=0.5)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.directory, "*.jpg")))
+    if not paths:
+        raise SystemExit("no images found")
+
+    print("%s at %.0f fps for %.0f s, stream at %.0f fps and %.2f scale\n" % (
+        args.directory, args.fps, args.seconds, args.stream_fps, args.scale))
+    print("%-8s %10s %8s %9s %8s %8s %9s %9s" % (
+        "stream", "processed", "dropped", "offer us", "encoded", "skipped", "received", "KiB"))
+    for mode in ("off", "idle", "watched"):
+        print("%-8s %10d %8d %9.2f %8d %8d %9d %9.1f" % tuple(run(paths, args, mode)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Frame store benchmark
+
+Builds a frame store from an image set and times a few passes over the
+set three ways:
+
+    decode     imread and pyrDown every image, the way the tools used to
+    store      read every frame from the frame store
+    +process   the same two, also running GripPipeline.process on each frame
+
+and checks that the pipeline finds the same targets either way.
+
+Usage:
+    python bench_frame_store.py [image directory] [--pyrdown N] [--passes N]
+"""
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+from BoudingRectangle import GripPipeline
+from frame_loader import decodeFrame
+from frame_store import FrameStore
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+
+
+def sweep(frames, pipe=None):
+    """
+    Returns:
+        the centers of the targets found, if there's a pipeline, and the number of bytes seen
+    """
+    centers = []
+    total = 0
+    for frame in frames:
+        # sum a row of every frame, so the store's pages actually get read
+        total += int(frame[::8].sum())
+        if pipe is not None:
+            # process doesn't return anything, the target is left in visionPair
+            pipe.process(frame, horizontalRes=frame.shape[1])
+            target = pipe.visionPair
+            centers.append(None if target is None else tuple(round(float(v), 3) for v in target.get_center()))
+    return centers, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=os.path.join(IMAGE_DIR, "RealFullField"))
+    parser.add_argument("--pyrdown", type=int, default=1)
+    parser.add_argument("--passes", type=int, default=3)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.directory, "*.jpg")))
+    if not paths:
+        raise SystemExit("no images found")
+
+    directory = tempfile.mkdtemp(prefix="frame-store-")
+    try:
+        start = time.perf_counter()
+        store = FrameStore.build(paths, directory, args.pyrdown)
+        built = time.perf_counter() - start
+        print("%d frames, %.1f MB, built in %.2f s\n" % (len(store), store.data.nbytes / 1e6, built))
+
+        def decoded():
+            for path in paths:
+                frame = decodeFrame(path, args.pyrdown)
+                if frame is not None:
+                    yield frame
+
+        pipe = GripPipeline(persistent=True)
+        results = {}
+        print("%-18s %12s" % ("pass", "ms/frame"))
+        for name, frames, process in [("decode", decoded, False), ("store", lambda: iter(store), False),
+                                      ("decode+process", decoded, True), ("store+process", lambda: iter(store), True)]:
+            times = []
+            for _ in range(args.passes):
+                start = time.perf_counter()
+                results[name] = sweep(frames(), pipe if process else None)[0]
+                times.append(time.perf_counter() - start)
+            print("%-18s %12.3f" % (name, min(times) * 1000.0 / len(store)))
+
+        same = sum(a == b for a, b in zip(results["decode+process"], results["store+process"]))
+        found = sum(center is not None for center in results["store+process"])
+        print("\nsame targets on %d/%d frames, %d with a target" % (same, len(store), found))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Compiled pipeline benchmark
+
+Compares the plan compiled from pipeline.grip (see grip_plan.py) with
+GripPipeline's hand written steps, on the same settings:
+
+    steps      threshold, find contours and filter contours
+    process    the whole thing, through pairing
+
+and checks that both keep the same contours and find the same targets.
+With --solidity the filter gets a solidity range that does filter, so
+the convex hull check isn't compiled out.
+
+Usage:
+    python bench_grip_plan.py [image directory] [--grip pipeline.grip] [--solidity LOW]
+"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from BoudingRectangle import GripPipeline
+from frame_loader import FrameLoader
+from grip_plan import DEFAULT_GRIP, CompiledPipeline, gripConfig, parseGrip, processCompiled
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+
+
+def best(times):
+    return min(times) * 1000.0
+
+
+def targetKey(target):
+    return None if target is None else tuple(round(float(v), 3) for v in target.get_center())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=os.path.join(IMAGE_DIR, "RealFullField"))
+    parser.add_argument("--grip", default=DEFAULT_GRIP)
+    parser.add_argument("--solidity", type=float, default=None, help="lowest solidity to keep, in percent")
+    parser.add_argument("--passes", type=int, default=5)
+    args = parser.parse_args()
+
+    names, frames = FrameLoader(sorted(glob.glob(os.path.join(args.directory, "*.jpg")))).frames()
+    if not frames:
+        raise SystemExit("no images found")
+
+    steps = parseGrip(args.grip)
+    config = gripConfig(args.grip)
+    if args.solidity is not None:
+        config["solidity"] = [args.solidity, 100.0]
+        for step in steps:
+            if "solidity" in step.settings:
+                step.settings["solidity"] = config["solidity"]
+    plan = CompiledPipeline(steps)
+
+    pipe = GripPipeline(persistent=True)
+    pipe.set_config(config)
+    compiledPipe = GripPipeline(persistent=True)
+    compiledPipe.set_config(config)
+
+    def handSteps(frame):
+        pipe.threshold(frame)
+        pipe.find_contours()
+        return pipe.filter_contours()
+
+    runs = [
+        ("steps", handSteps, plan.process),
+        ("process", lambda frame: pipe.process(frame, horizontalRes=frame.shape[1]),
+         lambda frame: processCompiled(compiledPipe, plan, frame)),
+    ]
+
+    print("%d frames from %s, stages: %s\n" % (len(frames), args.directory,
+                                               ", ".join(name for name, _ in plan.stages)))
+    print("%-10s %12s %12s" % ("", "hand ms", "compiled ms"))
+    for name, hand, compiled in runs:
+        handTimes, compiledTimes = [], []
+        for _ in range(args.passes):
+            start = time.perf_counter()
+            for frame in frames:
+                hand(frame)
+            handTimes.append((time.perf_counter() - start) / len(frames))
+            start = time.perf_counter()
+            for frame in frames:
+                compiled(frame)
+            compiledTimes.append((time.perf_counter() - start) / len(frames))
+        print("%-10s %12.3f %12.3f" % (name, best(handTimes), best(compiledTimes)))
+
+    sameContours = sameTargets = 0
+    for frame in frames:
+        kept = handSteps(frame)
+        planKept = plan.process(frame)
+        sameContours += len(kept) == len(planKept) and np.array_equal(kept.bbox, planKept.bbox)
+        pipe.process(frame, horizontalRes=frame.shape[1])
+        processCompiled(compiledPipe, plan, frame)
+        sameTargets += targetKey(pipe.visionPair) == targetKey(compiledPipe.visionPair)
+    print("\nsame contours kept on %d/%d frames, same target on %d/%d" % (
+        sameContours, len(frames), sameTargets, len(frames)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Import time benchmark
+
+The coprocessor service restarts every time the robot reboots, so how
+long it takes to import the vision code is part of how long it takes to
+see the first target. This imports each module in a fresh interpreter
+with python -X importtime, a few times, and reports the median time of
+each import and which heavy modules it pulled in. It also times a whole
+cold start: a fresh interpreter that imports vision and makes a
+GripPipeline.
+
+With --baseline the times are compared to a stored run, and the exit
+code is 1 if any import got more than --tolerance slower, or if an
+import pulls in a heavy module it didn't before. Import times depend
+on the machine, so save the baseline on the machine that compares
+against it.
+
+Usage:
+    python bench_import.py
+    python bench_import.py --save-baseline
+    python bench_import.py --baseline
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "import_baseline.json")
+
+MODULES = ["vision", "BoudingRectangle", "pose", "pyramid", "tracking", "runtime", "batch", "cv2", "numpy"]
+
+# modules that the vision code shouldn't need just to be imported
+HEAVY = ["scipy", "matplotlib", "pandas", "sklearn", "numba", "multiprocessing", "concurrent.futures"]
+
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+COLD_START = "import vision; vision.GripPipeline()"
+
+
+def importTime(module):
+    """
+    Import module in a new interpreter
+
+    Returns:
+        the cumulative import time in ms, and the names of the heavy modules that got imported
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                            cwd=HERE, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError("importing %s failed:\n%s" % (module, result.stderr))
+
+    total = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match is None:
+            continue
+        name = match.group(4)
+        imported.add(name)
+        # the top level import is the last line, with no indent
+        if name == module and not match.group(3):
+            total = int(match.group(2)) / 1000.0
+    heavy = sorted(h for h in HEAVY if h in imported)
+    return total, heavy
+
+
+def coldStart():
+    """
+    Returns:
+        the wall time in ms of a new interpreter running COLD_START
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", COLD_START], cwd=HERE, check=True, capture_output=True)
+    return (time.perf_counter() - start) * 1000.0
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+
+def run(modules, repeats):
+    results = {"imports": {}}
+    for module in modules:
+        times, heavy = [], []
+        for _ in range(repeats):
+            total, heavy = importTime(module)
+            times.append(total)
+        results["imports"][module] = {"ms": round(median(times), 2), "heavy": heavy}
+    results["cold_start_ms"] = round(median([coldStart() for _ in range(repeats)]), 2)
+    return results
+
+
+def compare(results, baseline, tolerance, slack):
+    """
+    Returns:
+        a list of everything that got worse than the baseline, empty if nothing did
+    """
+    problems = []
+    for module, now in results["imports"].items():
+        then = baseline["imports"].get(module)
+        if then is None:
+            continue
+        if now["ms"] > then["ms"] * (1.0 + tolerance) + slack:
+            problems.append("import %s went from %.1f ms to %.1f ms" % (module, then["ms"], now["ms"]))
+        for heavy in sorted(set(now["heavy"]) - set(then["heavy"])):
+            problems.append("import %s now imports %s" % (module, heavy))
+    then = baseline.get("cold_start_ms")
+    if then and results["cold_start_ms"] > then * (1.0 + tolerance) + slack:
+        problems.append("cold start went from %.1f ms to %.1f ms" % (then, results["cold_start_ms"]))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeats", type=int, default=5, help="fresh interpreters per module, the median is kept")
+    parser.add_argument("--baseline", nargs="?", const=DEFAULT_BASELINE,
+                        help="compare against this stored run, import_baseline.json if no file is given")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE,
+                        help="store this run here, import_baseline.json if no file is given")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="fraction an import can get slower by")
+    parser.add_argument("--slack", type=float, default=5.0, help="ms an import can get slower by on top of that")
+    args = parser.parse_args()
+
+    results = run(args.modules, args.repeats)
+
+    print("%-18s %9s  %s" % ("import", "ms", "heavy modules"))
+    for module, row in results["imports"].items():
+        print("%-18s %9.1f  %s" % (module, row["ms"], ", ".join(row["heavy"])))
+    print("\ncold start (%s): %.1f ms" % (COLD_START, results["cold_start_ms"]))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, args.tolerance, args.slack)
+        print()
+        if problems:
+            print("REGRESSED against %s:" % args.baseline)
+            for problem in problems:
+                print("  " + problem)
+            sys.exit(1)
+        print("no regressions against %s" % args.baseline)
+
+
+if __name__ == "__main__":
+    main()
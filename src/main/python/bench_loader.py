@@ -0,0 +1,94 @@
+"""
+Frame loader benchmark and parity check
+
+Times a pass over an image set, decoding and running GripPipeline.process
+on every frame, with:
+
+    pyrdown            imread at full size and pyrDown, one frame at a time
+    pyrdown+prefetch   the same on a FrameLoader, decoding --prefetch frames ahead
+    reduced            a reduced size JPEG decode, one frame at a time
+    reduced+prefetch   the same on a FrameLoader
+
+and then compares what the pipeline found in the reduced frames to the
+pyrDown'd ones: whether a target was found, how far its center moved and
+whether a pose was found.
+
+Usage:
+    python bench_loader.py [image directory] [--pyrdown N] [--prefetch K]
+"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from BoudingRectangle import GripPipeline
+from frame_loader import FrameLoader, decodeFrame
+from pose import PoseEstimator, cameraMatrix
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+
+
+def result(pipe):
+    target = pipe.visionPair
+    center = None if target is None else np.array(target.get_center(), dtype=np.float64)
+    return center, pipe.detectedPose is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=os.path.join(IMAGE_DIR, "RealFullField"))
+    parser.add_argument("--pyrdown", type=int, default=1)
+    parser.add_argument("--prefetch", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2, help="decoding threads for prefetch")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.directory, "*.jpg")))
+    if not paths:
+        raise SystemExit("no images found")
+
+    pipe = GripPipeline(persistent=True)
+
+    def sequential(reduced):
+        for path in paths:
+            yield path, decodeFrame(path, args.pyrdown, reduced)
+
+    runs = [
+        ("pyrdown", lambda: sequential(False)),
+        ("pyrdown+prefetch", lambda: FrameLoader(paths, args.pyrdown, False, args.prefetch, args.workers)),
+        ("reduced", lambda: sequential(True)),
+        ("reduced+prefetch", lambda: FrameLoader(paths, args.pyrdown, True, args.prefetch, args.workers)),
+    ]
+    results = {}
+    print("%d frames from %s\n" % (len(paths), args.directory))
+    print("%-18s %9s" % ("loader", "ms/frame"))
+    for name, loader in runs:
+        results[name] = []
+        start = time.perf_counter()
+        for path, frame in loader():
+            height, width = frame.shape[:2]
+            pipe.poseEstimator = PoseEstimator(cameraMatrix(width, height), warmStart=False)
+            pipe.process(frame, horizontalRes=width)
+            results[name].append(result(pipe))
+        elapsed = time.perf_counter() - start
+        print("%-18s %9.3f" % (name, elapsed * 1000.0 / len(paths)))
+
+    found = moved = pose = 0
+    shifts = []
+    for (before, beforePose), (after, afterPose) in zip(results["pyrdown"], results["reduced+prefetch"]):
+        found += (before is None) == (after is None)
+        pose += beforePose == afterPose
+        if before is not None and after is not None:
+            shift = float(np.hypot(*(before - after)))
+            shifts.append(shift)
+            moved += shift > 1.0
+    print("\nreduced against pyrdown:")
+    print("same detection on %d/%d frames" % (found, len(paths)))
+    if shifts:
+        print("target center moved by %.3f px on average, more than 1 px on %d frames" % (np.mean(shifts), moved))
+    print("same pose found/not found on %d/%d frames" % (pose, len(paths)))
+
+
+if __name__ == "__main__":
+    main()
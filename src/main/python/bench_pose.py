@@ -0,0 +1,110 @@
+"""
+Pose stage benchmark: warm started vs cold solvePnP
+
+Finds the target's corners in every image of a set, then plays each one
+back as a burst of frames with a little pixel noise on the corners, the
+way a camera watching a target that barely moves sees it. Each burst is
+solved with a cold iterative solve on every frame, an iterative solve
+warm started from the last frame, and IPPE, and the latency, reprojection
+error and frame to frame jitter in distance of each are reported.
+
+Usage:
+    python bench_pose.py [image directory] [--burst N] [--noise PX] [--subpixel]
+"""
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from BoudingRectangle import GripPipeline
+from bench_stages import summarize
+from pose import PoseEstimator, cameraMatrix
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+
+METHODS = [
+    ("cold", dict(method="iterative", warmStart=False)),
+    ("warm", dict(method="iterative", warmStart=True)),
+    ("ippe", dict(method="ippe")),
+]
+
+
+def findCorners(paths, subpixel):
+    """
+    Returns:
+        the (8, 2) corners of the target in each image it was found in, and
+        the size of the images
+    """
+    pipe = GripPipeline(persistent=True)
+    found = []
+    shape = None
+    for path in paths:
+        frame = cv2.pyrDown(cv2.imread(path, cv2.IMREAD_UNCHANGED))
+        shape = frame.shape
+        pipe.process(frame, horizontalRes=frame.shape[1])
+        if pipe.visionPair is None:
+            continue
+        corners = pipe.visionPair.get_corner_points(subpixel=subpixel)
+        if all(c is not None for c in corners):
+            found.append(np.concatenate(corners))
+    return found, shape
+
+
+def runBursts(estimator, targets, burst, noise, seed=0):
+    """
+    Returns:
+        the solve times in ms, the reprojection errors, and the standard
+        deviation of the distance within each burst
+    """
+    random = np.random.RandomState(seed)
+    times, errors, jitter = [], [], []
+    for corners in targets:
+        estimator.reset()
+        distances = []
+        for _ in range(burst):
+            points = (corners + random.normal(0, noise, corners.shape)).astype(np.float32)
+            start = time.perf_counter()
+            pose = estimator.solve(points)
+            times.append((time.perf_counter() - start) * 1000.0)
+            if pose is not None:
+                errors.append(pose.error)
+                distances.append(pose.distance)
+        if len(distances) > 1:
+            jitter.append(float(np.std(distances)))
+    return times, errors, jitter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=os.path.join(IMAGE_DIR, "2019"))
+    parser.add_argument("--burst", type=int, default=60, help="frames to play each image back for")
+    parser.add_argument("--noise", type=float, default=0.3, help="standard deviation of the corner noise in pixels")
+    parser.add_argument("--subpixel", action="store_true", help="refine the corners with cornerSubPix")
+    args = parser.parse_args()
+
+    targets, shape = findCorners(sorted(glob.glob(os.path.join(args.directory, "*.jpg"))), args.subpixel)
+    if not targets:
+        raise SystemExit("no targets found")
+    camera = cameraMatrix(shape[1], shape[0])
+    print("%d targets at %dx%d, %d frames each\n" % (len(targets), shape[1], shape[0], args.burst))
+
+    print("%-6s %9s %9s %9s %9s %11s %11s %9s" % (
+        "solve", "mean ms", "p50 ms", "p95 ms", "p99 ms", "error px", "jitter in", "warm"))
+    for name, options in METHODS:
+        estimator = PoseEstimator(camera, **options)
+        # once through to warm up everything but the solver
+        runBursts(estimator, targets[:1], 5, args.noise)
+        estimator.solves = estimator.warmSolves = 0
+
+        times, errors, jitter = runBursts(estimator, targets, args.burst, args.noise)
+        s = summarize(times)
+        print("%-6s %9.4f %9.4f %9.4f %9.4f %11.3f %11.3f %8.0f%%" % (
+            name, s["mean_ms"], s["p50_ms"], s["p95_ms"], s["p99_ms"],
+            np.mean(errors), np.mean(jitter), 100.0 * estimator.warmSolves / max(estimator.solves, 1)))
+
+
+if __name__ == "__main__":
+    main()
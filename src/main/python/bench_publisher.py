@@ -0,0 +1,117 @@
+"""
+Result publisher benchmark
+
+Makes a VisionResult for every image in a set (with every target and the
+pose, like the runtime does) and reports:
+
+    pack       packResult, per record
+    unpack     unpackRecord, per record
+    publish    ResultPublisher.publish, the only part on the publish thread
+
+Then sends every result as one burst to a local ResultServer with each
+coalesce mode, and reports how many records and datagrams made it, and
+the time from capture to the record being received.
+
+Usage:
+    python bench_publisher.py [image directory] [--unix] [--repeats N]
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from BoudingRectangle import GripPipeline
+from frame_loader import FrameLoader
+from pose import PoseEstimator, cameraMatrix
+from publisher import COALESCE_MODES, RECORD, ResultPublisher, ResultServer, packResult, unpackRecord
+from runtime import Frame, VisionResult
+from tracking import TargetTracker
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+
+
+def makeResults(frames):
+    results = []
+    for number, frame in enumerate(frames):
+        height, width = frame.shape[:2]
+        pipe = GripPipeline()
+        pipe.poseEstimator = PoseEstimator(cameraMatrix(width, height), warmStart=False)
+        tracker = TargetTracker(pipe)
+        captured = time.monotonic()
+        target = tracker.process(frame)
+        results.append(VisionResult(Frame(number, captured, frame), target, time.monotonic(),
+                                    tracker.pose, tracker.targets))
+    return results
+
+
+def perRecord(function, items, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for item in items:
+            function(item)
+    return (time.perf_counter() - start) * 1e6 / (repeats * len(items))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=os.path.join(IMAGE_DIR, "2019"))
+    parser.add_argument("--unix", action="store_true", help="use a Unix socket instead of UDP on localhost")
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    names, frames = FrameLoader(sorted(glob.glob(os.path.join(args.directory, "*.jpg")))).frames()
+    if not frames:
+        raise SystemExit("no images found")
+    results = makeResults(frames)
+    records = [packResult(result) for result in results]
+
+    print("%d results, %d with a pose, %d byte records\n" % (
+        len(results), sum(1 for r in results if r.pose is not None), RECORD.size))
+    print("pack       %8.2f us" % perRecord(packResult, results, args.repeats))
+    print("unpack     %8.2f us" % perRecord(unpackRecord, records, args.repeats))
+
+    directory = tempfile.mkdtemp(prefix="publisher-")
+    address = "unix:" + os.path.join(directory, "server.sock") if args.unix else "udp:127.0.0.1:0"
+    server = ResultServer(address)
+    server.start()
+    if not args.unix:
+        address = "udp:127.0.0.1:%d" % server.address[1]
+
+    try:
+        publisher = ResultPublisher(address)
+        print("publish    %8.2f us" % perRecord(publisher.publish, results, args.repeats))
+        publisher.close()
+        time.sleep(0.2)
+
+        print("\n%-8s %9s %10s %11s %15s" % ("coalesce", "records", "datagrams", "dropped", "capture->recv ms"))
+        for mode in COALESCE_MODES:
+            server.received = server.datagrams = 0
+            server.latencies.clear()
+
+            # restamp the capture times, so the latency is from now
+            now = time.monotonic()
+            for result in results:
+                result.captureTime = result.processedTime = now
+
+            publisher = ResultPublisher(address, mode)
+            for result in results:
+                publisher.publish(result)
+            publisher.close()
+            time.sleep(0.2)
+
+            latency = np.median(server.latencies) * 1000.0 if server.latencies else float("nan")
+            print("%-8s %9d %10d %11d %15.3f" % (mode, server.received, server.datagrams, publisher.dropped, latency))
+    finally:
+        server.stop()
+        os.rmdir(directory)
+
+    print("\nlast table:")
+    for key, value in sorted(server.table.items()):
+        print("    %-22s %s" % (key, value))
+
+
+if __name__ == "__main__":
+    main()
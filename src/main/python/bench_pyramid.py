@@ -0,0 +1,143 @@
+"""
+Coarse to fine detection benchmark
+
+Runs three ways of finding the target's corners over an image set:
+
+    full     GripPipeline over the whole full resolution frame
+    coarse   GripPipeline over a pyrDown'd frame, corners scaled back up
+             (what the entry points do now)
+    pyramid  PyramidDetector: pairing on the pyrDown'd frame, corners
+             from the full resolution frame inside the tapes' windows
+
+and reports the latency of each, and how far the corners and the solved
+distance are from the full resolution ones. Frames where a method picked
+a different target than full resolution processing did are counted as
+mismatched and left out of the errors.
+
+Usage:
+    python bench_pyramid.py [image directory] [--scale 2] [--levels 1] [--repeats N]
+"""
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from BoudingRectangle import GripPipeline
+from bench_stages import summarize
+from pose import PoseEstimator, cameraMatrix
+from pyramid import PyramidDetector
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+
+METHODS = ["full", "coarse", "pyramid"]
+
+
+class FullDetector:
+    def __init__(self):
+        self.pipe = GripPipeline(persistent=True)
+
+    def process(self, frame):
+        self.pipe.process(frame, horizontalRes=frame.shape[1])
+        return self.pipe.visionPair
+
+    def corners(self, target):
+        return np.concatenate(target.get_corner_points())
+
+
+class CoarseDetector(FullDetector):
+    def __init__(self, levels):
+        FullDetector.__init__(self)
+        self.levels = levels
+        self.scale = 2 ** levels
+
+    def process(self, frame):
+        for _ in range(self.levels):
+            frame = cv2.pyrDown(frame)
+        return FullDetector.process(self, frame)
+
+    def corners(self, target):
+        # the middle of a coarse pixel is in the middle of the block of full resolution pixels it came from
+        return FullDetector.corners(self, target) * self.scale + (self.scale - 1) / 2.0
+
+
+class PyramidAdapter(FullDetector):
+    def __init__(self, levels):
+        self.detector = PyramidDetector(levels=levels)
+
+    def process(self, frame):
+        return self.detector.process(frame)
+
+
+def run(detector, frames, repeats):
+    """
+    Returns:
+        the latencies in ms, and the corners found in each frame (None where nothing was found)
+    """
+    times = []
+    corners = [None] * len(frames)
+    for _ in range(repeats):
+        for i, frame in enumerate(frames):
+            start = time.perf_counter()
+            target = detector.process(frame)
+            found = None
+            if target is not None and all(c is not None for c in target.get_corner_points()):
+                found = detector.corners(target)
+            times.append((time.perf_counter() - start) * 1000.0)
+            corners[i] = found
+    return times, corners
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=os.path.join(IMAGE_DIR, "2019"))
+    parser.add_argument("--scale", type=float, default=2.0, help="scale the images by this much first")
+    parser.add_argument("--levels", type=int, default=1, help="pyrDowns for the coarse pass")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    images = [cv2.imread(p, cv2.IMREAD_UNCHANGED) for p in sorted(glob.glob(os.path.join(args.directory, "*.jpg")))]
+    frames = [cv2.resize(i, None, fx=args.scale, fy=args.scale, interpolation=cv2.INTER_LINEAR)
+              for i in images if i is not None]
+    if not frames:
+        raise SystemExit("no images found")
+    height, width = frames[0].shape[:2]
+    estimator = PoseEstimator(cameraMatrix(width, height), warmStart=False)
+
+    detectors = {
+        "full": FullDetector(),
+        "coarse": CoarseDetector(args.levels),
+        "pyramid": PyramidAdapter(args.levels),
+    }
+    results = dict((name, run(detectors[name], frames, args.repeats)) for name in METHODS)
+    reference = results["full"][1]
+
+    print("%d frames at %dx%d, %d pyrDown level(s)\n" % (len(frames), width, height, args.levels))
+    print("%-8s %9s %9s %9s %7s %9s %11s %11s %11s" % (
+        "method", "mean ms", "p50 ms", "p95 ms", "found", "mismatch", "corner px", "corner max", "distance %"))
+    for name in METHODS:
+        times, corners = results[name]
+        s = summarize(times)
+        errors, distances = [], []
+        mismatched = 0
+        for mine, full in zip(corners, reference):
+            if mine is None or full is None:
+                continue
+            if np.linalg.norm(mine.mean(axis=0) - full.mean(axis=0)) > width / 20.0:
+                mismatched += 1
+                continue
+            errors.extend(np.linalg.norm(mine - full, axis=1))
+            a, b = estimator.solve(mine), estimator.solve(full)
+            if a is not None and b is not None:
+                distances.append(100.0 * abs(a.distance - b.distance) / b.distance)
+        found = sum(1 for c in corners if c is not None)
+        print("%-8s %9.3f %9.3f %9.3f %7d %9d %11.3f %11.3f %11.2f" % (
+            name, s["mean_ms"], s["p50_ms"], s["p95_ms"], found, mismatched,
+            np.mean(errors) if errors else float("nan"), np.max(errors) if errors else float("nan"),
+            np.mean(distances) if distances else float("nan")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Per stage latency benchmark
+
+Runs every stage of GripPipeline (threshold, findContours, filter, tape
+construction, pairing, corner finding, solvePnP) over the bundled image
+sets at several scales, with warmup passes first, and reports the
+p50/p95/p99 latency and frames per second of each stage and of the whole
+pipeline.
+
+A frame that fails a stage (e.g. pairing can't find a pair) is only
+counted in the stages it got through, so n differs between stages. The
+whole pipeline counts every frame, however far it got.
+
+Usage:
+    python bench_stages.py [--scales 0.5,1] [--repeats N] [--json results.json]
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from BoudingRectangle import GripPipeline
+from pose import PoseEstimator, cameraMatrix
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+IMAGE_SETS = ["2019", "RealFullField"]
+
+STAGES = ["threshold", "find_contours", "filter", "tapes", "pairing", "corners", "solvepnp"]
+
+def runFrame(pipe, frame, estimator, times):
+    """
+    Run every stage on one frame, appending how long each took in ms to times
+    """
+    def timed(name, fn):
+        start = time.perf_counter()
+        result = fn()
+        times[name].append((time.perf_counter() - start) * 1000.0)
+        return result
+
+    start = time.perf_counter()
+    try:
+        timed("threshold", lambda: pipe.threshold(frame))
+        timed("find_contours", pipe.find_contours)
+        timed("filter", pipe.filter_contours)
+        timed("tapes", lambda: pipe.make_tapes(frame))
+        timed("pairing", lambda: pipe.pair_tapes(frame.shape[1]))
+        if pipe.visionPair is None:
+            return
+
+        corners = timed("corners", pipe.visionPair.get_corner_points)
+        if any(c is None for c in corners):
+            return
+
+        imagePoints = np.concatenate(corners)
+        timed("solvepnp", lambda: estimator.solve(imagePoints))
+    finally:
+        # every frame, not only the ones that got all the way through
+        times["total"].append((time.perf_counter() - start) * 1000.0)
+
+
+def summarize(samples):
+    if not samples:
+        return {"n": 0}
+    samples = np.array(samples)
+    mean = float(samples.mean())
+    p50, p95, p99 = (float(v) for v in np.percentile(samples, [50, 95, 99]))
+    return {
+        "n": int(len(samples)),
+        "mean_ms": round(mean, 4),
+        "p50_ms": round(p50, 4),
+        "p95_ms": round(p95, 4),
+        "p99_ms": round(p99, 4),
+        "fps": round(1000.0 / mean, 1) if mean > 0 else None,
+    }
+
+
+def benchmark(frames, warmup, repeats):
+    """
+    Returns:
+        a dict of stage name to the summary of its latencies
+    """
+    pipe = GripPipeline(persistent=True)
+    height, width = frames[0].shape[:2]
+    estimator = PoseEstimator(cameraMatrix(width, height))
+
+    times = dict((name, []) for name in STAGES + ["total"])
+    scratch = dict((name, []) for name in STAGES + ["total"])
+
+    for _ in range(warmup):
+        for frame in frames:
+            runFrame(pipe, frame, estimator, scratch)
+    for _ in range(repeats):
+        for frame in frames:
+            runFrame(pipe, frame, estimator, times)
+
+    return dict((name, summarize(samples)) for name, samples in times.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sets", default=",".join(IMAGE_SETS), help="image directories under images/")
+    parser.add_argument("--scales", default="0.5,1", help="scales of the original images to run at")
+    parser.add_argument("--warmup", type=int, default=1, help="passes over the frames before measuring")
+    parser.add_argument("--repeats", type=int, default=3, help="passes over the frames to measure")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for imageSet in args.sets.split(","):
+        paths = sorted(glob.glob(os.path.join(IMAGE_DIR, imageSet, "*.jpg")))
+        images = [cv2.imread(p, cv2.IMREAD_UNCHANGED) for p in paths]
+        images = [i for i in images if i is not None]
+        if not images:
+            print("no images in %s" % imageSet)
+            continue
+
+        for scale in (float(s) for s in args.scales.split(",")):
+            frames = [cv2.resize(i, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) for i in images]
+            height, width = frames[0].shape[:2]
+            stages = benchmark(frames, args.warmup, args.repeats)
+            results.append({"set": imageSet, "scale": scale, "width": width, "height": height,
+                            "frames": len(frames), "stages": stages})
+
+            print("\n%s at %sx%s (%d frames)" % (imageSet, width, height, len(frames)))
+            print("%-14s %6s %9s %9s %9s %9s %9s" % ("stage", "n", "mean ms", "p50 ms", "p95 ms", "p99 ms", "fps"))
+            for name in STAGES + ["total"]:
+                s = stages[name]
+                if s["n"] == 0:
+                    print("%-14s %6d" % (name, 0))
+                    continue
+                print("%-14s %6d %9.3f %9.3f %9.3f %9.3f %9.1f" % (
+                    name, s["n"], s["mean_ms"], s["p50_ms"], s["p95_ms"], s["p99_ms"], s["fps"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+VisionTape/VisionTarget overhead benchmark
+
+Draws a frame with a grid of hundreds of small tipped strips, runs the
+pipeline up to the filter once, and then measures what it costs to turn
+the kept contours into tapes (make_tapes) and to read their geometry the
+way sorting and pairing do, per tape. Also reports how much memory each
+tape takes.
+
+Usage:
+    python bench_tapes.py [--counts 100,300,1000] [--repeats N]
+"""
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from BoudingRectangle import GripPipeline, VisionTarget
+
+
+def gridFrame(count, spacing=24):
+    """
+    A frame with count strips on it, alternately tipped left and right
+    """
+    columns = int(np.ceil(np.sqrt(count)))
+    rows = int(np.ceil(count / float(columns)))
+    image = np.full((rows * spacing + spacing, columns * spacing + spacing, 3), 20, dtype=np.uint8)
+    for i in range(count):
+        center = ((i % columns + 1) * spacing, (i // columns + 1) * spacing)
+        angle = 14.5 if i % 2 else -14.5
+        box = cv2.boxPoints((center, (6, 16), angle))
+        cv2.fillConvexPoly(image, box.astype(np.int32), (0, 255, 0))
+    return image
+
+
+def readGeometry(tapes):
+    """
+    Read everything sorting, pairing and annotating ask each tape for, a
+    few times over like they do
+    """
+    for _ in range(3):
+        for tape in tapes:
+            tape.get_area()
+            tape.get_center()
+            tape.get_angle()
+            tape.get_direction()
+            tape.get_x_center_coordinate()
+
+
+def readTargets(tapes):
+    targets = [VisionTarget([tapes[i], tapes[i + 1]]) for i in range(0, len(tapes) - 1, 2)]
+    for _ in range(3):
+        for target in targets:
+            target.get_area()
+            target.get_center()
+            target.get_center_offset(320)
+    return targets
+
+
+def timeIt(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counts", default="100,300,1000", help="numbers of strips to draw")
+    parser.add_argument("--repeats", type=int, default=20, help="runs of each measurement, the best one is kept")
+    args = parser.parse_args()
+
+    print("%6s %14s %14s %14s %14s %12s" % (
+        "tapes", "make us/tape", "read us/tape", "pair us/tgt", "corner us/tape", "bytes/tape"))
+    for count in (int(c) for c in args.counts.split(",")):
+        frame = gridFrame(count)
+        pipe = GripPipeline()
+        pipe.threshold(frame)
+        pipe.find_contours()
+        pipe.filter_contours()
+        # the rect column is lazy, work it out once so only the tapes get timed
+        pipe.contour_features.rect
+
+        make = timeIt(lambda: pipe.make_tapes(frame), args.repeats)
+        tapes = pipe.make_tapes(frame)
+        n = len(tapes)
+        if n == 0:
+            print("%6d no tapes found" % count)
+            continue
+
+        read = timeIt(lambda: readGeometry(tapes), args.repeats)
+        pair = timeIt(lambda: readTargets(tapes), args.repeats)
+        # the corners are cached on the tape, so time them on fresh tapes
+        corners = timeIt(lambda: [t.find_corner_points() for t in pipe.make_tapes(frame)], args.repeats) - make
+
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        kept = pipe.make_tapes(frame)
+        readGeometry(kept)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+        print("%6d %14.3f %14.3f %14.3f %14.3f %12.0f" % (
+            n, make * 1e6 / n, read * 1e6 / n, pair * 1e6 / max(n // 2, 1),
+            corners * 1e6 / n, allocated / float(n)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Threshold engine benchmark
+
+Compares the HSV threshold (cvtColor + inRange) against the LutThreshold
+engine at 320x240, 640x480 and 1280x720, and checks that both produce
+exactly the same mask on every frame.
+
+Usage:
+    python bench_threshold.py [image directory] [--repeats N]
+"""
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from lut_threshold import LutThreshold
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+RESOLUTIONS = [(320, 240), (640, 480), (1280, 720)]
+
+# the same thresholds as GripPipeline
+HUE = [15.9558030341169, 137.8198178573477]
+SAT = [65.519019296701, 255.0]
+VAL = [69.45015658363164, 255.0]
+
+
+def hsvThreshold(frame, hsv, mask):
+    cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=hsv)
+    return cv2.inRange(hsv, (HUE[0], SAT[0], VAL[0]), (HUE[1], SAT[1], VAL[1]), dst=mask)
+
+
+def timeIt(fn, frames, repeats):
+    """
+    Returns:
+        the mean time in milliseconds to run fn on one frame
+    """
+    for frame in frames[:3]:
+        fn(frame)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for frame in frames:
+            fn(frame)
+    return (time.perf_counter() - start) * 1000.0 / (repeats * len(frames))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=os.path.join(IMAGE_DIR, "RealFullField"))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=50, help="max number of images to use")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.directory, "*.jpg")))[:args.limit]
+    images = [cv2.imread(p, cv2.IMREAD_UNCHANGED) for p in paths]
+    if not images:
+        raise SystemExit("no images in %s" % args.directory)
+
+    start = time.perf_counter()
+    packed = LutThreshold(HUE, SAT, VAL)
+    print("table build: %.1f ms" % ((time.perf_counter() - start) * 1000.0))
+    unpacked = LutThreshold(HUE, SAT, VAL, packed=False)
+
+    print("%-10s %10s %10s %10s %8s" % ("resolution", "hsv ms", "lut ms", "lut8 ms", "match"))
+    for width, height in RESOLUTIONS:
+        frames = [cv2.resize(img, (width, height)) for img in images]
+        hsv = np.empty((height, width, 3), dtype=np.uint8)
+        mask = np.empty((height, width), dtype=np.uint8)
+
+        match = all(np.array_equal(hsvThreshold(f, hsv, mask), packed.apply(f))
+                    and np.array_equal(mask, unpacked.apply(f)) for f in frames)
+
+        hsvMs = timeIt(lambda f: hsvThreshold(f, hsv, mask), frames, args.repeats)
+        lutMs = timeIt(lambda f: packed.apply(f, mask), frames, args.repeats)
+        lut8Ms = timeIt(lambda f: unpacked.apply(f, mask), frames, args.repeats)
+
+        print("%-10s %10.3f %10.3f %10.3f %8s" % (
+            "%sx%s" % (width, height), hsvMs, lutMs, lut8Ms, "yes" if match else "NO"))
+
+
+if __name__ == "__main__":
+    main()
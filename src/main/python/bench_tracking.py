@@ -0,0 +1,65 @@
+"""
+Tracking benchmark
+
+Runs the same frames through a GripPipeline over the whole frame and
+through a TargetTracker, and compares the time per frame and how much of
+the frame the tracker actually searched.
+
+Usage:
+    python bench_tracking.py [image] [--frames N] [--scale S]
+"""
+import argparse
+import os
+import time
+
+import cv2
+
+from BoudingRectangle import GripPipeline
+from tracking import TargetTracker
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+DEFAULT_IMAGE = os.path.join(IMAGE_DIR, "2019", "LoadingStraightDark60in.jpg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image", nargs="?", default=DEFAULT_IMAGE)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--scale", type=float, default=2.0, help="resize the image by this much first")
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise SystemExit("could not read %s" % args.image)
+    frame = cv2.resize(image, None, fx=args.scale, fy=args.scale)
+    print("frame: %sx%s" % (frame.shape[1], frame.shape[0]))
+
+    pipe = GripPipeline(persistent=True)
+    pipe.process(frame, horizontalRes=frame.shape[1])
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        pipe.process(frame, horizontalRes=frame.shape[1])
+    fullMs = (time.perf_counter() - start) * 1000.0 / args.frames
+
+    tracker = TargetTracker(GripPipeline(persistent=True))
+    tracker.process(frame)
+    searched = 0.0
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        tracker.process(frame)
+        if tracker.roi is None:
+            searched += 1.0
+        else:
+            x, y, x2, y2 = tracker.roi
+            searched += (x2 - x) * (y2 - y) / float(frame.shape[0] * frame.shape[1])
+    trackMs = (time.perf_counter() - start) * 1000.0 / args.frames
+
+    print("full frame: %.3f ms/frame" % fullMs)
+    print("tracking:   %.3f ms/frame (%.1fx), %.1f%% of the frame searched on average" % (
+        trackMs, fullMs / trackMs, 100.0 * searched / args.frames))
+    print("full scans: %d, window scans: %d, window misses: %d" % (
+        tracker.fullScans, tracker.roiScans, tracker.roiMisses))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import cv2
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    pass
+
+
+def normalize_rect_angles(rects):
+    """
+    Rotate min area rectangles so their angle is in [-45, 45], swapping
+    width and height for every quarter turn. This is the vectorized form
+    of the loops in VisionTape.determine_direction
+
+    Args:
+        rects: a float array of shape (n, 5) in the form cx, cy, w, h, angle.
+            Modified in place.
+
+    Returns:
+        the same array
+    """
+    angle = rects[:, 4]
+    turns = np.zeros(len(rects), dtype=np.int64)
+    high = angle > 45
+    low = angle < -45
+    turns[high] = -np.ceil((angle[high] - 45) / 90.0)
+    turns[low] = np.ceil((-45 - angle[low]) / 90.0)
+    rects[:, 4] = angle + 90 * turns
+
+    swap = (turns % 2) == 1
+    rects[swap, 2], rects[swap, 3] = rects[swap, 3], rects[swap, 2]
+    return rects
+
+
+
+def quadrant_corners(contour):
+    """
+    Find the outside corners of a contour: in each quadrant around its
+    centroid, the point that's farthest from the centroid. Points that
+    are right on the centroid's row or column don't count.
+
+    Args:
+        contour: an (n, 1, 2) contour from findContours
+
+    Returns:
+        a (4, 2) float32 array of the corners in the order tl, tr, br, bl,
+        or None if one of the quadrants is empty
+    """
+    M = cv2.moments(contour)
+    if M['m00'] == 0:
+        return None
+    cx = int(M['m10']/M['m00'])
+    cy = int(M['m01']/M['m00'])
+
+    points = contour.reshape(-1, 2)
+    dx = points[:, 0].astype(np.int64) - cx
+    dy = points[:, 1].astype(np.int64) - cy
+    left, right = dx < 0, dx > 0
+    top, bottom = dy < 0, dy > 0
+
+    # one row per quadrant, with -1 for the points outside of it
+    masks = np.stack([left & top, right & top, right & bottom, left & bottom])
+    distance = np.where(masks, dx * dx + dy * dy, -1)
+    farthest = distance.argmax(axis=1)
+    if (distance[np.arange(4), farthest] < 0).any():
+        return None
+
+    return points[farthest].astype(np.float32)
+
+class ContourFeatures:
+    """
+    A struct-of-arrays table of per contour features for one frame.
+
+    The cheap columns (bounding box, area, perimeter, vertex count) are
+    computed for every contour at once from a single flattened point
+    array. The columns that still need a per contour OpenCV call (convex
+    hull area and min area rect) are only computed when first read, so
+    they only ever run on the rows that survived the cheap masks.
+
+    Columns:
+        bbox: (n, 4) int32 array in the form x, y, w, h
+        area: (n,) float64 contour area
+        perimeter: (n,) float64 closed arc length
+        vertices: (n,) int64 number of points in the contour
+        hull_area: (n,) float64 area of the convex hull
+        rect: (n, 5) float64 min area rect in the form cx, cy, w, h, angle,
+            with the angle normalized to [-45, 45]
+    """
+
+    def __init__(self, contours, bbox=None, area=None, perimeter=None, vertices=None,
+                 hull_area=None, rect=None):
+        self.contours = list(contours)
+        self._hull_area = hull_area
+        self._rect = rect
+
+        if bbox is not None:
+            self.bbox = bbox
+            self.area = area
+            self.perimeter = perimeter
+            self.vertices = vertices
+            return
+
+        n = len(self.contours)
+        self.vertices = np.array([len(c) for c in self.contours], dtype=np.int64)
+
+        if n == 0:
+            self.bbox = np.zeros((0, 4), dtype=np.int32)
+            self.area = np.zeros(0)
+            self.perimeter = np.zeros(0)
+            return
+
+        pts = np.concatenate(self.contours).reshape(-1, 2).astype(np.int64)
+        ends = np.cumsum(self.vertices)
+        starts = ends - self.vertices
+        xs = pts[:, 0]
+        ys = pts[:, 1]
+
+        # bounding box, inclusive of the last pixel like cv2.boundingRect
+        x0 = np.minimum.reduceat(xs, starts)
+        y0 = np.minimum.reduceat(ys, starts)
+        x1 = np.maximum.reduceat(xs, starts)
+        y1 = np.maximum.reduceat(ys, starts)
+        self.bbox = np.stack([x0, y0, x1 - x0 + 1, y1 - y0 + 1], axis=1).astype(np.int32)
+
+        # index of the next point in each closed contour
+        nxt = np.arange(1, len(pts) + 1)
+        nxt[ends - 1] = starts
+
+        # shoelace formula, same as cv2.contourArea(contour, oriented=False)
+        cross = xs * ys[nxt] - xs[nxt] * ys
+        self.area = np.abs(np.add.reduceat(cross, starts)) / 2.0
+
+        dx = (xs[nxt] - xs).astype(np.float64)
+        dy = (ys[nxt] - ys).astype(np.float64)
+        self.perimeter = np.add.reduceat(np.sqrt(dx * dx + dy * dy), starts)
+
+    def __len__(self):
+        return len(self.contours)
+
+    @property
+    def hull_area(self):
+        if self._hull_area is None:
+            self._hull_area = np.array(
+                [cv2.contourArea(cv2.convexHull(c)) for c in self.contours], dtype=np.float64)
+        return self._hull_area
+
+    @property
+    def rect(self):
+        if self._rect is None:
+            rects = np.zeros((len(self.contours), 5), dtype=np.float64)
+            for i, c in enumerate(self.contours):
+                (cx, cy), (w, h), angle = cv2.minAreaRect(c)
+                rects[i] = (cx, cy, w, h, angle)
+            self._rect = normalize_rect_angles(rects)
+        return self._rect
+
+    def min_area_rects(self):
+        """
+        Get every row of the rect column in the tuple form returned by
+        cv2.minAreaRect, converted to plain floats in one go
+        """
+        return [((cx, cy), [w, h], angle) for cx, cy, w, h, angle in self.rect.tolist()]
+
+    def take(self, indices):
+        """
+        Get a new table holding only some of the rows of this one. Columns
+        that have already been computed are carried over.
+
+        Args:
+            indices: a boolean mask or an array of row indices
+
+        Returns:
+            a new ContourFeatures
+        """
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+
+        return ContourFeatures(
+            [self.contours[i] for i in indices],
+            bbox=self.bbox[indices],
+            area=self.area[indices],
+            perimeter=self.perimeter[indices],
+            vertices=self.vertices[indices],
+            hull_area=None if self._hull_area is None else self._hull_area[indices],
+            rect=None if self._rect is None else self._rect[indices])
+
+    def filter(self, min_area, min_perimeter, min_width, max_width,
+               min_height, max_height, solidity, max_vertex_count, min_vertex_count,
+               min_ratio, max_ratio):
+        """Filters out contours that do not meet certain criteria, with the
+        same semantics as the GRIP filter contours step.
+
+        Returns:
+            A ContourFeatures with the rows that were kept.
+        """
+        w = self.bbox[:, 2]
+        h = self.bbox[:, 3]
+        ratio = w / h.astype(np.float64)
+
+        keep = ((w >= min_width) & (w <= max_width)
+                & (h >= min_height) & (h <= max_height)
+                & (self.area >= min_area)
+                & (self.perimeter >= min_perimeter)
+                & (self.vertices >= min_vertex_count) & (self.vertices <= max_vertex_count)
+                & (ratio >= min_ratio) & (ratio <= max_ratio))
+
+        # the hull is the only expensive check, so only run it on what's left
+        kept = self.take(keep)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            solid = 100 * kept.area / kept.hull_area
+        return kept.take((solid >= solidity[0]) & (solid <= solidity[1]))
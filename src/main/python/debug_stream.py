@@ -0,0 +1,256 @@
+"""
+MJPEG debug stream: what the detector sees, over HTTP
+
+The only other way to look at the detector is GripPipeline's display,
+which draws and calls cv2.imshow in the processing loop, so it needs a
+display and holds up every frame. DebugStream serves annotated frames
+as an MJPEG stream that any browser (or the driver station dashboard)
+can open instead:
+
+    http://host:5801/            the stream (or /stream.mjpg)
+    http://host:5801/frame.jpg   just the next frame
+
+Nothing here runs on the processing thread. The runtime offers each
+result (with its frame) from the publish thread, and offer only keeps
+it if somebody is watching and it's time for the next debug frame, at
+fps. Scaling down, drawing and JPEG encoding happen on the stream's own
+worker thread, which only ever holds the newest offered frame. With no
+clients connected nothing is encoded at all.
+
+Usage:
+    python runtime.py --camera 0 --stream 5801
+    python runtime.py --images ../../../images/2019 --stream 5801 --stream-fps 5 --stream-scale 0.5
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+from runtime import LatestSlot
+
+try:
+    from cv2 import cv2
+except ImportError:
+    pass
+
+BOUNDARY = b"frame"
+
+
+def annotateResult(image, result, scale=1.0):
+    """
+    Draw the targets of a runtime.VisionResult on an image, in place
+
+    Args:
+        image: the frame, already scaled by scale
+        result: the VisionResult for the frame
+        scale: how much the frame was scaled from the one that was processed
+    """
+    def point(p):
+        return (int(round(p[0] * scale)), int(round(p[1] * scale)))
+
+    for i, target in enumerate(result.targets):
+        # the tracked target in red, any others in blue
+        color = (0, 0, 255) if i == 0 and result.target is not None else (255, 0, 0)
+        left, right = target.individualTapes
+        for tape in target.individualTapes:
+            cv2.drawContours(image, [(tape.contour * scale).astype(tape.contour.dtype)], 0, color)
+        cv2.line(image, point(left.get_center()), point(right.get_center()), (255, 255, 0))
+        cv2.circle(image, point(target.get_center()), 3, color, -1)
+
+    text = "%d" % result.frameNumber
+    if result.pose is not None:
+        text += "  %.0f in  yaw %.1f" % (result.pose.distance, result.pose.yaw)
+    cv2.putText(image, text, (4, image.shape[0] - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255))
+    return image
+
+
+class DebugStream:
+    """
+    Serves annotated frames as MJPEG over HTTP, encoded off the processing
+    thread, at a lower frame rate and resolution, and only while a client
+    is connected. Can be used as the debug stream of a VisionRuntime.
+    """
+
+    def __init__(self, port=5801, host="", fps=10.0, scale=0.5, quality=70):
+        """
+        Args:
+            port: the port to serve on, 0 for any free port (see address)
+            host: the interface to serve on, all of them by default
+            fps: the most debug frames to encode a second
+            scale: what to scale frames by before drawing and encoding
+            quality: the JPEG quality, from 0 to 100
+        """
+        self.period = 1.0 / fps if fps else 0.0
+        self.scale = scale
+        self.quality = quality
+
+        self.clients = 0
+        self.offered = 0
+        self.encoded = 0
+        self.served = 0
+
+        self.jpeg = None
+        self.sequence = 0
+
+        self.__slot = LatestSlot()
+        self.__condition = threading.Condition()
+        self.__nextTime = 0.0
+        self.__running = False
+        self.__worker = None
+        self.__serverThread = None
+
+        self.server = ThreadingHTTPServer((host, port), _StreamHandler)
+        self.server.daemon_threads = True
+        self.server.stream = self
+        self.address = self.server.server_address
+
+    def start(self):
+        self.__running = True
+        self.__worker = threading.Thread(target=self.__encode, name="debug encode", daemon=True)
+        self.__serverThread = threading.Thread(target=self.server.serve_forever, name="debug server", daemon=True)
+        self.__worker.start()
+        self.__serverThread.start()
+
+    def stop(self):
+        self.__running = False
+        self.__slot.close()
+        with self.__condition:
+            self.__condition.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+        self.__worker.join()
+        self.__serverThread.join()
+
+    def offer(self, image, result):
+        """
+        Hand over a processed frame and its result. Only keeps them if a
+        client is connected and it's time for the next debug frame, and
+        never waits on the encoding.
+
+        Returns:
+            True if the frame will be encoded
+        """
+        self.offered += 1
+        if not self.clients:
+            return False
+        now = time.monotonic()
+        if now < self.__nextTime:
+            return False
+        # keep to fps on average, without a burst after nobody was watching
+        self.__nextTime = max(self.__nextTime, now - self.period) + self.period
+        self.__slot.put((image, result))
+        return True
+
+    def wait_frame(self, sequence, timeout=None):
+        """
+        Wait for a JPEG newer than sequence
+
+        Returns:
+            the JPEG bytes and its sequence, or None and sequence if the
+            timeout ran out or the stream stopped
+        """
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: self.sequence > sequence or not self.__running, timeout):
+                return None, sequence
+            if self.sequence <= sequence:
+                return None, sequence
+            return self.jpeg, self.sequence
+
+    @property
+    def running(self):
+        return self.__running
+
+    def stats(self):
+        """
+        Returns:
+            a dict of how many frames were offered, encoded, dropped waiting
+            for the encoder and sent to clients
+        """
+        return {
+            "offered": self.offered,
+            "encoded": self.encoded,
+            "dropped_before_encode": self.__slot.dropped,
+            "served": self.served,
+            "clients": self.clients,
+        }
+
+    def connected(self, change):
+        with self.__condition:
+            self.clients += change
+
+    def __encode(self):
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), int(self.quality)]
+        while True:
+            item = self.__slot.get()
+            if item is None:
+                break
+            image, result = item
+            if self.scale != 1.0:
+                image = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            else:
+                # the source may hand out the same array again, so never draw on it
+                image = image.copy()
+            annotateResult(image, result, self.scale)
+            ok, jpeg = cv2.imencode(".jpg", image, params)
+            if not ok:
+                continue
+            with self.__condition:
+                self.jpeg = jpeg.tobytes()
+                self.sequence += 1
+                self.encoded += 1
+                self.__condition.notify_all()
+
+
+class _StreamHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        stream = self.server.stream
+        path = self.path.split("?")[0]
+        if path not in ("/", "/stream.mjpg", "/frame.jpg"):
+            self.send_error(404)
+            return
+
+        stream.connected(1)
+        try:
+            if path == "/frame.jpg":
+                self.__frame(stream)
+            else:
+                self.__stream(stream)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            stream.connected(-1)
+
+    def __frame(self, stream):
+        jpeg = None
+        while jpeg is None and stream.running:
+            jpeg, _ = stream.wait_frame(stream.sequence, 1.0)
+        if jpeg is None:
+            self.send_error(503)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(jpeg)))
+        self.end_headers()
+        self.wfile.write(jpeg)
+        stream.served += 1
+
+    def __stream(self, stream):
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=" + BOUNDARY.decode())
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        sequence = stream.sequence
+        while stream.running:
+            jpeg, sequence = stream.wait_frame(sequence, 1.0)
+            if jpeg is None:
+                continue
+            self.wfile.write(b"--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % (BOUNDARY, len(jpeg)))
+            self.wfile.write(jpeg)
+            self.wfile.write(b"\r\n")
+            stream.served += 1
+
+    def log_message(self, format, *args):
+        # a request per client, not per frame, but still nothing anybody needs to see
+        pass
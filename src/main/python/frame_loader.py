@@ -0,0 +1,142 @@
+"""
+Shared image loading for the offline tools
+
+Every tool works on frames that are pyrDown'd one or more times. For a
+JPEG that's a lot of wasted work: the whole image is decoded at full size
+and then blurred and downsampled. libjpeg can decode straight to 1/2, 1/4
+or 1/8 size by dropping DCT coefficients, which OpenCV exposes as the
+IMREAD_REDUCED_COLOR_* modes. With reduced=True decodeFrame uses those
+for JPEGs and only pyrDowns whatever scale is left over (or the whole way
+for other formats).
+
+It's off by default because the reduced decode isn't the same as
+pyrDown, and in cluttered frames that's enough to change which pair of
+tapes wins. bench_loader.py checks this: the labeled 2019 images agree
+on 47/49 frames, but RealFullField only on 317/393, which is about what
+resizing with INTER_AREA instead of pyrDown gets too (313/393). Turn it
+on when decode time matters more than matching the pyrDown path exactly.
+
+FrameLoader decodes on a few threads, the next few frames while the
+current one is being processed. cv2 lets go of the GIL while decoding,
+so this overlaps properly.
+"""
+import collections
+import os
+
+import cv2
+import numpy as np
+
+# pyrDown count to the matching reduced decode
+REDUCED_MODES = {
+    1: cv2.IMREAD_REDUCED_COLOR_2,
+    2: cv2.IMREAD_REDUCED_COLOR_4,
+    3: cv2.IMREAD_REDUCED_COLOR_8,
+}
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+JPEG_MAGIC = b"\xff\xd8"
+
+
+def reducedMode(pyrDownCount):
+    """
+    Returns:
+        the imread flag that does as much of pyrDownCount as possible, and how many pyrDowns are left to do
+    """
+    scale = min(pyrDownCount, max(REDUCED_MODES))
+    if scale <= 0:
+        return cv2.IMREAD_UNCHANGED, pyrDownCount
+    return REDUCED_MODES[scale], pyrDownCount - scale
+
+
+def decodeFrame(path, pyrDownCount=1, reduced=False):
+    """
+    Read an image and scale it down pyrDownCount times
+
+    Args:
+        path: the image file
+        pyrDownCount: how many times to halve the image
+        reduced: decode JPEGs at reduced size instead of pyrDown'ing them, see above
+
+    Returns:
+        the frame, or None if it couldn't be read
+    """
+    flags, remaining = cv2.IMREAD_UNCHANGED, pyrDownCount
+    if reduced and path.lower().endswith(JPEG_EXTENSIONS):
+        flags, remaining = reducedMode(pyrDownCount)
+
+    frame = cv2.imread(path, flags)
+    if frame is None:
+        return None
+    for _ in range(remaining):
+        frame = cv2.pyrDown(frame)
+    return frame
+
+
+def decodeBytes(content, pyrDownCount=1, reduced=False):
+    """
+    The same as decodeFrame, for the contents of an image file
+    """
+    flags, remaining = cv2.IMREAD_UNCHANGED, pyrDownCount
+    if reduced and content[:2] == JPEG_MAGIC:
+        flags, remaining = reducedMode(pyrDownCount)
+
+    frame = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), flags)
+    if frame is None:
+        return None
+    for _ in range(remaining):
+        frame = cv2.pyrDown(frame)
+    return frame
+
+
+class FrameLoader:
+    """
+    Iterates over (path, frame) for a list of image paths, in order,
+    decoding up to prefetch frames ahead on a thread pool. The frame is
+    None for images that couldn't be read.
+    """
+
+    def __init__(self, paths, pyrDownCount=1, reduced=False, prefetch=4, workers=2):
+        self.paths = list(paths)
+        self.pyrDownCount = pyrDownCount
+        self.reduced = reduced
+        self.prefetch = max(prefetch, 1)
+        self.workers = workers
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        # not imported up top, since most things that import this only use decodeFrame
+        from concurrent.futures import ThreadPoolExecutor
+
+        pending = collections.deque()
+        paths = iter(self.paths)
+        executor = ThreadPoolExecutor(self.workers)
+        try:
+            for path in paths:
+                pending.append((path, executor.submit(decodeFrame, path, self.pyrDownCount, self.reduced)))
+                if len(pending) >= self.prefetch:
+                    break
+
+            while pending:
+                path, future = pending.popleft()
+                # keep the queue full before waiting on the oldest frame
+                nextPath = next(paths, None)
+                if nextPath is not None:
+                    pending.append((nextPath, executor.submit(decodeFrame, nextPath, self.pyrDownCount,
+                                                              self.reduced)))
+                yield path, future.result()
+        finally:
+            # if the loop was left early, don't decode the rest
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def frames(self):
+        """
+        Returns:
+            the base names and frames of every image that could be read
+        """
+        names, frames = [], []
+        for path, frame in self:
+            if frame is not None:
+                names.append(os.path.basename(path))
+                frames.append(frame)
+        return names, frames
@@ -0,0 +1,189 @@
+"""
+Decode once frame store for datasets
+
+Decodes (and pyrDown's) a set of images once and keeps the frames in one
+flat uint8 file, frames.u8, next to an index.json with the file name,
+shape, offset and timestamp (the file's modification time) of each one.
+Opening a store memory maps frames.u8 read only, so getting a frame is a
+view of the mapped file, with no decoding and no copy. Every process that
+opens the same store shares its pages through the page cache, so a pool
+of workers doesn't have a copy of the dataset each.
+
+A store is only valid for the pyrDown count (and decode) it was built
+with, which are in the index. Frames are looked up by the base name of
+their image, the same as the labels of tune_threshold.py, so the images
+in a store all need different names.
+
+Usage:
+    python frame_store.py ../../../images/RealFullField -o /tmp/realfullfield.frames
+    python batch.py --frames /tmp/realfullfield.frames -o results.csv
+    python tune_threshold.py --frames /tmp/realfullfield.frames
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from frame_loader import FrameLoader
+
+INDEX_FILE = "index.json"
+DATA_FILE = "frames.u8"
+
+# frames start on a cache line
+ALIGNMENT = 64
+
+
+def isFrameStore(directory):
+    return os.path.isfile(os.path.join(directory, INDEX_FILE))
+
+
+class FrameStore:
+    """
+    A read only, memory mapped set of decoded frames. Frames can be looked
+    up by position or by file name.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.pyrDownCount = index["pyrdown"]
+        self.reduced = index.get("reduced", False)
+        self.entries = index["frames"]
+        self.names = [entry["file"] for entry in self.entries]
+        self.timestamps = [entry["timestamp"] for entry in self.entries]
+        self.positions = dict((name, i) for i, name in enumerate(self.names))
+
+        if index["bytes"] > 0:
+            self.data = np.memmap(os.path.join(directory, DATA_FILE), dtype=np.uint8, mode="r",
+                                  shape=(index["bytes"],))
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, i):
+        """
+        Returns:
+            a read only view of the i-th frame
+        """
+        entry = self.entries[i]
+        shape = tuple(entry["shape"])
+        size = int(np.prod(shape))
+        return self.data[entry["offset"]:entry["offset"] + size].reshape(shape)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def get(self, name):
+        """
+        Get a frame by the base name of the image it came from
+
+        Returns:
+            a read only view of the frame, or None if it isn't in the store
+        """
+        i = self.positions.get(name)
+        return None if i is None else self[i]
+
+    @staticmethod
+    def build(paths, directory, pyrDownCount=1, reduced=False):
+        """
+        Decode every image in paths into a new store in directory, with a
+        FrameLoader (reduced is passed on to it). Images that can't be read
+        are left out. Raises ValueError if two of the images have the same
+        base name, since only one of them could be looked up by it.
+
+        Returns:
+            the FrameStore
+        """
+        seen = {}
+        for path in paths:
+            name = os.path.basename(path)
+            if name in seen:
+                raise ValueError("%s and %s have the same name, a frame store can only hold one of them"
+                                 % (seen[name], path))
+            seen[name] = path
+
+        def decoded():
+            for path, frame in FrameLoader(paths, pyrDownCount, reduced):
+                if frame is not None:
+                    yield os.path.basename(path), os.path.getmtime(path), frame
+
+        return FrameStore.write(decoded(), directory, pyrDownCount, reduced)
+
+    @staticmethod
+    def write(frames, directory, pyrDownCount=1, reduced=False):
+        """
+        Write frames that are already decoded into a new store in directory
+
+        Args:
+            frames: (name, timestamp, frame) for every frame, frames can be
+                any uint8 array, e.g. the HSV versions of another store's
+            pyrDownCount, reduced: what to record in the index about how
+                the frames were decoded
+
+        Returns:
+            the FrameStore
+        """
+        os.makedirs(directory, exist_ok=True)
+        # the index goes last, so a store that failed halfway through isn't mistaken for a good one
+        if isFrameStore(directory):
+            os.remove(os.path.join(directory, INDEX_FILE))
+
+        entries = []
+        offset = 0
+        # write to the data file as we go so the whole dataset is never in memory
+        with open(os.path.join(directory, DATA_FILE), "wb") as f:
+            for name, timestamp, frame in frames:
+                frame = np.ascontiguousarray(frame)
+                padding = -offset % ALIGNMENT
+                f.write(b"\0" * padding)
+                offset += padding
+                f.write(frame.data)
+                entries.append({
+                    "file": name,
+                    "shape": list(frame.shape),
+                    "offset": offset,
+                    "timestamp": timestamp,
+                })
+                offset += frame.nbytes
+
+        index = {"pyrdown": pyrDownCount, "reduced": reduced, "opencv": cv2.__version__,
+                 "bytes": offset, "frames": entries}
+        with open(os.path.join(directory, INDEX_FILE), "w") as f:
+            json.dump(index, f)
+        return FrameStore(directory)
+
+
+def main():
+    # batch uses frame stores, so it can't be imported until this module is
+    from batch import findImages
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="image directories, files or globs")
+    parser.add_argument("-o", "--output", required=True, help="the directory to build the store in")
+    parser.add_argument("--pyrdown", type=int, default=1, help="times to pyrDown each image first")
+    parser.add_argument("--reduced", action="store_true", help="decode JPEGs at reduced size, see frame_loader.py")
+    args = parser.parse_args()
+
+    paths = findImages(args.inputs)
+    if not paths:
+        raise SystemExit("no images found")
+
+    start = time.perf_counter()
+    try:
+        store = FrameStore.build(paths, args.output, args.pyrdown, args.reduced)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    elapsed = time.perf_counter() - start
+    print("%d frames, %.1f MB, in %.2f s" % (len(store), store.data.nbytes / 1e6, elapsed), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Compile a GRIP project (pipeline.grip) into an execution plan
+
+pipeline.grip is where the thresholds and filters are tuned, in GRIP,
+but the generated code and GripPipeline's defaults are copies of what
+was in it at the time. This reads the .grip file itself, so a change
+there is picked up without touching any code:
+
+    gripConfig(path)            the settings, for GripPipeline.set_config
+    CompiledPipeline.load(path) the steps compiled into a plan
+
+Compiling a plan:
+
+    - checks that the steps are a chain of steps it knows, from the
+      image source to the last step, and raises ValueError otherwise
+    - fuses HSV Threshold and Find Contours into one stage, the mask
+      goes from a reused buffer straight into findContours
+    - leaves out checks in Filter Contours that can't filter anything
+      with the settings in the file, e.g. the convex hull for a
+      solidity range of [0, 100]
+    - only keeps the outputs that are asked for (the last step's by
+      default), nothing else is held on to between frames
+
+processCompiled runs a plan into a GripPipeline and carries on from
+there (tapes, pairing, pose), the same as stage_cache.processCached.
+
+Usage:
+    python grip_plan.py [pipeline.grip]
+"""
+import argparse
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+
+import cv2
+import numpy as np
+
+from contour_features import ContourFeatures
+
+DEFAULT_GRIP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "java", "org", "team5940",
+                            "pantry", "vision", "pipeline.grip")
+
+# the GRIP steps this understands, and the GripPipeline setting for each of
+# their input sockets after the first one (which is always the step before)
+STEP_SETTINGS = {
+    "HSV Threshold": ["hue", "saturation", "value"],
+    "Find Contours": ["external_only"],
+    "Filter Contours": ["min_area", "min_perimeter", "min_width", "max_width", "min_height", "max_height",
+                        "solidity", "max_vertices", "min_vertices", "min_ratio", "max_ratio"],
+}
+
+
+class GripStep:
+    """
+    One step of a .grip file
+    """
+    __slots__ = ("index", "name", "settings")
+
+    def __init__(self, index, name, settings):
+        self.index = index
+        self.name = name
+        self.settings = settings
+
+
+def parseValue(element):
+    """
+    Turn the <value> of a step input into a python value
+    """
+    children = list(element)
+    if children:
+        return [int(c.text) if c.tag == "int" else float(c.text) for c in children]
+    text = element.text.strip()
+    if text in ("true", "false"):
+        return text == "true"
+    return float(text)
+
+
+def parseGrip(path):
+    """
+    Read the steps out of a .grip file, in the order the frame goes through them
+
+    Returns:
+        a list of GripSteps
+    """
+    with open(path) as f:
+        text = f.read()
+    # GRIP doesn't declare the grip: prefix it uses, so drop it before parsing
+    root = ElementTree.fromstring(re.sub(r"<(/?)grip:", r"<\1", text))
+
+    steps = []
+    for index, element in enumerate(root.find("steps")):
+        name = element.get("name")
+        if name not in STEP_SETTINGS:
+            raise ValueError("%s: unsupported GRIP step %r" % (path, name))
+        settings = {}
+        for socket in element.findall("Input"):
+            value = socket.find("value")
+            number = int(socket.get("socket"))
+            if number == 0 or value is None:
+                continue
+            settings[STEP_SETTINGS[name][number - 1]] = parseValue(value)
+        missing = set(STEP_SETTINGS[name]) - set(settings)
+        if missing:
+            raise ValueError("%s: %s is missing %s" % (path, name, sorted(missing)))
+        steps.append(GripStep(index, name, settings))
+
+    # where every step's image input comes from, the source or another step
+    inputs = {}
+    for connection in root.find("connections"):
+        output = connection.find("Output")
+        target = connection.find("Input")
+        if target.get("socket") != "0":
+            raise ValueError("%s: only the first input of a step can be connected" % path)
+        if output.get("source") is not None:
+            inputs[int(target.get("step"))] = ("source", int(output.get("source")))
+        else:
+            inputs[int(target.get("step"))] = ("step", int(output.get("step")))
+
+    # the steps have to be one chain from the source
+    previous = ("source", 0)
+    for step in steps:
+        if inputs.get(step.index) != previous:
+            raise ValueError("%s: %s isn't connected to the step before it" % (path, step.name))
+        previous = ("step", step.index)
+
+    names = [step.name for step in steps]
+    if names != list(STEP_SETTINGS)[:len(names)]:
+        raise ValueError("%s: expected the steps %s, got %s" % (path, list(STEP_SETTINGS), names))
+    return steps
+
+
+def gripConfig(path):
+    """
+    Returns:
+        the settings in a .grip file, as a dict for GripPipeline.set_config
+    """
+    config = {}
+    for step in parseGrip(path):
+        config.update(step.settings)
+    return config
+
+
+class CompiledPipeline:
+    """
+    The steps of a .grip file, compiled into a list of stages. Each stage
+    takes the output of the one before it.
+    """
+
+    def __init__(self, steps, keep=None):
+        """
+        Args:
+            steps: the GripSteps, from parseGrip
+            keep: the names of the steps whose outputs to keep in outputs,
+                only the last one by default
+        """
+        self.steps = steps
+        self.keep = set(keep) if keep is not None else {steps[-1].name}
+        self.outputs = {}
+        self.stages = []
+        self.path = None
+        self.mtime = None
+
+        self.__hsv = None
+        self.__mask = None
+
+        self.compile()
+
+    @staticmethod
+    def load(path=DEFAULT_GRIP, keep=None):
+        plan = CompiledPipeline(parseGrip(path), keep)
+        plan.path = path
+        plan.mtime = os.path.getmtime(path)
+        return plan
+
+    def reload(self):
+        """
+        Recompile if the .grip file changed since it was loaded
+
+        Returns:
+            True if it was recompiled
+        """
+        if self.path is None or os.path.getmtime(self.path) == self.mtime:
+            return False
+        self.steps = parseGrip(self.path)
+        self.mtime = os.path.getmtime(self.path)
+        self.compile()
+        return True
+
+    def compile(self):
+        steps = dict((step.name, step) for step in self.steps)
+        threshold = steps.get("HSV Threshold")
+        contours = steps.get("Find Contours")
+        contourFilter = steps.get("Filter Contours")
+
+        self.stages = []
+        # the mask is only needed by findContours, so unless somebody wants
+        # it, do both in one stage and never hand the mask on
+        if threshold is not None and contours is not None and threshold.name not in self.keep:
+            self.stages.append((contours.name, self.__threshold_stage(threshold, contours)))
+        else:
+            if threshold is not None:
+                self.stages.append((threshold.name, self.__threshold_stage(threshold, None)))
+            if contours is not None:
+                self.stages.append((contours.name, self.__contours_stage(contours)))
+        if contourFilter is not None:
+            self.stages.append((contourFilter.name, self.__filter_stage(contourFilter)))
+
+    def process(self, frame):
+        """
+        Run every stage on a BGR frame
+
+        Returns:
+            the output of the last step
+        """
+        self.outputs.clear()
+        value = frame
+        for name, stage in self.stages:
+            value = stage(value)
+            if name in self.keep:
+                self.outputs[name] = value
+        return value
+
+    def __threshold_stage(self, threshold, contours):
+        """
+        The HSV threshold, and findContours on its output if contours is the Find Contours step
+        """
+        hue = threshold.settings["hue"]
+        sat = threshold.settings["saturation"]
+        val = threshold.settings["value"]
+        lower = (hue[0], sat[0], val[0])
+        upper = (hue[1], sat[1], val[1])
+        mode = None
+        if contours is not None:
+            mode = cv2.RETR_EXTERNAL if contours.settings["external_only"] else cv2.RETR_LIST
+
+        # the mask is only kept after the stage if it's an output
+        keepMask = contours is None
+
+        def stage(frame):
+            if self.__mask is None or self.__mask.shape != frame.shape[:2]:
+                self.__hsv = np.empty_like(frame)
+                self.__mask = np.empty(frame.shape[:2], dtype=np.uint8)
+            mask = cv2.inRange(cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=self.__hsv), lower, upper,
+                               dst=self.__mask)
+            if keepMask:
+                # hand on a copy, the buffer is reused for the next frame
+                return mask.copy()
+            return cv2.findContours(mask, mode=mode, method=cv2.CHAIN_APPROX_SIMPLE)[0]
+
+        return stage
+
+    @staticmethod
+    def __contours_stage(contours):
+        mode = cv2.RETR_EXTERNAL if contours.settings["external_only"] else cv2.RETR_LIST
+
+        def stage(mask):
+            return cv2.findContours(mask, mode=mode, method=cv2.CHAIN_APPROX_SIMPLE)[0]
+
+        return stage
+
+    @staticmethod
+    def __filter_stage(contourFilter):
+        """
+        Filter Contours, with only the checks that can drop a contour
+        """
+        s = contourFilter.settings
+        checks = [
+            ("width", s["min_width"], s["max_width"]),
+            ("height", s["min_height"], s["max_height"]),
+            ("area", s["min_area"], np.inf),
+            ("perimeter", s["min_perimeter"], np.inf),
+            ("vertices", s["min_vertices"], s["max_vertices"]),
+            ("ratio", s["min_ratio"], s["max_ratio"]),
+        ]
+        # none of these are ever negative, or anywhere near 2^31
+        checks = [(column, low, high) for column, low, high in checks if low > 0 or high < 2 ** 31]
+        solidity = s["solidity"]
+        # the contour is always inside its hull, so solidity is 0 to 100,
+        # unless the hull has no area, which min_area > 0 already drops
+        checkSolidity = not (solidity[0] <= 0 and solidity[1] >= 100 and s["min_area"] > 0)
+
+        def stage(contours):
+            features = ContourFeatures(contours)
+            if checks:
+                columns = {
+                    "width": features.bbox[:, 2],
+                    "height": features.bbox[:, 3],
+                    "area": features.area,
+                    "perimeter": features.perimeter,
+                    "vertices": features.vertices,
+                }
+                keep = np.ones(len(features), dtype=bool)
+                for column, low, high in checks:
+                    if column == "ratio":
+                        values = features.bbox[:, 2] / features.bbox[:, 3].astype(np.float64)
+                    else:
+                        values = columns[column]
+                    keep &= (values >= low) & (values <= high)
+                features = features.take(keep)
+            if checkSolidity:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    solid = 100 * features.area / features.hull_area
+                features = features.take((solid >= solidity[0]) & (solid <= solidity[1]))
+            return features
+
+        return stage
+
+
+def processCompiled(pipe, plan, frame, horizontalRes=None, captureTime=None):
+    """
+    Run a CompiledPipeline on a frame in place of a GripPipeline's first
+    three steps, then the rest of the GripPipeline. captureTime is
+    stamped on the targets and pose, like GripPipeline.process.
+
+    Returns:
+        the best target, or None
+    """
+    if horizontalRes is None:
+        horizontalRes = frame.shape[1]
+    pipe.start_frame(captureTime)
+    pipe.find_contours_output = None
+    pipe.contour_features = plan.process(frame)
+    pipe.filter_contours_output = pipe.contour_features.contours
+    pipe.make_tapes(frame)
+    pipe.pair_tapes(horizontalRes)
+    if pipe.poseEstimator is not None:
+        pipe.solve_pose()
+    return pipe.visionPair
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("grip", nargs="?", default=DEFAULT_GRIP)
+    args = parser.parse_args()
+
+    plan = CompiledPipeline.load(args.grip)
+    for step in plan.steps:
+        print(step.name)
+        for name, value in step.settings.items():
+            print("    %-14s %s" % (name, value))
+    print("\nstages: %s" % ", ".join(name for name, _ in plan.stages))
+
+
+if __name__ == "__main__":
+    main()
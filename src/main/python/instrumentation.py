@@ -0,0 +1,151 @@
+import json
+import time
+
+import numpy as np
+
+# the stage boundaries GripPipeline.process marks, in order. pose is only
+# marked when the pipeline has a poseEstimator
+STAGES = ["threshold", "find_contours", "filter", "tapes", "pairing", "pose"]
+COUNTERS = ["contours_found", "contours_kept", "tapes", "pairs"]
+
+
+class RollingWindow:
+    """
+    The last n samples of something, kept in a preallocated ring buffer
+    """
+
+    def __init__(self, size):
+        self.samples = np.zeros(size, dtype=np.float64)
+        self.index = 0
+        self.count = 0
+
+    def add(self, value):
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % len(self.samples)
+        self.count += 1
+
+    def values(self):
+        return self.samples[:min(self.count, len(self.samples))]
+
+    def summary(self):
+        """
+        Returns:
+            a dict with the count, mean, p50, p95, p99 and max of the window
+        """
+        values = self.values()
+        if len(values) == 0:
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {
+            "count": int(len(values)),
+            "mean": float(values.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(values.max()),
+        }
+
+    def histogram(self, bins):
+        """
+        Args:
+            bins: the bin edges
+
+        Returns:
+            the number of samples in the window that fall in each bin
+        """
+        counts, _ = np.histogram(self.values(), bins=bins)
+        return counts
+
+
+class PipelineMetrics:
+    """
+    Stage timings and counters for GripPipeline.process.
+
+    Set it as pipeline.metrics to turn it on, and back to None to turn it
+    off. While it's off process doesn't look at it at all.
+
+    Each frame records a monotonic timestamp (time.perf_counter_ns) at the
+    start and at the end of every stage in STAGES, into lastFrame. The
+    stage latencies in ms go into a RollingWindow per stage (plus "total"),
+    and the counts of contours found, contours kept, tapes and pairs into
+    both a RollingWindow and a running total.
+    """
+
+    def __init__(self, window=600, sink=None, exportInterval=5.0):
+        """
+        Args:
+            window: how many frames the rolling windows hold
+            sink: an optional callable that gets snapshot() every exportInterval seconds
+            exportInterval: seconds between exports to the sink
+        """
+        self.latencies = dict((name, RollingWindow(window)) for name in STAGES + ["total"])
+        self.counts = dict((name, RollingWindow(window)) for name in COUNTERS)
+        self.totals = dict.fromkeys(COUNTERS, 0)
+        self.frames = 0
+        self.failures = 0
+
+        self.lastFrame = {}
+        self.__start = None
+        self.__last = None
+
+        self.sink = sink
+        self.exportInterval = exportInterval
+        self.__lastExport = time.monotonic()
+
+    def start_frame(self):
+        now = time.perf_counter_ns()
+        self.lastFrame = {"start": now}
+        self.__start = now
+        self.__last = now
+
+    def mark(self, stage):
+        """
+        Record that a stage just ended
+        """
+        now = time.perf_counter_ns()
+        self.lastFrame[stage] = now
+        self.latencies[stage].add((now - self.__last) / 1e6)
+        self.__last = now
+
+    def end_frame(self, found, kept, tapes, pairs, failed=False):
+        self.latencies["total"].add((self.__last - self.__start) / 1e6)
+        for name, value in zip(COUNTERS, (found, kept, tapes, pairs)):
+            self.counts[name].add(value)
+            self.totals[name] += value
+        self.frames += 1
+        if failed:
+            self.failures += 1
+
+        if self.sink is not None and time.monotonic() - self.__lastExport >= self.exportInterval:
+            self.export()
+
+    def snapshot(self):
+        """
+        Returns:
+            everything measured so far as a dict that can be turned into JSON
+        """
+        return {
+            "time": time.time(),
+            "frames": self.frames,
+            "failures": self.failures,
+            "latency_ms": dict((name, w.summary()) for name, w in self.latencies.items()),
+            "counts": dict((name, w.summary()) for name, w in self.counts.items()),
+            "totals": dict(self.totals),
+        }
+
+    def export(self):
+        self.__lastExport = time.monotonic()
+        self.sink(self.snapshot())
+
+
+class JsonLinesSink:
+    """
+    A metrics sink that appends each snapshot to a file as one line of JSON
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, snapshot):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(snapshot) + "\n")
@@ -0,0 +1,156 @@
+import cv2
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    pass
+
+
+class LutThreshold:
+    """
+    An HSV threshold that maps BGR pixels straight to the mask through a
+    precomputed lookup table, instead of converting the whole frame to HSV
+    and then calling inRange on it.
+
+    The table has one bit for each of the 256^3 BGR colors (2 MB), and is
+    built by running the regular HSV threshold over every color once, so
+    the output matches cv2.cvtColor + cv2.inRange exactly. It is only
+    rebuilt when the thresholds change.
+
+    It is NOT faster than cvtColor + inRange on x86. OpenCV's SIMD HSV
+    conversion beats the per pixel gather into the table, which is a
+    random read over 2 or 16 MB. In bench_threshold.py the packed table
+    takes about 1.2-1.9x as long (e.g. 1.55 ms against 0.99 ms at
+    640x480), and the byte table is within about 25% either way. The
+    gather on its own is already slower than the whole HSV threshold,
+    so no way of building the index fixes that. Only use it on a
+    coprocessor where bench_threshold.py says it's faster; the HSV
+    threshold is the default everywhere.
+    """
+
+    def __init__(self, hue, sat, val, packed=True):
+        """
+        Args:
+            hue: A list of two numbers the are the min and max hue.
+            sat: A list of two numbers the are the min and max saturation.
+            val: A list of two numbers the are the min and max value.
+            packed: if False, keep one byte per color (16 MB) instead of one
+                bit, which trades memory for fewer passes over the frame
+        """
+        self.packed = packed
+        self.ranges = None
+        self.table = None
+        self.builds = 0
+
+        self.__shape = None
+        self.__rgba = None
+        self.__scratch = None
+        self.__bits = None
+        self.__rgbaView = None
+        self.__index = None
+        self.__scratchView = None
+        self.__bitsView = None
+
+        self.set_ranges(hue, sat, val)
+
+    def set_ranges(self, hue, sat, val):
+        """
+        Set the thresholds, rebuilding the table if they changed
+
+        Returns:
+            True if the table was rebuilt
+        """
+        ranges = (tuple(hue), tuple(sat), tuple(val))
+        if ranges == self.ranges:
+            return False
+
+        self.ranges = ranges
+        self.table = self.build_table(hue, sat, val)
+        if not self.packed:
+            self.table = np.unpackbits(self.table, bitorder='little') * np.uint8(255)
+        self.builds += 1
+        return True
+
+    @staticmethod
+    def build_table(hue, sat, val):
+        """
+        Threshold every BGR color, one blue value at a time
+
+        Returns:
+            a uint8 array of 2^21 bytes, where bit (b << 16 | g << 8 | r) is
+            set (little endian bit order) if that color is in range
+        """
+        lower = (hue[0], sat[0], val[0])
+        upper = (hue[1], sat[1], val[1])
+
+        plane = np.empty((256, 256, 3), dtype=np.uint8)
+        plane[:, :, 1] = np.arange(256, dtype=np.uint8)[:, np.newaxis]
+        plane[:, :, 2] = np.arange(256, dtype=np.uint8)[np.newaxis, :]
+        hsv = np.empty_like(plane)
+        mask = np.empty((256, 256), dtype=np.uint8)
+
+        table = np.empty((256, 256 * 256 // 8), dtype=np.uint8)
+        for b in range(256):
+            plane[:, :, 0] = b
+            cv2.cvtColor(plane, cv2.COLOR_BGR2HSV, dst=hsv)
+            cv2.inRange(hsv, lower, upper, dst=mask)
+            table[b] = np.packbits(mask.reshape(-1) != 0, bitorder='little')
+
+        return table.reshape(-1)
+
+    def __allocate(self, shape):
+        """
+        Get the working buffers for a frame of this shape. They are only
+        reallocated when a frame has more pixels than any before it, so
+        changing regions of interest don't cause allocations.
+        """
+        if self.__shape == shape:
+            return
+
+        pixels = shape[0] * shape[1]
+        if self.__rgba is None or self.__rgba.size < pixels * 4:
+            self.__rgba = np.empty(pixels * 4, dtype=np.uint8)
+            self.__scratch = np.empty(pixels, dtype=np.uint32)
+            self.__bits = np.empty(pixels, dtype=np.uint8)
+
+        # the BGR pixels get converted to RGBA here and viewed as one little
+        # endian uint32 per pixel, which is A << 24 | b << 16 | g << 8 | r
+        self.__rgbaView = self.__rgba[:pixels * 4].reshape(shape + (4,))
+        self.__index = self.__rgba[:pixels * 4].view('<u4').reshape(shape)
+        self.__scratchView = self.__scratch[:pixels].reshape(shape)
+        self.__bitsView = self.__bits[:pixels].reshape(shape)
+        self.__shape = shape
+
+    def apply(self, input, dst=None):
+        """Segment an image based on the hue, saturation, and value ranges.
+
+        Args:
+            input: A BGR numpy.ndarray.
+            dst: An optional uint8 buffer to write the output into.
+
+        Returns:
+            A black and white numpy.ndarray, the same as the HSV threshold.
+        """
+        shape = input.shape[:2]
+        self.__allocate(shape)
+        index = self.__index
+
+        if dst is None:
+            dst = np.empty(shape, dtype=np.uint8)
+
+        # index = b << 16 | g << 8 | r
+        cv2.cvtColor(input, cv2.COLOR_BGR2RGBA, dst=self.__rgbaView)
+        np.bitwise_and(index, 0xFFFFFF, out=index)
+
+        if not self.packed:
+            return self.table.take(index, out=dst)
+
+        # pick out the byte, then the bit within that byte
+        bits = self.__bitsView
+        np.bitwise_and(index, 7, out=self.__scratchView)
+        np.right_shift(index, 3, out=index)
+        self.table.take(index, out=bits)
+        np.right_shift(bits, self.__scratchView, out=bits, casting='unsafe')
+        np.bitwise_and(bits, 1, out=bits)
+        return np.multiply(bits, 255, out=dst, casting='unsafe')
@@ -0,0 +1,231 @@
+"""
+Pose of the 2019 vision target from the eight outside corners of its tapes
+"""
+import math
+
+import cv2
+import numpy as np
+
+try:
+    from cv2 import cv2
+except ImportError:
+    pass
+
+# the horizontal field of view of the camera the 2019 images were taken
+# with, fit to their labeled distances with regression.py --fit-fov. 61
+# degrees, from the Lifecam HD-3000's spec, made every distance about 20%
+# short. Distances are within about 5% (median) of the labels with this,
+# see regression.py for which images are off and why.
+HORIZONTAL_FOV = 50.7
+
+METHODS = {
+    "iterative": cv2.SOLVEPNP_ITERATIVE,
+    "ippe": cv2.SOLVEPNP_IPPE,
+}
+
+
+def targetModel():
+    """
+    The outside corners of the 2019 vision target in inches, in the order
+    find_corner_points returns them (tl, tr, br, bl) for the left and then
+    the right tape. Each tape is 2 x 5.5 in, tipped 14.5 degrees toward the
+    other one, with an 8 in gap at their closest points (images/2019/Info.txt).
+
+    The origin is the middle of the target, with x to the right, y down
+    and z into the wall, the same way the camera's axes point.
+
+    Returns:
+        an (8, 3) float32 array
+    """
+    rect = np.array([[-1, -2.75], [1, -2.75], [1, 2.75], [-1, 2.75]], dtype=np.float64)
+    tapes = []
+    for sign in (1, -1):
+        theta = np.radians(14.5 * sign)
+        rotation = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+        corners = rect.dot(rotation.T)
+        # the inner top corner is the closest point to the other tape
+        inner = corners[1] if sign > 0 else corners[0]
+        corners[:, 0] += -4 - inner[0] if sign > 0 else 4 - inner[0]
+        tapes.append(corners)
+    points = np.concatenate(tapes)
+    return np.hstack([points, np.zeros((8, 1))]).astype(np.float32)
+
+
+def cameraMatrix(width, height, horizontalFov=HORIZONTAL_FOV):
+    """
+    A pinhole camera matrix for a frame size and field of view, with the
+    optical center in the middle of the frame
+    """
+    focal = (width / 2.0) / np.tan(np.radians(horizontalFov / 2.0))
+    return np.array([[focal, 0, width / 2.0], [0, focal, height / 2.0], [0, 0, 1]], dtype=np.float64)
+
+
+class Pose:
+    """
+    Where the target is relative to the camera, in inches and degrees
+    """
+    __slots__ = ("rvec", "tvec", "error", "warm", "captureTime")
+
+    def __init__(self, rvec, tvec, error, warm=False, captureTime=None):
+        """
+        Args:
+            rvec: the rotation of the target in the camera's frame, as a Rodrigues vector
+            tvec: the position of the middle of the target in the camera's frame
+            error: the RMS reprojection error of the solve in pixels
+            warm: if the solve was started from the last frame's pose
+            captureTime: time.monotonic() when the frame was captured, if it's known
+        """
+        self.rvec = rvec
+        self.tvec = tvec
+        self.error = error
+        self.warm = warm
+        self.captureTime = captureTime
+
+    @property
+    def distance(self):
+        """
+        Straight line distance from the camera to the middle of the target
+        """
+        return float(np.linalg.norm(self.tvec))
+
+    @property
+    def yaw(self):
+        """
+        Angle from the camera's axis to the target, positive to the right
+        """
+        return math.degrees(math.atan2(self.tvec[0, 0], self.tvec[2, 0]))
+
+    @property
+    def skew(self):
+        """
+        How far the target is turned away from facing the camera, about the
+        vertical axis, positive when its right side is farther away
+        """
+        R, _ = cv2.Rodrigues(self.rvec)
+        return math.degrees(math.atan2(-R[2, 0], R[0, 0]))
+
+    def camera_position(self):
+        """
+        Returns:
+            where the camera is in the target's frame, as [x, y, z]
+        """
+        R, _ = cv2.Rodrigues(self.rvec)
+        return (-R.T.dot(self.tvec)).ravel()
+
+    def as_tuple(self):
+        """
+        Returns:
+            (x, y, z, distance, yaw, skew, error) as plain floats
+        """
+        x, y, z = self.tvec.ravel().tolist()
+        return (x, y, z, self.distance, self.yaw, self.skew, self.error)
+
+
+class PoseEstimator:
+    """
+    Solves the pose of a VisionTarget with solvePnP, from both tapes'
+    corners against targetModel.
+
+    With the iterative method and warmStart on, each solve starts from the
+    pose of the last frame (useExtrinsicGuess) instead of from scratch,
+    which takes fewer solver iterations while the target moves smoothly. A
+    warm solve that ends up worse than maxError is thrown away and done
+    again cold, and a frame without a pose forgets the last one. IPPE
+    solves the planar target in closed form, so there's nothing to warm
+    start there.
+    """
+
+    def __init__(self, cameraMatrix, distCoeffs=None, method="iterative", warmStart=True,
+                 subpixel=False, maxError=4.0):
+        """
+        Args:
+            cameraMatrix: the 3x3 camera matrix, see cameraMatrix
+            distCoeffs: the lens distortion coefficients, or None for none
+            method: "iterative" or "ippe"
+            warmStart: start each iterative solve from the last frame's pose
+            subpixel: refine the corners with cornerSubPix first
+            maxError: the most RMS reprojection error in pixels a pose can have
+        """
+        if method not in METHODS:
+            raise ValueError("unknown solvePnP method %r, expected one of %s" % (method, sorted(METHODS)))
+
+        self.cameraMatrix = np.asarray(cameraMatrix, dtype=np.float64)
+        self.distCoeffs = distCoeffs
+        self.method = method
+        self.warmStart = warmStart
+        self.subpixel = subpixel
+        self.maxError = maxError
+        self.model = targetModel()
+
+        self.lastPose = None
+        self.solves = 0
+        self.warmSolves = 0
+        self.coldRetries = 0
+
+    def reset(self):
+        """
+        Forget the last pose, so the next solve is cold
+        """
+        self.lastPose = None
+
+    def solve_target(self, target):
+        """
+        Args:
+            target: a VisionTarget, or None
+
+        Returns:
+            the Pose of the target, or None if there's no target or its
+            corners couldn't be found
+        """
+        if target is None:
+            self.reset()
+            return None
+
+        corners = target.get_corner_points(subpixel=self.subpixel)
+        if any(c is None for c in corners):
+            self.reset()
+            return None
+
+        return self.solve(np.concatenate(corners))
+
+    def solve(self, imagePoints):
+        """
+        Args:
+            imagePoints: an (8, 2) float32 array of the corners, in the order of targetModel
+
+        Returns:
+            the Pose, or None if solvePnP failed or the pose is off by more than maxError
+        """
+        self.solves += 1
+        pose = None
+        if self.warmStart and self.method == "iterative" and self.lastPose is not None:
+            pose = self.__solve(imagePoints, self.lastPose)
+            if pose is not None and pose.error <= self.maxError:
+                self.warmSolves += 1
+            else:
+                self.coldRetries += 1
+                pose = None
+
+        if pose is None:
+            pose = self.__solve(imagePoints, None)
+            if pose is not None and pose.error > self.maxError:
+                pose = None
+
+        self.lastPose = pose
+        return pose
+
+    def __solve(self, imagePoints, guess):
+        if guess is None:
+            ok, rvec, tvec = cv2.solvePnP(self.model, imagePoints, self.cameraMatrix, self.distCoeffs,
+                                          flags=METHODS[self.method])
+        else:
+            # solvePnP writes the answer into the guess arrays, so give it copies
+            ok, rvec, tvec = cv2.solvePnP(self.model, imagePoints, self.cameraMatrix, self.distCoeffs,
+                                          guess.rvec.copy(), guess.tvec.copy(), useExtrinsicGuess=True,
+                                          flags=cv2.SOLVEPNP_ITERATIVE)
+        if not ok:
+            return None
+
+        projected, _ = cv2.projectPoints(self.model, rvec, tvec, self.cameraMatrix, self.distCoeffs)
+        error = float(np.sqrt(np.mean(np.sum((projected.reshape(-1, 2) - imagePoints) ** 2, axis=1))))
+        return Pose(rvec, tvec, error, warm=guess is not None)
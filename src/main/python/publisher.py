@@ -0,0 +1,349 @@
+"""
+Binary result publisher, and a local stand-in for NetworkTables
+
+Every result is packed into one fixed layout record (RECORD, 104 bytes,
+little endian) and sent as a datagram over UDP or a Unix socket:
+
+    magic             4s   b"PV19"
+    version           B
+    flags             B    FLAG_FOUND, FLAG_POSE
+    target count      H    how many targets were found, even past MAX_TARGETS
+    session           I    random, new every time a ResultPublisher is made
+    frame number      I    starts again at 0 in every session
+    capture time      d    time.monotonic() when the frame was captured
+    processed time    d    when processing finished
+    publish time      d    when the record was packed
+    pose              4f   distance (in), yaw (deg), skew (deg), reprojection error (px)
+    targets           MAX_TARGETS x 4f   center x, center y, area, score, best first
+
+Packing is a single struct pack, so it takes a few microseconds
+(bench_publisher.py) and publishing never holds up processing. Sending
+happens on its own thread. When records pile up because sending is
+behind, coalesce decides what goes out: every record in its own
+datagram, everything queued in one datagram, or only the newest record.
+
+ResultServer receives the records and keeps the latest values in a
+table of NetworkTables style keys, so the whole thing can be tried out
+off the robot. A record from a new session (the coprocessor restarted)
+is never mistaken for an old one because its frame number is lower:
+
+    python publisher.py --serve udp:127.0.0.1:5800
+    python runtime.py --images ../../../images/2019 --publish udp:127.0.0.1:5800
+"""
+import argparse
+import collections
+import math
+import os
+import random
+import socket
+import struct
+import threading
+import time
+
+MAGIC = b"PV19"
+VERSION = 2
+MAX_TARGETS = 3
+
+FLAG_FOUND = 1
+FLAG_POSE = 2
+
+RECORD = struct.Struct("<4sBBHIIddd4f" + "4f" * MAX_TARGETS)
+
+COALESCE_MODES = (None, "batch", "latest")
+
+# the most records in one datagram, keeps it under a typical MTU
+MAX_BATCH = 14
+
+
+def parseAddress(address):
+    """
+    Turn "udp:host:port" or "unix:/path" into a socket family and address
+    """
+    kind, _, rest = address.partition(":")
+    if kind == "udp":
+        host, _, port = rest.rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    if kind == "unix":
+        return socket.AF_UNIX, rest
+    raise ValueError("expected udp:host:port or unix:/path, got %r" % address)
+
+
+def packResult(result, publishTime=None, session=0):
+    """
+    Pack a runtime.VisionResult into a RECORD
+
+    Args:
+        result: the VisionResult
+        publishTime: the publish time to put in the record, now by default
+        session: the session of the publisher
+
+    Returns:
+        the bytes of the record
+    """
+    targets = result.targets
+    pose = result.pose
+    flags = (FLAG_FOUND if result.target is not None else 0) | (FLAG_POSE if pose is not None else 0)
+
+    values = [MAGIC, VERSION, flags, min(len(targets), 0xffff), session, result.frameNumber & 0xffffffff,
+              result.captureTime, result.processedTime,
+              time.monotonic() if publishTime is None else publishTime]
+    if pose is not None:
+        values += [pose.distance, pose.yaw, pose.skew, pose.error]
+    else:
+        values += [math.nan] * 4
+    for i in range(MAX_TARGETS):
+        if i < len(targets):
+            target = targets[i]
+            center = target.get_center()
+            values += [center[0], center[1], target.get_area(), target.score or 0.0]
+        else:
+            values += [math.nan] * 4
+
+    return RECORD.pack(*values)
+
+
+def unpackRecord(data, offset=0):
+    """
+    Returns:
+        a dict of the fields of the RECORD at offset in data
+    """
+    fields = RECORD.unpack_from(data, offset)
+    magic, version, flags, count, session, number, captured, processed, published = fields[:9]
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a version %d record" % VERSION)
+    pose = fields[9:13]
+    targets = [fields[13 + 4 * i:17 + 4 * i] for i in range(min(count, MAX_TARGETS))]
+    return {
+        "session": session,
+        "frame": number,
+        "found": bool(flags & FLAG_FOUND),
+        "target_count": count,
+        "capture_time": captured,
+        "processed_time": processed,
+        "publish_time": published,
+        "pose": pose if flags & FLAG_POSE else None,
+        "targets": targets,
+    }
+
+
+class ResultPublisher:
+    """
+    Sends each result to address as a RECORD. Can be used as the publisher
+    of a VisionRuntime.
+    """
+
+    def __init__(self, address, coalesce=None):
+        """
+        Args:
+            address: "udp:host:port" or "unix:/path"
+            coalesce: what to do with records that queue up while sending
+                is behind. None sends each one on its own, "batch" sends
+                everything queued in one datagram and "latest" only sends
+                the newest one.
+        """
+        if coalesce not in COALESCE_MODES:
+            raise ValueError("unknown coalesce mode %r, expected one of %s" % (coalesce, COALESCE_MODES))
+        self.family, self.address = parseAddress(address)
+        self.coalesce = coalesce
+        self.socket = socket.socket(self.family, socket.SOCK_DGRAM)
+        # so the server can tell this run's frame numbers from the last one's
+        self.session = random.getrandbits(32)
+
+        self.sent = 0
+        self.datagrams = 0
+        self.dropped = 0
+        self.errors = 0
+
+        self.__pending = collections.deque()
+        self.__condition = threading.Condition()
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__send, name="publisher", daemon=True)
+        self.__thread.start()
+
+    def __call__(self, result):
+        self.publish(result)
+
+    def publish(self, result):
+        """
+        Pack a result and hand it to the sending thread. Never waits on the socket.
+        """
+        record = packResult(result, session=self.session)
+        with self.__condition:
+            self.__pending.append(record)
+            self.__condition.notify()
+
+    def close(self):
+        """
+        Send whatever is still queued and close the socket
+        """
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify()
+        self.__thread.join()
+        self.socket.close()
+
+    def __send(self):
+        while True:
+            with self.__condition:
+                while not self.__pending and self.__running:
+                    self.__condition.wait()
+                if not self.__pending:
+                    return
+                records = list(self.__pending)
+                self.__pending.clear()
+
+            if self.coalesce == "latest":
+                self.dropped += len(records) - 1
+                records = records[-1:]
+
+            if self.coalesce == "batch":
+                for start in range(0, len(records), MAX_BATCH):
+                    batch = records[start:start + MAX_BATCH]
+                    self.__sendto(b"".join(batch), len(batch))
+            else:
+                for record in records:
+                    self.__sendto(record, 1)
+
+    def __sendto(self, data, count):
+        try:
+            self.socket.sendto(data, self.address)
+            self.sent += count
+            self.datagrams += 1
+        except OSError:
+            # nobody listening on a Unix socket, or the buffer is full; the next result replaces it anyway
+            self.errors += 1
+
+
+class ResultServer:
+    """
+    Stands in for the NetworkTables server: receives RECORDs and keeps the
+    newest values under keys like vision/center_x
+    """
+
+    def __init__(self, address, table="vision", latencyWindow=1000):
+        self.family, self.address = parseAddress(address)
+        self.prefix = table + "/"
+        self.socket = socket.socket(self.family, socket.SOCK_DGRAM)
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.remove(self.address)
+        self.socket.bind(self.address)
+        # so port 0 can be used to get any free port
+        self.address = self.socket.getsockname()
+        self.socket.settimeout(0.1)
+
+        self.table = {}
+        self.received = 0
+        self.datagrams = 0
+        self.bad = 0
+        # seconds from capture to receiving, for the last latencyWindow records
+        self.latencies = collections.deque(maxlen=latencyWindow)
+        self.session = None
+        self.sessions = 0
+        self.lastFrame = None
+        self.outOfOrder = 0
+
+        self.__running = False
+        self.__thread = None
+
+    def start(self):
+        self.__running = True
+        self.__thread = threading.Thread(target=self.serve, name="result server", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__running = False
+        if self.__thread is not None:
+            self.__thread.join()
+        self.socket.close()
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def serve(self):
+        self.__running = True
+        while self.__running:
+            try:
+                data = self.socket.recv(RECORD.size * MAX_BATCH)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.receive(data, time.monotonic())
+
+    def receive(self, data, receivedTime):
+        """
+        Put every record in a datagram into the table. A datagram that
+        isn't whole records is counted in bad and skipped.
+        """
+        self.datagrams += 1
+        if not data or len(data) % RECORD.size:
+            self.bad += 1
+            return
+        try:
+            records = [unpackRecord(data, offset) for offset in range(0, len(data), RECORD.size)]
+        except ValueError:
+            self.bad += 1
+            return
+
+        for record in records:
+            self.received += 1
+            if record["session"] != self.session:
+                # the publisher restarted, so its frame numbers did too
+                self.session = record["session"]
+                self.sessions += 1
+                self.lastFrame = None
+            # capture times are time.monotonic() too, which is only comparable on the same machine
+            self.latencies.append(receivedTime - record["capture_time"])
+            if self.lastFrame is not None and record["frame"] <= self.lastFrame:
+                self.outOfOrder += 1
+                continue
+            self.lastFrame = record["frame"]
+            self.update(record)
+
+    def update(self, record):
+        table = self.table
+        p = self.prefix
+        table[p + "frame"] = record["frame"]
+        table[p + "found"] = record["found"]
+        table[p + "target_count"] = record["target_count"]
+        table[p + "capture_time"] = record["capture_time"]
+        # both times are from the coprocessor's clock, so unlike the age at
+        # the receiver this is right on any machine. The robot takes it off
+        # the time it got the record to find when the frame was captured.
+        table[p + "latency_ms"] = (record["publish_time"] - record["capture_time"]) * 1000.0
+        # NaN rather than the last values, so nobody steers at a target that's gone
+        x, y, area, score = record["targets"][0] if record["targets"] else (math.nan,) * 4
+        table[p + "center_x"] = x
+        table[p + "center_y"] = y
+        table[p + "area"] = area
+        table[p + "score"] = score
+        distance, yaw, skew, error = record["pose"] if record["pose"] is not None else (math.nan,) * 4
+        table[p + "distance"] = distance
+        table[p + "yaw"] = yaw
+        table[p + "skew"] = skew
+        table[p + "pose_error"] = error
+        table[p + "has_pose"] = record["pose"] is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--serve", required=True, metavar="ADDRESS", help="udp:host:port or unix:/path to listen on")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between printing the table")
+    args = parser.parse_args()
+
+    server = ResultServer(args.serve)
+    server.start()
+    try:
+        while True:
+            time.sleep(args.interval)
+            print("%d records in %d datagrams, %d bad, %d sessions" % (
+                server.received, server.datagrams, server.bad, server.sessions))
+            for key, value in sorted(server.table.items()):
+                print("    %-22s %s" % (key, value))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import cv2
+import numpy as np
+
+from BoudingRectangle import GripPipeline, VisionTape, VisionTarget
+
+try:
+    from cv2 import cv2
+except ImportError:
+    pass
+
+
+class PyramidDetector:
+    """
+    Finds the vision target on a pyrDown'd copy of the frame, then goes
+    back to the full resolution frame only inside small windows around
+    the two tapes it found there to get their contours, corners and the
+    pose.
+
+    Everything up to pairing runs at the coarse resolution's speed, while
+    the corners (and so the pose) are as accurate as processing the whole
+    frame at full resolution. It can stand in for a TargetTracker as the
+    processor of a VisionRuntime.
+    """
+
+    def __init__(self, levels=1, margin=4, coarse=None, fine=None, poseEstimator=None):
+        """
+        Args:
+            levels: how many times to pyrDown the frame for the coarse pass
+            margin: pixels of full resolution frame to add around each
+                tape's scaled up bounding box
+            coarse: the GripPipeline for the coarse pass, a new persistent one by default
+            fine: the GripPipeline to threshold the full resolution windows
+                with, a new persistent one by default
+            poseEstimator: an optional PoseEstimator, made for the full
+                resolution camera, to solve the pose of each target with
+        """
+        self.levels = levels
+        self.scale = 2 ** levels
+        self.margin = margin
+        self.coarse = coarse if coarse is not None else GripPipeline(persistent=True)
+        self.fine = fine if fine is not None else GripPipeline(persistent=True)
+        self.poseEstimator = poseEstimator
+
+        self.__pyramid = [None] * levels
+
+        # what was found on the last frame
+        self.coarseTarget = None
+        self.target = None
+        self.pose = None
+        self.rois = []
+
+        self.frames = 0
+        self.refineMisses = 0
+
+    def process(self, frame, display=False, captureTime=None):
+        """
+        Find the vision target in a frame
+
+        Args:
+            frame: the full resolution BGR frame
+            display: passed on to the coarse GripPipeline.process
+            captureTime: when the frame was captured, stamped on the target and pose
+
+        Returns:
+            the VisionTarget, with full resolution tapes, or None
+        """
+        self.frames += 1
+        self.target = None
+        self.pose = None
+        self.rois = []
+
+        small = self.pyr_down(frame)
+        self.coarse.process(small, horizontalRes=small.shape[1], display=display, captureTime=captureTime)
+        self.coarseTarget = self.coarse.visionPair
+
+        if self.coarseTarget is not None:
+            self.target = self.refine(frame, self.coarseTarget)
+            if self.target is None:
+                self.refineMisses += 1
+            else:
+                self.target.captureTime = captureTime
+
+        if self.poseEstimator is not None:
+            self.pose = self.poseEstimator.solve_target(self.target)
+            if self.pose is not None:
+                self.pose.captureTime = captureTime
+        return self.target
+
+    def pyr_down(self, frame):
+        """
+        pyrDown the frame levels times, into buffers that are kept between frames
+        """
+        image = frame
+        for i in range(self.levels):
+            height, width = (image.shape[0] + 1) // 2, (image.shape[1] + 1) // 2
+            buffer = self.__pyramid[i]
+            if buffer is None or buffer.shape[:2] != (height, width) or buffer.shape[2:] != image.shape[2:]:
+                buffer = self.__pyramid[i] = np.empty((height, width) + image.shape[2:], dtype=image.dtype)
+            image = cv2.pyrDown(image, dst=buffer)
+        return image
+
+    def tape_roi(self, tape, shape):
+        """
+        Get the full resolution window around a coarse tape
+
+        Returns:
+            the window in the form [x, y, x_2, y_2]
+        """
+        x, y, w, h = cv2.boundingRect(tape.contour)
+        s = self.scale
+        return [max(x * s - self.margin, 0), max(y * s - self.margin, 0),
+                min((x + w) * s + self.margin, shape[1]), min((y + h) * s + self.margin, shape[0])]
+
+    def refine(self, frame, coarseTarget):
+        """
+        Find both tapes of a coarse target again in the full resolution frame
+
+        Returns:
+            a VisionTarget of full resolution VisionTapes, or None if a tape
+            couldn't be found in its window
+        """
+        tapes = []
+        for coarseTape in coarseTarget.individualTapes:
+            roi = self.tape_roi(coarseTape, frame.shape)
+            self.rois.append(roi)
+
+            self.fine.threshold(frame, roi)
+            contours = self.fine.find_contours()
+            if len(contours) == 0:
+                return None
+            # the tape is the biggest thing in its own window
+            contour = max(contours, key=cv2.contourArea)
+            tapes.append(VisionTape(GripPipeline.crop(frame, roi), roi[:2], contour))
+
+        target = VisionTarget(tapes)
+        target.score = coarseTarget.score
+        return target
@@ -0,0 +1,238 @@
+"""
+Accuracy and speed regression harness
+
+Runs the whole pipeline, through pose, over every image in images/2019.
+Each file name there says what the image is and how far away the target
+was, e.g. CargoStraightDark48in.jpg is the cargo ship, straight on, dark,
+48 in away. For each image it reports whether the target was found, the
+distance the pose came out to against the labeled one, and how long the
+image took. With --baseline the results are compared to a stored run,
+and the exit code is 1 if either the accuracy or the speed regressed.
+
+The labeled distances are to the bumper cutout or the rocket's face,
+not to the camera, so even with the right camera they won't match
+exactly. pose.HORIZONTAL_FOV was fit to them with --fit-fov, which
+finds the field of view that makes the measured distances best match
+the labeled ones (a field of view scales every distance by the same
+factor). With it the median error is about 5%. The straight on loading
+station and rocket images are within 3%. The cargo ship images all
+read about 8 in short whatever the distance, so their labels look like
+they were measured from about 8 in further back. The angled images read
+too far, the rocket ones by up to 14 in.
+
+Latency depends on the machine, so save a baseline on the machine the
+comparison will run on.
+
+Usage:
+    python regression.py --save-baseline
+    python regression.py --baseline
+    python regression.py --baseline mine.json --speed-tolerance 0.1
+    python regression.py --fit-fov
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from BoudingRectangle import GripPipeline
+from frame_loader import FrameLoader
+from pose import HORIZONTAL_FOV, PoseEstimator, cameraMatrix
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "images")
+DEFAULT_BASELINE = os.path.join(IMAGE_DIR, "2019", "baseline.json")
+
+LABEL = re.compile(r"^(?P<scenario>[A-Za-z]+?)(?P<distance>\d+)in\.(jpg|jpeg|png)$", re.IGNORECASE)
+
+
+def parseLabel(path):
+    """
+    Get the scenario and distance out of a file name like CargoStraightDark48in.jpg
+
+    Returns:
+        (scenario, distance in inches), or None if the name isn't labeled
+    """
+    match = LABEL.match(os.path.basename(path))
+    if match is None:
+        return None
+    return match.group("scenario"), float(match.group("distance"))
+
+
+def runImage(pipe, frame, repeats):
+    """
+    Returns:
+        the pose found in the frame (or None) and the median time in ms it took
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        pipe.process(frame, horizontalRes=frame.shape[1])
+        times.append((time.perf_counter() - start) * 1000.0)
+    return pipe.detectedPose, float(np.median(times))
+
+
+def run(paths, pyrDownCount=1, repeats=5, horizontalFov=HORIZONTAL_FOV):
+    """
+    Returns:
+        the results as a dict with a row per image and a summary of them
+    """
+    pipe = GripPipeline(persistent=True)
+    rows = []
+    labeled = [path for path in paths if parseLabel(path) is not None]
+    for path, image in FrameLoader(labeled, pyrDownCount):
+        if image is None:
+            continue
+        label = parseLabel(path)
+
+        # every image is a different scene, so don't warm start from the last one
+        height, width = image.shape[:2]
+        pipe.poseEstimator = PoseEstimator(cameraMatrix(width, height, horizontalFov), warmStart=False)
+        # once untimed, so the first image doesn't pay for setting up the buffers
+        pipe.process(image, horizontalRes=width)
+        pose, latency = runImage(pipe, image, repeats)
+
+        scenario, distance = label
+        row = {
+            "file": os.path.basename(path),
+            "scenario": scenario,
+            "distance": distance,
+            "found": pose is not None,
+            "measured": None,
+            "error": None,
+            "latency_ms": round(latency, 4),
+        }
+        if pose is not None:
+            row["measured"] = round(pose.distance, 3)
+            row["error"] = round(pose.distance - distance, 3)
+        rows.append(row)
+
+    return {"images": rows, "summary": summarize(rows)}
+
+
+def summarize(rows):
+    errors = np.array([abs(r["error"]) for r in rows if r["found"]])
+    relative = np.array([abs(r["error"]) / r["distance"] for r in rows if r["found"]])
+    latency = np.array([r["latency_ms"] for r in rows])
+    return {
+        "images": len(rows),
+        "found": int(sum(1 for r in rows if r["found"])),
+        "detection_rate": round(sum(1 for r in rows if r["found"]) / float(max(len(rows), 1)), 4),
+        "mean_abs_error_in": round(float(errors.mean()), 3) if len(errors) else None,
+        "median_abs_error_pct": round(float(np.median(relative) * 100.0), 2) if len(relative) else None,
+        "latency_mean_ms": round(float(latency.mean()), 4) if len(latency) else None,
+        "latency_p50_ms": round(float(np.percentile(latency, 50)), 4) if len(latency) else None,
+        "latency_p95_ms": round(float(np.percentile(latency, 95)), 4) if len(latency) else None,
+    }
+
+
+def fitFov(results, horizontalFov=HORIZONTAL_FOV):
+    """
+    Find the field of view that makes the measured distances match the
+    labeled ones best, from a run with horizontalFov. Distance goes with
+    the focal length, so it's the least squares scale of the focal length
+    on the relative errors.
+
+    Returns:
+        the horizontal field of view in degrees, or None if nothing was found
+    """
+    ratios = np.array([r["measured"] / r["distance"] for r in results["images"] if r["found"]])
+    if not len(ratios):
+        return None
+    scale = ratios.sum() / (ratios * ratios).sum()
+    return math.degrees(2.0 * math.atan(math.tan(math.radians(horizontalFov / 2.0)) / scale))
+
+
+def compare(results, baseline, distanceTolerance, speedTolerance):
+    """
+    Returns:
+        a list of everything that got worse than the baseline, empty if nothing did
+    """
+    problems = []
+    before = dict((r["file"], r) for r in baseline["images"])
+    for row in results["images"]:
+        old = before.get(row["file"])
+        if old is None:
+            continue
+        if old["found"] and not row["found"]:
+            problems.append("%s: the target isn't found anymore" % row["file"])
+        elif old["found"] and row["found"] and abs(row["error"]) > abs(old["error"]) + distanceTolerance:
+            problems.append("%s: distance error went from %+.2f in to %+.2f in" % (
+                row["file"], old["error"], row["error"]))
+
+    now, then = results["summary"], baseline["summary"]
+    if now["detection_rate"] < then["detection_rate"]:
+        problems.append("detection rate went from %.3f to %.3f" % (then["detection_rate"], now["detection_rate"]))
+    if then["mean_abs_error_in"] is not None and now["mean_abs_error_in"] is not None \
+            and now["mean_abs_error_in"] > then["mean_abs_error_in"] + distanceTolerance:
+        problems.append("mean distance error went from %.2f in to %.2f in" % (
+            then["mean_abs_error_in"], now["mean_abs_error_in"]))
+    for key in ("latency_p50_ms", "latency_p95_ms"):
+        if then[key] and now[key] > then[key] * (1.0 + speedTolerance):
+            problems.append("%s went from %.3f to %.3f (more than %d%% slower)" % (
+                key, then[key], now[key], round(speedTolerance * 100)))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=os.path.join(IMAGE_DIR, "2019"))
+    parser.add_argument("--baseline", nargs="?", const=DEFAULT_BASELINE,
+                        help="compare against this stored run, images/2019/baseline.json if no file is given")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE,
+                        help="store this run here, images/2019/baseline.json if no file is given")
+    parser.add_argument("--pyrdown", type=int, default=1, help="times to pyrDown each image first")
+    parser.add_argument("--repeats", type=int, default=5, help="runs of each image, the median time is kept")
+    parser.add_argument("--distance-tolerance", type=float, default=1.0,
+                        help="inches the distance error can get worse by")
+    parser.add_argument("--speed-tolerance", type=float, default=0.25,
+                        help="fraction the latency can get worse by")
+    parser.add_argument("--fov", type=float, default=HORIZONTAL_FOV, help="horizontal field of view of the camera")
+    parser.add_argument("--fit-fov", action="store_true",
+                        help="print the field of view that best matches the labeled distances")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.directory, "*")))
+    results = run(paths, args.pyrdown, args.repeats, args.fov)
+    if not results["images"]:
+        raise SystemExit("no labeled images found")
+
+    print("%-34s %8s %6s %9s %8s %9s" % ("image", "label in", "found", "measured", "error", "ms"))
+    for row in results["images"]:
+        print("%-34s %8.0f %6s %9s %8s %9.3f" % (
+            row["file"], row["distance"], "yes" if row["found"] else "no",
+            "" if row["measured"] is None else "%.1f" % row["measured"],
+            "" if row["error"] is None else "%+.1f" % row["error"], row["latency_ms"]))
+    print()
+    for key, value in results["summary"].items():
+        print("%-22s %s" % (key, value))
+
+    if args.fit_fov:
+        fov = fitFov(results, args.fov)
+        # a second pass, as the distance isn't quite proportional to the focal length
+        fov = fitFov(run(paths, args.pyrdown, 1, fov), fov)
+        print("%-22s %.2f" % ("fitted_fov_deg", fov))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, args.distance_tolerance, args.speed_tolerance)
+        print()
+        if problems:
+            print("REGRESSED against %s:" % args.baseline)
+            for problem in problems:
+                print("  " + problem)
+            sys.exit(1)
+        print("no regressions against %s" % args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+"""
+Live runtime: capture, process and publish on separate threads
+
+The threads are connected by single slot queues where a new item replaces
+whatever was still waiting, so a slow stage drops stale frames instead of
+building up a backlog. Every slot counts what it dropped.
+
+Every frame is stamped with time.monotonic() when it's captured, and the
+stamp goes with it through processing into the target, the pose and the
+VisionResult. The runtime keeps the latency of each hop in rolling
+windows (see latency()), and resultAge() is how old the newest result
+is, for the robot to compensate with.
+
+Usage:
+    python runtime.py --camera 0
+    python runtime.py --images ../../../images/2019 --fps 30 --seconds 10
+    python runtime.py --synthetic --fps 60 --seconds 5
+    python runtime.py --images ../../../images/2019 --pyramid 1
+    python runtime.py --camera 0 --publish udp:10.59.40.2:5800
+    python runtime.py --camera 0 --stream 5801
+"""
+import argparse
+import glob
+import math
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from BoudingRectangle import GripPipeline
+from frame_loader import FrameLoader
+from instrumentation import RollingWindow
+from publisher import COALESCE_MODES, ResultPublisher
+from pyramid import PyramidDetector
+from tracking import TargetTracker
+
+try:
+    from cv2 import cv2
+except ImportError:
+    pass
+
+
+class LatestSlot:
+    """
+    A thread safe queue that holds at most one item. Putting an item while
+    the last one hasn't been taken yet replaces it and counts a drop.
+    """
+
+    def __init__(self):
+        self.__condition = threading.Condition()
+        self.__item = None
+        self.__full = False
+        self.closed = False
+        self.puts = 0
+        self.dropped = 0
+
+    def put(self, item):
+        with self.__condition:
+            if self.__full:
+                self.dropped += 1
+            self.__item = item
+            self.__full = True
+            self.puts += 1
+            self.__condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Wait for an item and take it
+
+        Returns:
+            the newest item, or None if the slot was closed or the timeout ran out
+        """
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: self.__full or self.closed, timeout):
+                return None
+            if not self.__full:
+                return None
+            item = self.__item
+            self.__item = None
+            self.__full = False
+            # wake up wait_empty
+            self.__condition.notify_all()
+            return item
+
+    def wait_empty(self, timeout=None):
+        """
+        Wait for the item in the slot to be taken
+
+        Returns:
+            False if the timeout ran out first
+        """
+        with self.__condition:
+            return self.__condition.wait_for(lambda: not self.__full or self.closed, timeout)
+
+    def close(self):
+        """
+        Wake up anything waiting in get or wait_empty, which will then return
+        """
+        with self.__condition:
+            self.closed = True
+            self.__condition.notify_all()
+
+
+class Frame:
+    """
+    A captured frame and when it was captured
+    """
+
+    def __init__(self, number, timestamp, image):
+        self.number = number
+        self.timestamp = timestamp
+        self.image = image
+
+
+class VisionResult:
+    """
+    What the processing stage found in a frame
+    """
+
+    def __init__(self, frame, target, processedTime, pose=None, targets=None):
+        """
+        Args:
+            frame: the Frame that was processed
+            target: the VisionTarget found, or None
+            processedTime: when processing finished
+            pose: the Pose of target, if the processor solved it
+            targets: every target found, best (target) first. Just target by default.
+        """
+        self.frameNumber = frame.number
+        # only kept for the debug stream, nothing else looks at it
+        self.image = frame.image
+        self.captureTime = frame.timestamp
+        self.processedTime = processedTime
+        # set when it's handed to the publisher
+        self.publishedTime = None
+        self.target = target
+        self.center = None if target is None else target.get_center()
+        self.pose = pose
+        if targets is None:
+            targets = [] if target is None else [target]
+        self.targets = targets
+
+    def age(self, now=None):
+        """
+        Returns:
+            the seconds since the frame was captured
+        """
+        return (time.monotonic() if now is None else now) - self.captureTime
+
+
+class CameraSource:
+    """
+    Frames from a camera through cv2.VideoCapture
+    """
+
+    def __init__(self, index=0, width=None, height=None):
+        self.capture = cv2.VideoCapture(index)
+        if width is not None:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height is not None:
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+    def read(self):
+        ok, image = self.capture.read()
+        return image if ok else None
+
+    def close(self):
+        self.capture.release()
+
+
+class FileSource:
+    """
+    Stands in for a camera by playing back image files at a fixed frame rate
+    """
+
+    def __init__(self, paths, fps=30.0, loop=True, pyrDown=True):
+        self.images = FrameLoader(paths, 1 if pyrDown else 0).frames()[1]
+        if not self.images:
+            raise ValueError("no readable images")
+        self.period = 1.0 / fps if fps else 0.0
+        self.loop = loop
+        self.index = 0
+        self.nextTime = None
+
+    def read(self):
+        if self.index >= len(self.images):
+            if not self.loop:
+                return None
+            self.index = 0
+
+        waitForFrame(self)
+        image = self.images[self.index]
+        self.index += 1
+        return image
+
+    def close(self):
+        pass
+
+
+class SyntheticSource:
+    """
+    Stands in for a camera by drawing a vision target that moves side to side
+    """
+
+    def __init__(self, width=320, height=240, fps=30.0, frames=None):
+        self.width = width
+        self.height = height
+        self.period = 1.0 / fps if fps else 0.0
+        self.frames = frames
+        self.count = 0
+        self.nextTime = None
+
+    def read(self):
+        if self.frames is not None and self.count >= self.frames:
+            return None
+
+        waitForFrame(self)
+        image = np.full((self.height, self.width, 3), 20, dtype=np.uint8)
+        scale = self.height / 240.0
+        centerX = self.width / 2.0 + self.width / 4.0 * math.sin(self.count / 30.0)
+        for offset, angle in ((-30, 14.5), (30, -14.5)):
+            box = cv2.boxPoints(((centerX + offset * scale, self.height / 2.0), (20 * scale, 55 * scale), angle))
+            cv2.fillConvexPoly(image, box.astype(np.int32), (0, 255, 0))
+        self.count += 1
+        return image
+
+    def close(self):
+        pass
+
+
+def waitForFrame(source):
+    """
+    Sleep until it's time for a source running at a fixed rate to produce its next frame
+    """
+    now = time.monotonic()
+    if source.nextTime is None:
+        source.nextTime = now
+    elif source.nextTime > now:
+        time.sleep(source.nextTime - now)
+    source.nextTime += source.period
+
+
+class VisionRuntime:
+    """
+    Runs capture, processing and publishing each on their own thread, with
+    only the newest frame and the newest result passed between them
+    """
+
+    def __init__(self, source, processor=None, publisher=None, debugStream=None, latencyWindow=600):
+        """
+        Args:
+            source: anything with a read() that returns a BGR frame, or None when it runs out
+            processor: anything with a process(frame, captureTime=None)
+                that returns a VisionTarget or None. A TargetTracker by
+                default. If it has a pose or targets attribute, they go in
+                the VisionResult too.
+            publisher: called with each VisionResult. By default results are
+                only kept in latest.
+            debugStream: a debug_stream.DebugStream, offered each frame
+                and its result after they are published
+            latencyWindow: how many frames the latency windows hold
+        """
+        self.source = source
+        self.processor = processor if processor is not None else TargetTracker(GripPipeline(persistent=True))
+        self.publisher = publisher
+        self.debugStream = debugStream
+
+        self.frames = LatestSlot()
+        self.results = LatestSlot()
+        self.latest = None
+
+        self.captured = 0
+        self.processed = 0
+        self.published = 0
+
+        # in ms: capture to the start of processing, processing, the end of
+        # processing to publishing, and capture to publishing
+        self.latencies = dict((name, RollingWindow(latencyWindow))
+                              for name in ("queue", "process", "publish", "capture_to_publish"))
+
+        self.__running = False
+        self.__threads = []
+
+    def start(self):
+        self.__running = True
+        self.__threads = [
+            threading.Thread(target=self.__capture, name="capture", daemon=True),
+            threading.Thread(target=self.__process, name="process", daemon=True),
+            threading.Thread(target=self.__publish, name="publish", daemon=True),
+        ]
+        for thread in self.__threads:
+            thread.start()
+
+    def stop(self):
+        self.__running = False
+        self.frames.close()
+        self.results.close()
+        for thread in self.__threads:
+            thread.join()
+        self.source.close()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the source to run out of frames and everything after it to finish
+        """
+        for thread in self.__threads:
+            thread.join(timeout)
+
+    def stats(self):
+        """
+        Returns:
+            a dict of how many frames each stage handled, and how many were
+            dropped waiting for processing and waiting for publishing
+        """
+        return {
+            "captured": self.captured,
+            "processed": self.processed,
+            "published": self.published,
+            "dropped_before_process": self.frames.dropped,
+            "dropped_before_publish": self.results.dropped,
+        }
+
+    def latency(self):
+        """
+        Returns:
+            a dict of the summary (see RollingWindow.summary) of each latency in ms
+        """
+        return dict((name, window.summary()) for name, window in self.latencies.items())
+
+    def resultAge(self):
+        """
+        Returns:
+            the seconds since the frame of the newest published result was
+            captured, or None if nothing was published yet
+        """
+        latest = self.latest
+        return None if latest is None else latest.age()
+
+    def __capture(self):
+        # a source with no frame rate (--fps 0) would read frames as fast as
+        # it can and starve processing, so it only gets to read the next
+        # frame once the last one has been taken
+        unpaced = getattr(self.source, "period", None) == 0
+        while self.__running:
+            if unpaced:
+                self.frames.wait_empty()
+            image = self.source.read()
+            if image is None:
+                break
+            self.frames.put(Frame(self.captured, time.monotonic(), image))
+            self.captured += 1
+        self.frames.close()
+
+    def __process(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            start = time.monotonic()
+            target = self.processor.process(frame.image, captureTime=frame.timestamp)
+            processedTime = time.monotonic()
+            self.results.put(VisionResult(frame, target, processedTime, getattr(self.processor, "pose", None),
+                                          getattr(self.processor, "targets", None)))
+            self.latencies["queue"].add((start - frame.timestamp) * 1000.0)
+            self.latencies["process"].add((processedTime - start) * 1000.0)
+            self.processed += 1
+        self.results.close()
+
+    def __publish(self):
+        while True:
+            result = self.results.get()
+            if result is None:
+                break
+            result.publishedTime = time.monotonic()
+            self.latencies["publish"].add((result.publishedTime - result.processedTime) * 1000.0)
+            self.latencies["capture_to_publish"].add((result.publishedTime - result.captureTime) * 1000.0)
+            self.latest = result
+            if self.publisher is not None:
+                self.publisher(result)
+            if self.debugStream is not None:
+                self.debugStream.offer(result.image, result)
+            self.published += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--camera", type=int, help="camera index")
+    source.add_argument("--images", help="a directory or glob of images to play back")
+    source.add_argument("--synthetic", action="store_true", help="draw a moving target")
+    parser.add_argument("--fps", type=float, default=30.0, help="frame rate of the image and synthetic sources")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--pyramid", type=int, default=0, metavar="LEVELS",
+                        help="pair on a frame pyrDown'd this many times and refine at full resolution")
+    parser.add_argument("--publish", metavar="ADDRESS", help="send results to udp:host:port or unix:/path")
+    parser.add_argument("--coalesce", choices=[m for m in COALESCE_MODES if m],
+                        help="what to send when results queue up, see publisher.py")
+    parser.add_argument("--stream", type=int, metavar="PORT", help="serve an MJPEG debug stream on this port")
+    parser.add_argument("--stream-fps", type=float, default=10.0, help="frame rate of the debug stream")
+    parser.add_argument("--stream-scale", type=float, default=0.5, help="scale of the debug stream frames")
+    args = parser.parse_args()
+
+    if args.camera is not None:
+        frameSource = CameraSource(args.camera)
+    elif args.images is not None:
+        pattern = os.path.join(args.images, "*.jpg") if os.path.isdir(args.images) else args.images
+        # the pyramid does its own pyrDowns and wants the full resolution frame
+        frameSource = FileSource(sorted(glob.glob(pattern)), fps=args.fps, pyrDown=not args.pyramid)
+    else:
+        frameSource = SyntheticSource(fps=args.fps)
+
+    processor = PyramidDetector(levels=args.pyramid) if args.pyramid else None
+    resultPublisher = ResultPublisher(args.publish, args.coalesce) if args.publish else None
+    debugStream = None
+    if args.stream is not None:
+        # debug_stream imports this module, so it can't be imported at the top
+        from debug_stream import DebugStream
+        debugStream = DebugStream(args.stream, fps=args.stream_fps, scale=args.stream_scale)
+        debugStream.start()
+    runtime = VisionRuntime(frameSource, processor, resultPublisher, debugStream)
+    runtime.start()
+    time.sleep(args.seconds)
+    runtime.stop()
+    if resultPublisher is not None:
+        resultPublisher.close()
+    if debugStream is not None:
+        debugStream.stop()
+        for name, value in debugStream.stats().items():
+            print("stream %-17s %d" % (name, value))
+
+    for name, value in runtime.stats().items():
+        print("%-24s %d" % (name, value))
+
+    print("\n%-20s %8s %8s %8s %8s" % ("latency ms", "p50", "p95", "p99", "max"))
+    for name, summary in runtime.latency().items():
+        if summary["count"]:
+            print("%-20s %8.2f %8.2f %8.2f %8.2f" % (name, summary["p50"], summary["p95"], summary["p99"],
+                                                     summary["max"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+On disk cache of the early pipeline stages, for reprocessing datasets
+
+Every entry is keyed by the hash of the image file's bytes plus the
+settings of every stage up to and including the one it holds, so the key
+of a stage changes whenever anything before it changes:
+
+    frame      the decoded (and pyrDown'd) frame
+    mask       the HSV threshold output
+    contours   the findContours output
+    features   the filter contours output, as a ContourFeatures table
+
+Rerunning with, say, only the pairing code changed finds the features
+entry and only runs make_tapes and pairing. Changing the filter settings
+reuses the contours and so on. Entries are .npz files, and the least
+recently used ones are deleted once the cache gets bigger than maxBytes.
+"""
+import hashlib
+import json
+import os
+import zipfile
+
+import cv2
+import numpy as np
+
+from contour_features import ContourFeatures
+from frame_loader import decodeBytes
+
+# bump this when what's stored in an entry changes
+FORMAT_VERSION = 1
+
+# how much of maxBytes a process writes before it looks at how big the
+# whole directory is again, since the other processes are writing to it too
+RESCAN_FRACTION = 0.05
+
+STAGES = ["frame", "mask", "contours", "features"]
+
+THRESHOLD_KEYS = ["hue", "saturation", "value"]
+CONTOUR_KEYS = ["external_only"]
+
+
+def packContours(contours):
+    """
+    Returns:
+        all the points in one (n, 2) int32 array, and the number of points in each contour
+    """
+    lengths = np.array([len(c) for c in contours], dtype=np.int64)
+    if len(contours) == 0:
+        return np.zeros((0, 2), dtype=np.int32), lengths
+    return np.concatenate(contours).reshape(-1, 2).astype(np.int32), lengths
+
+
+def unpackContours(points, lengths):
+    """
+    The inverse of packContours. The contours are views of points.
+    """
+    ends = np.cumsum(lengths)
+    return [points[end - n:end].reshape(-1, 1, 2) for n, end in zip(lengths.tolist(), ends.tolist())]
+
+
+def packFeatures(table):
+    """
+    Put every column of a ContourFeatures table (including the rect
+    column, which gets worked out if it hasn't been yet) side by side in
+    one (n, 12) float64 array, so an entry only has a few arrays to read
+    """
+    return np.hstack([table.bbox, table.area[:, None], table.perimeter[:, None],
+                      table.vertices[:, None], table.rect]).astype(np.float64)
+
+
+def unpackFeatures(contours, columns):
+    """
+    The inverse of packFeatures
+    """
+    return ContourFeatures(contours, bbox=columns[:, 0:4].astype(np.int32), area=columns[:, 4],
+                           perimeter=columns[:, 5], vertices=columns[:, 6].astype(np.int64),
+                           rect=columns[:, 7:12])
+
+
+class StageCache:
+    """
+    A size bounded, content addressed store of stage outputs. Several
+    processes can share one directory. size is only what this process
+    knows of, so every RESCAN_FRACTION of maxBytes written the directory
+    is measured again, and with n processes the cache can only get to
+    about maxBytes * (1 + n * RESCAN_FRACTION).
+    """
+
+    def __init__(self, directory, maxBytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        os.makedirs(directory, exist_ok=True)
+        self.size = 0
+        self.__unscanned = 0
+        self.rescan()
+
+        self.hits = dict.fromkeys(STAGES, 0)
+        self.misses = dict.fromkeys(STAGES, 0)
+        self.evictions = 0
+
+    @staticmethod
+    def stage_keys(content, config, pyrDownCount, reduced=False):
+        """
+        Get the key of every stage for one image
+
+        Args:
+            content: the bytes of the image file
+            config: the pipeline settings, from GripPipeline.get_config
+            pyrDownCount: how many times the frame is pyrDown'd after decoding
+            reduced: if the frame is decoded at reduced size, see frame_loader.decodeBytes
+
+        Returns:
+            a dict of stage name to key
+        """
+        filterConfig = dict((k, v) for k, v in config.items() if k not in THRESHOLD_KEYS + CONTOUR_KEYS)
+        settings = [
+            {"pyrdown": pyrDownCount, "reduced": bool(reduced), "opencv": cv2.__version__,
+             "format": FORMAT_VERSION},
+            dict((k, config[k]) for k in THRESHOLD_KEYS),
+            dict((k, config[k]) for k in CONTOUR_KEYS),
+            filterConfig,
+        ]
+
+        keys = {}
+        digest = hashlib.sha1(content)
+        for stage, stageSettings in zip(STAGES, settings):
+            digest.update(json.dumps(stageSettings, sort_keys=True).encode())
+            keys[stage] = digest.copy().hexdigest()
+        return keys
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".npz")
+
+    def get(self, stage, key):
+        """
+        Returns:
+            the dict of arrays stored for key, or None if there isn't an entry
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as entry:
+                arrays = dict((name, entry[name]) for name in entry.files)
+        except OSError:
+            self.misses[stage] += 1
+            return None
+        except (ValueError, EOFError, zipfile.BadZipFile):
+            # a broken entry, e.g. cut short by a crash, is a miss and gets written again
+            self.misses[stage] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        # the modification time is the last use, for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits[stage] += 1
+        return arrays
+
+    def put(self, key, **arrays):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write somewhere else first so another process never reads half an entry
+        temp = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temp, path)
+
+        size = os.path.getsize(path)
+        self.size += size
+        self.__unscanned += size
+        if self.size > self.maxBytes or self.__unscanned >= self.maxBytes * RESCAN_FRACTION:
+            self.rescan()
+            if self.size > self.maxBytes:
+                self.evict()
+
+    def rescan(self):
+        """
+        Measure the whole directory again, including what other processes wrote
+        """
+        self.size = sum(size for _, size, _ in self.__entries())
+        self.__unscanned = 0
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache is down to
+        90% of maxBytes
+        """
+        entries = sorted(self.__entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.maxBytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                pass
+            total -= size
+        self.size = total
+        self.__unscanned = 0
+
+    def clear(self):
+        for path, _, _ in self.__entries():
+            os.remove(path)
+        self.size = 0
+
+    def __entries(self):
+        """
+        Yields:
+            (path, size, last used time) of every entry
+        """
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".npz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def stats(self):
+        return {"hits": dict(self.hits), "misses": dict(self.misses),
+                "evictions": self.evictions, "bytes": self.size}
+
+
+def processCached(pipe, cache, content, horizontalRes=None, pyrDownCount=1, reduced=False, captureTime=None):
+    """
+    Run a GripPipeline on an encoded image, starting from the last stage
+    whose output is in the cache and storing the output of every stage
+    that had to run
+
+    Args:
+        pipe: the GripPipeline
+        cache: a StageCache
+        content: the bytes of the image file
+        horizontalRes: the width of the frame, the frame's own width by default
+        pyrDownCount: how many times to pyrDown the frame after decoding
+        reduced: decode at reduced size, see frame_loader.decodeBytes
+        captureTime: when the frame was captured, see GripPipeline.process
+
+    Returns:
+        the frame, or None if it couldn't be decoded
+    """
+    # the steps below run on their own, so nothing from the last frame should carry over
+    pipe.start_frame(captureTime)
+    keys = cache.stage_keys(content, pipe.get_config(), pyrDownCount, reduced)
+
+    entry = cache.get("frame", keys["frame"])
+    if entry is not None:
+        frame = entry["frame"]
+    else:
+        frame = decodeBytes(content, pyrDownCount, reduced)
+        if frame is None:
+            return None
+        cache.put(keys["frame"], frame=frame)
+    if horizontalRes is None:
+        horizontalRes = frame.shape[1]
+
+    # find the last stage that's cached; nothing after a miss can be cached
+    # under the same settings anyway, since its key includes the missed one
+    resume = None
+    for stage in reversed(STAGES[1:]):
+        entry = cache.get(stage, keys[stage])
+        if entry is not None:
+            resume = stage
+            break
+
+    if resume == "features":
+        contours = unpackContours(entry["points"], entry["lengths"])
+        pipe.find_contours_output = None
+        pipe.contour_features = unpackFeatures(contours, entry["columns"])
+        pipe.filter_contours_output = pipe.contour_features.contours
+    else:
+        if resume == "contours":
+            pipe.find_contours_output = unpackContours(entry["points"], entry["lengths"])
+        else:
+            if resume == "mask":
+                pipe.hsv_threshold_output = entry["mask"]
+            else:
+                pipe.threshold(frame)
+                cache.put(keys["mask"], mask=pipe.hsv_threshold_output)
+            pipe.find_contours()
+            points, lengths = packContours(pipe.find_contours_output)
+            cache.put(keys["contours"], points=points, lengths=lengths)
+
+        table = pipe.filter_contours()
+        points, lengths = packContours(table.contours)
+        # the rect column is needed by make_tapes anyway, so it's fine to work it out here
+        cache.put(keys["features"], points=points, lengths=lengths, columns=packFeatures(table))
+
+    pipe.make_tapes(frame)
+    pipe.pair_tapes(horizontalRes)
+    if pipe.poseEstimator is not None:
+        pipe.solve_pose()
+    return frame
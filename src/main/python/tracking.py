@@ -0,0 +1,176 @@
+import cv2
+import numpy as np
+
+from BoudingRectangle import GripPipeline
+
+try:
+    from cv2 import cv2
+except ImportError:
+    pass
+
+
+class TargetTracker:
+    """
+    Runs a GripPipeline only in a window around where the last VisionTarget
+    was found, instead of over the whole frame.
+
+    The window is the bounding box of the last target, moved by how far the
+    target moved between the last two frames and grown by a margin plus
+    that same distance. A miss inside the window, or a target in the window
+    whose center is farther from where it was expected than that margin,
+    falls back to a full frame scan of the same frame. A full frame scan is
+    also forced every fullScanInterval frames so new targets still get
+    picked up.
+    """
+
+    def __init__(self, pipeline=None, margin=0.5, fullScanInterval=30, velocityGain=1.0):
+        """
+        Args:
+            pipeline: the GripPipeline to run, a new one by default
+            margin: how much to grow the window by on each side, as a
+                fraction of the target's width and height
+            fullScanInterval: the most frames in a row to search only the window
+            velocityGain: how much of the last frame to frame movement to
+                expect again in the next frame
+        """
+        self.pipeline = pipeline if pipeline is not None else GripPipeline()
+        self.margin = margin
+        self.fullScanInterval = fullScanInterval
+        self.velocityGain = velocityGain
+
+        self.lastBox = None
+        self.lastCenter = None
+        self.velocity = (0.0, 0.0)
+        self.framesSinceFullScan = 0
+
+        # the window searched on the last frame, or None for the whole frame
+        self.roi = None
+        # the target found on the last frame
+        self.target = None
+
+        self.fullScans = 0
+        self.roiScans = 0
+        self.roiMisses = 0
+
+    def reset(self):
+        """
+        Forget the last target, so the next frame is a full frame scan
+        """
+        self.lastBox = None
+        self.lastCenter = None
+        self.velocity = (0.0, 0.0)
+
+    def process(self, frame, display=False, captureTime=None):
+        """
+        Find the vision target in a frame
+
+        Args:
+            frame: the BGR frame to process
+            display: passed on to GripPipeline.process
+            captureTime: when the frame was captured, passed on to GripPipeline.process
+
+        Returns:
+            the VisionTarget that was found, or None
+        """
+        roi = self.next_roi(frame.shape)
+        target = None
+
+        if roi is not None:
+            self.roiScans += 1
+            self.__detect(frame, roi, display, captureTime)
+            # the best target in the window isn't always the one being tracked
+            target = next((t for t in self.pipeline.visionPairs if self.__expected(t)), None)
+            if target is None:
+                self.roiMisses += 1
+                roi = None
+
+        if roi is None:
+            self.fullScans += 1
+            self.framesSinceFullScan = 0
+            target = self.__detect(frame, None, display, captureTime)
+        else:
+            self.framesSinceFullScan += 1
+
+        self.roi = roi
+        self.target = target
+        self.__update(target)
+        return target
+
+    @property
+    def pose(self):
+        """
+        The pose of the last target, if the pipeline has a poseEstimator
+        and the target is the one it solved
+        """
+        if self.target is not None and self.target is self.pipeline.visionPair:
+            return self.pipeline.detectedPose
+        return None
+
+    @property
+    def targets(self):
+        """
+        Every target found on the last frame, the tracked one first
+        """
+        if self.target is None:
+            return []
+        return [self.target] + [t for t in self.pipeline.visionPairs if t is not self.target]
+
+    def next_roi(self, shape):
+        """
+        Get the window to search on the next frame
+
+        Args:
+            shape: the shape of the frame
+
+        Returns:
+            the window in the form [x, y, x_2, y_2], or None to search the whole frame
+        """
+        if self.lastBox is None or self.framesSinceFullScan >= self.fullScanInterval:
+            return None
+
+        x, y, x2, y2 = self.lastBox
+        vx = self.velocity[0] * self.velocityGain
+        vy = self.velocity[1] * self.velocityGain
+        marginX = self.margin * (x2 - x) + abs(vx)
+        marginY = self.margin * (y2 - y) + abs(vy)
+
+        height, width = shape[:2]
+        return [
+            int(max(0, np.floor(x + vx - marginX))),
+            int(max(0, np.floor(y + vy - marginY))),
+            int(min(width, np.ceil(x2 + vx + marginX))),
+            int(min(height, np.ceil(y2 + vy + marginY)))
+        ]
+
+    def __expected(self, target):
+        """
+        Check that a target found in the window is the one being tracked,
+        and not part of another one that happened to be inside the window
+        """
+        x, y, x2, y2 = self.lastBox
+        vx = self.velocity[0] * self.velocityGain
+        vy = self.velocity[1] * self.velocityGain
+        center = target.get_center()
+
+        return (abs(center[0] - (self.lastCenter[0] + vx)) <= self.margin * (x2 - x) + abs(vx)
+                and abs(center[1] - (self.lastCenter[1] + vy)) <= self.margin * (y2 - y) + abs(vy))
+
+    def __detect(self, frame, roi, display, captureTime):
+        self.pipeline.process(frame, horizontalRes=frame.shape[1], display=display, roi=roi,
+                              captureTime=captureTime)
+        return self.pipeline.visionPair
+
+    def __update(self, target):
+        if target is None:
+            self.reset()
+            return
+
+        points = np.concatenate([tape.contour for tape in target.individualTapes])
+        x, y, w, h = cv2.boundingRect(points)
+        center = target.get_center()
+
+        if self.lastCenter is not None:
+            self.velocity = (center[0] - self.lastCenter[0], center[1] - self.lastCenter[1])
+
+        self.lastBox = [x, y, x + w, y + h]
+        self.lastCenter = center
@@ -0,0 +1,295 @@
+"""
+HSV threshold and filter contours auto tuner
+
+Searches the HSV threshold and filter contours settings of GripPipeline
+over a set of labeled frames, with a process pool, and writes out the
+best settings as JSON (load them with GripPipeline.set_config, or
+batch.py --config).
+
+Every frame is converted to HSV once, up front, and each candidate only
+runs inRange on the cached HSV frames before the rest of the pipeline.
+A candidate is scored on accuracy (the fraction of frames where it got
+the right answer) minus --cost-weight times its mean ms per frame, so of
+two settings that are just as accurate the faster one wins. The search
+is random over the whole space first, and then around the best settings
+found.
+
+Labels are a JSON file of file name to {"present": true/false} and,
+optionally, "center": [x, y] of the target in the processed (pyrDown'd)
+frame. A frame with a center only counts as right if the target found is
+within --tolerance pixels of it. Without a labels file every frame is
+taken to have a target in it somewhere.
+
+With --frames the frames come from a frame store (see frame_store.py)
+instead of being decoded. The HSV frames are converted once into a
+second, temporary frame store, and every worker maps both stores rather
+than getting its own copy of the frames.
+
+Usage:
+    python tune_threshold.py ../../../images/2019 -o tuned.json
+    python tune_threshold.py venue/*.jpg --labels venue.json --candidates 2000 --workers 8
+    python tune_threshold.py --frames /tmp/venue.frames --labels venue.json
+"""
+import argparse
+import json
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from BoudingRectangle import GripPipeline
+from batch import findImages
+from frame_loader import FrameLoader
+from frame_store import FrameStore
+
+# the range each setting is searched over
+SEARCH_SPACE = {
+    "hue_low": (0.0, 90.0),
+    "hue_high": (30.0, 180.0),
+    "saturation_low": (0.0, 250.0),
+    "value_low": (0.0, 250.0),
+    "min_area": (2.0, 200.0),
+    "max_ratio": (1.0, 20.0),
+}
+
+# filled in by initWorker, once per worker process
+frames = None
+hsvFrames = None
+labels = None
+tolerance = None
+pipeline = None
+maskBuffer = None
+
+
+def toConfig(params):
+    """
+    Turn a point in SEARCH_SPACE into GripPipeline settings
+    """
+    return {
+        "hue": [params["hue_low"], max(params["hue_high"], params["hue_low"])],
+        "saturation": [params["saturation_low"], 255.0],
+        "value": [params["value_low"], 255.0],
+        "min_area": params["min_area"],
+        "max_ratio": params["max_ratio"],
+    }
+
+
+def fromConfig(config):
+    return {
+        "hue_low": config["hue"][0],
+        "hue_high": config["hue"][1],
+        "saturation_low": config["saturation"][0],
+        "value_low": config["value"][0],
+        "min_area": config["min_area"],
+        "max_ratio": config["max_ratio"],
+    }
+
+
+def randomParams(random):
+    params = {}
+    for name, (low, high) in SEARCH_SPACE.items():
+        if name == "min_area":
+            # small areas matter a lot more than big ones
+            params[name] = float(np.exp(random.uniform(np.log(low), np.log(high))))
+        else:
+            params[name] = float(random.uniform(low, high))
+    return params
+
+
+def nearbyParams(params, random, spread):
+    """
+    A random point near params, spread being a fraction of each range
+    """
+    nearby = {}
+    for name, (low, high) in SEARCH_SPACE.items():
+        value = params[name] + random.normal(0, spread * (high - low))
+        nearby[name] = float(min(max(value, low), high))
+    return nearby
+
+
+def initWorker(bgr, hsv, frameLabels, centerTolerance, frameStore=None, hsvStore=None):
+    global frames, hsvFrames, labels, tolerance, pipeline, maskBuffer
+    if frameStore:
+        # map the stores here rather than being sent the frames, every
+        # worker shares the same pages
+        frames = list(FrameStore(frameStore))
+        hsvFrames = list(FrameStore(hsvStore))
+    else:
+        frames = bgr
+        hsvFrames = hsv
+    labels = frameLabels
+    tolerance = centerTolerance
+    pipeline = GripPipeline()
+    maskBuffer = None
+
+
+def isRight(target, label):
+    if not label.get("present", True):
+        return target is None
+    if target is None:
+        return False
+    center = label.get("center")
+    if center is None:
+        return True
+    found = target.get_center()
+    return (found[0] - center[0]) ** 2 + (found[1] - center[1]) ** 2 <= tolerance ** 2
+
+
+def evaluate(params):
+    """
+    Run the pipeline with one candidate's settings over every frame
+
+    Returns:
+        (params, accuracy, mean ms per frame)
+    """
+    global maskBuffer
+    config = toConfig(params)
+    pipeline.set_config(config)
+    lower = (config["hue"][0], config["saturation"][0], config["value"][0])
+    upper = (config["hue"][1], config["saturation"][1], config["value"][1])
+
+    right = 0
+    elapsed = 0.0
+    for frame, hsv, label in zip(frames, hsvFrames, labels):
+        start = time.perf_counter()
+        if maskBuffer is None or maskBuffer.shape != hsv.shape[:2]:
+            maskBuffer = np.empty(hsv.shape[:2], dtype=np.uint8)
+        # the same steps as GripPipeline.process, minus the HSV conversion
+        pipeline.hsv_threshold_output = cv2.inRange(hsv, lower, upper, dst=maskBuffer)
+        pipeline.find_contours()
+        pipeline.filter_contours()
+        pipeline.make_tapes(frame)
+        target = pipeline.pair_tapes(frame.shape[1])
+        elapsed += time.perf_counter() - start
+        if isRight(target, label):
+            right += 1
+
+    return params, right / float(len(frames)), elapsed * 1000.0 / len(frames)
+
+
+def score(result, costWeight):
+    params, accuracy, cost = result
+    return accuracy - costWeight * cost
+
+
+def loadFrames(paths, pyrDownCount, reduced=False):
+    names, bgr = FrameLoader(paths, pyrDownCount, reduced).frames()
+    hsv = [cv2.cvtColor(image, cv2.COLOR_BGR2HSV) for image in bgr]
+    return names, bgr, hsv
+
+
+def loadStore(directory):
+    """
+    The same as loadFrames, but only the names. The workers map the
+    frames out of the store themselves, see initWorker.
+    """
+    return FrameStore(directory).names, None, None
+
+
+def buildHsvStore(frameStore, directory):
+    """
+    Convert every frame of a frame store to HSV, once, into a new store in directory
+    """
+    store = FrameStore(frameStore)
+    hsv = ((name, timestamp, cv2.cvtColor(image, cv2.COLOR_BGR2HSV))
+           for name, timestamp, image in zip(store.names, store.timestamps, store))
+    return FrameStore.write(hsv, directory, store.pyrDownCount, store.reduced)
+
+
+def search(candidateRounds, bgr, hsv, frameLabels, tolerance, workers, costWeight, frameStore=None):
+    """
+    Evaluate each round of candidates in parallel. Each round is a
+    function of the best result so far that returns the candidates.
+    With a frameStore directory the frames are converted to HSV once into
+    a temporary store, and the workers map both stores instead of being
+    sent bgr and hsv.
+
+    Returns:
+        every result, best first
+    """
+    results = []
+    hsvStore = None
+    if frameStore:
+        bgr = hsv = None
+        hsvStore = tempfile.mkdtemp(prefix="hsv-frames-")
+        buildHsvStore(frameStore, hsvStore)
+    initArgs = (bgr, hsv, frameLabels, tolerance, frameStore, hsvStore)
+    try:
+        with multiprocessing.Pool(workers, initializer=initWorker, initargs=initArgs) as pool:
+            for makeCandidates in candidateRounds:
+                best = results[0] if results else None
+                candidates = makeCandidates(best)
+                results.extend(pool.imap_unordered(evaluate, candidates, chunksize=4))
+                results.sort(key=lambda r: score(r, costWeight), reverse=True)
+    finally:
+        if hsvStore is not None:
+            shutil.rmtree(hsvStore)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*", help="image directories, files or globs")
+    parser.add_argument("-o", "--output", default="tuned_config.json", help="where to write the best settings")
+    parser.add_argument("--labels", help="a JSON file of labels, see above")
+    parser.add_argument("--candidates", type=int, default=400, help="settings to try in each of the two rounds")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, all cores by default")
+    parser.add_argument("--cost-weight", type=float, default=0.01, help="accuracy given up per ms of processing")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="pixels a target can be off from a labeled center")
+    parser.add_argument("--pyrdown", type=int, default=1, help="times to pyrDown each image first")
+    parser.add_argument("--reduced", action="store_true", help="decode JPEGs at reduced size, see frame_loader.py")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--frames", help="a frame store from frame_store.py to read the frames from instead")
+    args = parser.parse_args()
+
+    if args.frames:
+        if args.inputs:
+            parser.error("--frames can't be used with inputs")
+        names, bgr, hsv = loadStore(args.frames)
+    else:
+        names, bgr, hsv = loadFrames(findImages(args.inputs), args.pyrdown, args.reduced)
+    if not names:
+        raise SystemExit("no images found")
+
+    allLabels = {}
+    if args.labels:
+        with open(args.labels) as f:
+            allLabels = json.load(f)
+    frameLabels = [allLabels.get(name, {"present": True}) for name in names]
+
+    random = np.random.RandomState(args.seed)
+    current = fromConfig(GripPipeline().get_config())
+
+    def explore(best):
+        return [current] + [randomParams(random) for _ in range(args.candidates - 1)]
+
+    def refine(best):
+        return [nearbyParams(best[0], random, 0.05) for _ in range(args.candidates)]
+
+    start = time.perf_counter()
+    results = search([explore, refine], bgr, hsv, frameLabels, args.tolerance, args.workers, args.cost_weight,
+                     args.frames)
+    elapsed = time.perf_counter() - start
+
+    print("%d frames, %d candidates in %.1f s\n" % (len(names), len(results), elapsed), file=sys.stderr)
+    print("%8s %9s %8s  %s" % ("score", "accuracy", "ms", "settings"))
+    for result in results[:5]:
+        params, accuracy, cost = result
+        print("%8.4f %9.3f %8.3f  %s" % (score(result, args.cost_weight), accuracy, cost,
+                                        json.dumps(toConfig(params))))
+    for result in results:
+        if result[0] == current:
+            print("%8.4f %9.3f %8.3f  (current settings)" % (score(result, args.cost_weight), result[1], result[2]))
+
+    best = GripPipeline()
+    best.set_config(toConfig(results[0][0]))
+    with open(args.output, "w") as f:
+        json.dump(best.get_config(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
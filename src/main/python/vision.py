@@ -0,0 +1,60 @@
+"""
+The vision code in one import
+
+    import vision
+    pipe = vision.GripPipeline(persistent=True)
+    pipe.poseEstimator = vision.PoseEstimator(vision.cameraMatrix(320, 240))
+
+Importing this doesn't import anything else. Each name is imported from
+the module it lives in the first time it's used, so a service that only
+needs the pipeline doesn't pay for the tools, and none of the modules
+do any work when they're imported. bench_import.py keeps track of how
+long the imports take.
+"""
+import importlib
+
+# name to the module it comes from
+EXPORTS = {
+    "GripPipeline": "BoudingRectangle",
+    "VisionTape": "BoudingRectangle",
+    "VisionTarget": "BoudingRectangle",
+    "DIRECTION": "BoudingRectangle",
+    "CONFIG_KEYS": "BoudingRectangle",
+    "PAIR_RANKINGS": "BoudingRectangle",
+    "ContourFeatures": "contour_features",
+    "LutThreshold": "lut_threshold",
+    "Pose": "pose",
+    "PoseEstimator": "pose",
+    "cameraMatrix": "pose",
+    "targetModel": "pose",
+    "PipelineMetrics": "instrumentation",
+    "PyramidDetector": "pyramid",
+    "TargetTracker": "tracking",
+    "FrameLoader": "frame_loader",
+    "decodeFrame": "frame_loader",
+    "FrameStore": "frame_store",
+    "CompiledPipeline": "grip_plan",
+    "gripConfig": "grip_plan",
+    "processCompiled": "grip_plan",
+    "StageCache": "stage_cache",
+    "processCached": "stage_cache",
+    "ResultPublisher": "publisher",
+    "ResultServer": "publisher",
+    "DebugStream": "debug_stream",
+}
+
+__all__ = sorted(EXPORTS)
+
+
+def __getattr__(name):
+    module = EXPORTS.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module(module), name)
+    # keep it, so this only happens once per name
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(EXPORTS))